@@ -1,10 +1,158 @@
 from __future__ import division
 import math, sys, copy
-import scipy
+import instrument
+import numerics
 
 nelo_divided_by_nt = 800 / math.log(10)  # 347.43558552260146
 
 
+def _MLE_poly(pdf, s):
+    """
+Coefficients (lowest degree first) of the polynomial obtained
+by clearing the denominators of the stationarity equation
+
+sum_i pi*(ai-s)/(1+x*(ai-s))=0
+
+in MLE. Its degree is N-1.
+"""
+    d = [a - s for a, p in pdf]
+    # P(x)=prod_i (1+x*(ai-s))
+    P = [1.0]
+    for di in d:
+        P = [c + di * c_ for c, c_ in zip(P + [0.0], [0.0] + P)]
+    N = len(pdf)
+    Q = N * [0.0]
+    for (a, p), di in zip(pdf, d):
+        # synthetic division of P by 1+x*di
+        r = 1.0
+        Q[0] += p * di
+        for k in range(1, N):
+            r = P[k] - di * r
+            Q[k] += p * di * r
+    return Q
+
+
+def _MLE_quadratic(Q, l, u):
+    c0, c1, c2 = Q
+    if c2 == 0:
+        roots = [-c0 / c1] if c1 != 0 else []
+    else:
+        disc = c1 * c1 - 4 * c0 * c2
+        if disc < 0:
+            return None
+        q = -(c1 + math.copysign(disc ** 0.5, c1)) / 2
+        roots = [q / c2, c0 / q] if q != 0 else [-c1 / (2 * c2)]
+    for x in roots:
+        if l < x < u:
+            return x
+    return None
+
+
+def _MLE_newton(Q, l, u):
+    """
+Q(l)>0>Q(u) and Q has a single root in (l,u). Newton steps
+which leave the current bracket are replaced by bisection.
+"""
+    lo, hi = l, u
+    x = 0.0
+    Q_ = Q[::-1]
+    for _ in range(100):
+        q, dq = 0.0, 0.0
+        for c in Q_:
+            dq = dq * x + q
+            q = q * x + c
+        if q == 0:
+            return x
+        elif q > 0:
+            lo = x
+        else:
+            hi = x
+        x_ = x - q / dq if dq != 0 else hi
+        if not lo < x_ < hi:
+            x_ = (lo + hi) / 2
+        if abs(x_ - x) <= 1e-14 * max(1, abs(x)):
+            return x_
+        x = x_
+    return None
+
+
+def _MLE_refine(pdf, s, l, u, x):
+    """
+Safeguarded Newton iteration on the stationarity equation itself,
+starting from an approximate solution x in (l,u).
+"""
+    lo, hi = l, u
+    for _ in range(100):
+        if instrument.enabled:
+            instrument.counters["LLRcalc.MLE.newton_steps"] += 1
+        f, fp = 0.0, 0.0
+        for a, p in pdf:
+            t = (a - s) / (1 + x * (a - s))
+            f += p * t
+            fp -= p * t * t
+        if f == 0:
+            return x
+        elif f > 0:
+            lo = x
+        else:
+            hi = x
+        x_ = x - f / fp
+        if not lo < x_ < hi:
+            x_ = (lo + hi) / 2
+        if abs(x_ - x) <= 1e-14 * max(1, abs(x)):
+            return x_
+        x = x_
+    return None
+
+
+def MLE_multiplier(pdf, s, x=None):
+    """
+Returns the Lagrange multiplier x of Proposition 1.1 in
+
+http://hardy.uhasselt.be/Fishtest/support_MLE_multinomial.pdf
+
+i.e. the unique solution in (l,u)=(-1/(aN-s),1/(s-a1)) of the
+stationarity equation. The optional argument x is a starting
+value (e.g. the solution of a nearby problem).
+
+For the 3 and 5 point distributions we use, the stationarity
+equation is equivalent to a quadratic, resp. quartic,
+polynomial equation which has exactly one root in (l,u).
+The quadratic is solved in closed form and the quartic
+by safeguarded Newton iteration on the polynomial. If a
+starting value is given we iterate directly on the
+stationarity equation instead. General distributions
+fall back to Brent's method.
+"""
+    epsilon = 1e-9
+    if instrument.enabled:
+        instrument.counters["LLRcalc.MLE.calls"] += 1
+    v, w = pdf[0][0], pdf[-1][0]
+    l, u = -1 / (w - s), 1 / (s - v)
+    if x is None or not l < x < u:
+        if len(pdf) == 3:
+            x = _MLE_quadratic(_MLE_poly(pdf, s), l, u)
+        elif len(pdf) == 5:
+            x = _MLE_newton(_MLE_poly(pdf, s), l, u)
+        else:
+            x = None
+    if x is not None:
+        # The polynomial is badly conditioned near the poles so we always
+        # finish on the original equation. From a good starting value
+        # this takes one or two steps.
+        x = _MLE_refine(pdf, s, l, u, x)
+    if x is None:
+        f = lambda x: sum([p * (a - s) / (1 + x * (a - s)) for a, p in pdf])
+        x, res = numerics.brentq(
+            f, l + epsilon, u - epsilon, full_output=True, disp=False
+        )
+        assert res.converged
+        if instrument.enabled:
+            instrument.counters["LLRcalc.MLE.brentq_calls"] += 1
+            instrument.counters["LLRcalc.MLE.brentq_iterations"] += res.iterations
+    return x
+
+
 def MLE(pdf, s):
     """
 This function computes the maximum likelood estimate for
@@ -22,15 +170,9 @@ http://hardy.uhasselt.be/Fishtest/support_MLE_multinomial.pdf
 (see Proposition 1.1).
 
 """
-    epsilon = 1e-9
     v, w = pdf[0][0], pdf[-1][0]
     assert v < s < w
-    l, u = -1 / (w - s), 1 / (s - v)
-    f = lambda x: sum([p * (a - s) / (1 + x * (a - s)) for a, p in pdf])
-    x, res = scipy.optimize.brentq(
-        f, l + epsilon, u - epsilon, full_output=True, disp=False
-    )
-    assert res.converged
+    x = MLE_multiplier(pdf, s)
     pdf_MLE = [(a, p / (1 + x * (a - s))) for a, p in pdf]
     s_, var = stats(pdf_MLE)  # for validation
     assert abs(s - s_) < 1e-6
@@ -186,10 +328,18 @@ http://hardy.uhasselt.be/Fishtest/normalized_elo_practical.pdf
 """
     count, pdf = results_to_pdf(results)
     mu, var = stats(pdf)
-    if len(results) == 5:
+    return LLR_normalized_stats(nelo0, nelo1, count, mu, var, len(results))
+
+
+def LLR_normalized_stats(nelo0, nelo1, count, mu, var, l):
+    """
+As LLR_normalized but starting from the (regularized) number
+of observations, their mean and variance. l is 3 or 5.
+"""
+    if l == 5:
         sigma_pg = (2 * var) ** 0.5
         games = 2 * count
-    elif len(results) == 3:
+    elif l == 3:
         sigma_pg = var ** 0.5
         games = count
     else:
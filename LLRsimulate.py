@@ -1,12 +1,16 @@
 from __future__ import division
-import sys, argparse
+import sys, os, math, time, json, argparse, random, collections
+import concurrent.futures
+import numpy as np
 
 import stats_pentanomial
 import SPRT_pentanomial
+import SPRT_vectorized
 import context
 import stats
 import sprta5
 import sprt
+import runstore
 
 
 def simulate(
@@ -18,12 +22,47 @@ def simulate(
     context=None,
     mode="pentanomial",
     elo_model="logistic",
+    rng=None,
 ):
     """
     We simulate the test H0:elo==elo0 versus H1:elo==elo1.
+    rng is a numpy random Generator.
+"""
+    return _simulate(
+        alpha=alpha,
+        beta=beta,
+        elo0=elo0,
+        elo1=elo1,
+        elo=elo,
+        context=context,
+        mode=mode,
+        elo_model=elo_model,
+        rng=rng,
+    )[:4]
+
+
+def _simulate(
+    alpha=0.05,
+    beta=0.05,
+    elo0=None,
+    elo1=None,
+    elo=None,
+    context=None,
+    mode="pentanomial",
+    elo_model="logistic",
+    rng=None,
+    tilt_elo=None,
+):
+    """
+    Like simulate() but the game pairs are drawn for tilt_elo (if it is
+    not None) instead of elo. The output has an extra entry: the log of
+    the likelihood ratio between elo and tilt_elo of the game pairs used
+    by the test (importance sampling).
 """
     assert mode in ("trinomial", "pentanomial")
     assert elo_model in ("logistic", "normalized")
+    if rng is None:
+        rng = np.random.default_rng()
     sp = SPRT_pentanomial.SPRT(
         alpha=alpha, beta=beta, elo0=elo0, elo1=elo1, mode=mode, elo_model=elo_model
     )
@@ -34,20 +73,626 @@ def simulate(
     )  # different convention from LLRcalc (var is already normalized in context.py)
     if elo_model == "normalized":
         elo = elo * (2 * sigma_pg)  # approximate conversion to nelo
+        if tilt_elo is not None:
+            tilt_elo = tilt_elo * (2 * sigma_pg)
+    log_weight = 0.0
+    if tilt_elo is not None:
+        log_ratio = np.log(context.pair_probs(elo)) - np.log(
+            context.pair_probs(tilt_elo)
+        )
+        elo = tilt_elo
+    # We draw the game pairs in blocks of increasing size. The SPRT
+    # locates the exact stopping point inside a block.
+    block = 64
+    pairs = 0
     while True:
-        i, j = context.pick(elo)
+        i, j = context.pick_many(elo, block, rng=rng)
         if mode == "trinomial":
-            sp.record(i)
+            sp.record_many(np.column_stack((i, j)).ravel())
         else:
-            sp.record(i + j)
+            sp.record_many(i + j)
         status = sp.status()
+        if tilt_elo is not None:
+            # Only the pairs before the stopping point count. In the
+            # trinomial case the last pair may be used partially, but the
+            # expectation of its ratio given the first game is the ratio
+            # of the first game, so counting it is still unbiased.
+            used = sum(sp.results())
+            if mode == "trinomial":
+                used = (used + 1) // 2
+            log_weight += float(log_ratio[i[: used - pairs], j[: used - pairs]].sum())
+            pairs = used
         if status != "":
-            return status, sp.length(), sp.LLR(), sp.results()
+            return status, sp.length(), sp.LLR(), sp.results(), log_weight
+        block = min(2 * block, 4096)
+
+
+def simulate_many(
+    n,
+    alpha=0.05,
+    beta=0.05,
+    elo0=None,
+    elo1=None,
+    elo=None,
+    context=None,
+    mode="pentanomial",
+    elo_model="logistic",
+    rng=None,
+):
+    """
+Vectorized version of simulate(). We run n independent tests
+side by side and return a list of n tuples (status, length, LLR, results).
+rng is a numpy random Generator.
+"""
+    return [
+        r[:4]
+        for r in _simulate_many(
+            n,
+            alpha=alpha,
+            beta=beta,
+            elo0=elo0,
+            elo1=elo1,
+            elo=elo,
+            context=context,
+            mode=mode,
+            elo_model=elo_model,
+            rng=rng,
+        )
+    ]
+
+
+def _simulate_many(
+    n,
+    alpha=0.05,
+    beta=0.05,
+    elo0=None,
+    elo1=None,
+    elo=None,
+    context=None,
+    mode="pentanomial",
+    elo_model="logistic",
+    rng=None,
+    tilt_elo=None,
+):
+    """
+Vectorized version of _simulate(). Every running test is advanced by
+a block of game pairs at a time, as in _simulate(), and
+SPRT_vectorized.SPRT.record_many() locates the stopping points.
+"""
+    assert mode in ("trinomial", "pentanomial")
+    assert elo_model in ("logistic", "normalized")
+    if rng is None:
+        rng = np.random.default_rng()
+    sp = SPRT_vectorized.SPRT(
+        n, alpha=alpha, beta=beta, elo0=elo0, elo1=elo1, mode=mode, elo_model=elo_model
+    )
+    stats_ = context.stats(0)
+    var = stats_["var3"] if mode == "trinomial" else stats_["var5"]
+    sigma_pg = var ** 0.5
+    if elo_model == "normalized":
+        elo = elo * (2 * sigma_pg)  # approximate conversion to nelo
+        if tilt_elo is not None:
+            tilt_elo = tilt_elo * (2 * sigma_pg)
+    log_weight = np.zeros(n)
+    if tilt_elo is not None:
+        log_ratio = np.log(context.pair_probs(elo)) - np.log(
+            context.pair_probs(tilt_elo)
+        )
+        elo = tilt_elo
+    out = n * [None]
+    ids = np.arange(n)
+    block = max(16, min(64, 2 ** 14 // max(n, 1)))
+    while len(ids) > 0:
+        m = len(ids)
+        i, j = context.pick_many(elo, m * block, rng=rng)
+        i, j = i.reshape(m, block), j.reshape(m, block)
         if mode == "trinomial":
-            sp.record(j)
-            status = sp.status()
-            if status != "":
-                return status, sp.length(), sp.LLR(), sp.results()
+            recorded = sp.record_many(np.stack((i, j), axis=2).reshape(m, 2 * block))
+            used = (recorded + 1) // 2  # see _simulate()
+        else:
+            recorded = sp.record_many(i + j)
+            used = recorded
+        if tilt_elo is not None:
+            partial = np.cumsum(log_ratio[i, j], axis=1)
+            log_weight[ids] += partial[np.arange(m), used - 1]
+        status = sp.status()
+        finished = status != 0
+        if finished.any():
+            length = sp.length()
+            LLR = sp.LLR()
+            results = sp.results()
+            for t in np.flatnonzero(finished):
+                out[ids[t]] = (
+                    "H1" if status[t] == 1 else "H0",
+                    float(length[t]),
+                    float(LLR[t]),
+                    results[t].tolist(),
+                    float(log_weight[ids[t]]),
+                )
+            # retire the finished tests
+            sp.select(~finished)
+            ids = ids[~finished]
+        # The blocks grow as in _simulate(), but their total size is kept
+        # small: the temporary arrays should stay in the cache.
+        block = max(16, min(2 * block, 4096, 2 ** 14 // max(len(ids), 1)))
+    return out
+
+
+def _analyze(
+    status, length, LLR, results, log_weight, alpha, beta, elo0, elo1, elo_model
+):
+    """
+Adds the elo estimate of sprt and the weight to the output of _simulate(),
+see run().
+"""
+    sp_elo = sprt.sprt(
+        alpha=alpha, beta=beta, elo0=elo0, elo1=elo1, elo_model=elo_model
+    )
+    sp_elo.set_state(results)
+    a = sp_elo.analytics(fields=("elo", "ci"))
+    elo_sprt_l = sp_elo.lelo_to_elo(a["ci"][0])
+    elo_sprt = sp_elo.lelo_to_elo(a["elo"])
+    elo_sprt_u = sp_elo.lelo_to_elo(a["ci"][1])
+    weight = math.exp(log_weight)
+    return status, length, LLR, results, elo_sprt_l, elo_sprt, elo_sprt_u, weight
+
+
+def run(
+    alpha=0.05,
+    beta=0.05,
+    elo0=None,
+    elo1=None,
+    elo=None,
+    context=None,
+    mode="pentanomial",
+    elo_model="logistic",
+    rng=None,
+    tilt_elo=None,
+):
+    """
+    Simulates a test and analyzes the outcome with sprt. Returns a
+    tuple (status, length, LLR, results, elo_l, elo, elo_u, weight) where
+    [elo_l, elo_u] is the confidence interval for the elo estimate
+    (expressed in elo_model).
+    If tilt_elo is not None the test is simulated for tilt_elo and
+    weight is the importance sampling weight of the run for elo (the
+    likelihood ratio). Otherwise weight is 1.
+"""
+    r = _simulate(
+        alpha=alpha,
+        beta=beta,
+        elo0=elo0,
+        elo1=elo1,
+        elo=elo,
+        context=context,
+        mode=mode,
+        elo_model=elo_model,
+        rng=rng,
+        tilt_elo=tilt_elo,
+    )
+    return _analyze(*r, alpha, beta, elo0, elo1, elo_model)
+
+
+def run_many(
+    n,
+    alpha=0.05,
+    beta=0.05,
+    elo0=None,
+    elo1=None,
+    elo=None,
+    context=None,
+    mode="pentanomial",
+    elo_model="logistic",
+    rng=None,
+    tilt_elo=None,
+):
+    """
+Vectorized version of run(). Returns a list of n outputs of run().
+"""
+    runs = _simulate_many(
+        n,
+        alpha=alpha,
+        beta=beta,
+        elo0=elo0,
+        elo1=elo1,
+        elo=elo,
+        context=context,
+        mode=mode,
+        elo_model=elo_model,
+        rng=rng,
+        tilt_elo=tilt_elo,
+    )
+    return [_analyze(*r, alpha, beta, elo0, elo1, elo_model) for r in runs]
+
+
+def chunk_rng(seed, chunk):
+    """
+    An independent random number generator for every chunk of
+    simulations, derived from a global seed (anything accepted by
+    numpy.random.SeedSequence).
+"""
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(chunk,)))
+
+
+def run_chunk(seed, chunk, size, context=None, vectorized=False, **kwargs):
+    """
+    Runs a chunk of simulations with run(), or side by side with
+    run_many() if vectorized is true (the output then differs since the
+    random numbers are used in a different order).
+"""
+    rng = chunk_rng(seed, chunk)
+    if vectorized:
+        return run_many(size, context=context, rng=rng, **kwargs)
+    return [run(context=context, rng=rng, **kwargs) for _ in range(size)]
+
+
+# The accumulators for the output of run(), see summarize().
+summary_fields = (
+    "pass",
+    "length",
+    "LLR_H0",
+    "LLR_H1",
+    "elo_l",
+    "elo",
+    "elo_u",
+    "weight",
+)
+
+
+def summarize(runs, elo):
+    """
+A dictionary of stats.stats accumulators summarizing a list of outputs
+of run() for tests with the given actual elo.
+
+With importance sampling the expectations (pass probability, length,
+coverage) are estimated by the plain means of weight*value, so their
+confidence intervals are the usual ones. The conditional means of the
+LLR are estimated by weighted means. The mean of the weights should
+be close to 1.
+"""
+    summary = dict([(name, stats.stats()) for name in summary_fields])
+    if len(runs) == 0:
+        return summary
+    status, length, LLR, results, elo_l, elo_sprt, elo_u, weight = zip(*runs)
+    passed = np.array(status) == "H1"
+    LLR = np.array(LLR)
+    w = np.array(weight)
+    unit = bool((w == 1).all())
+    summary["pass"].add_many(w * passed)
+    summary["length"].add_many(w * np.array(length))
+    summary["LLR_H0"].add_many(LLR[~passed], None if unit else w[~passed])
+    summary["LLR_H1"].add_many(LLR[passed], None if unit else w[passed])
+    summary["elo_l"].add_many(w * (elo <= np.array(elo_l)))
+    summary["elo"].add_many(w * (elo <= np.array(elo_sprt)))
+    summary["elo_u"].add_many(w * (elo <= np.array(elo_u)))
+    summary["weight"].add_many(w)
+    return summary
+
+
+def summarize_chunk(seed, chunk, size, context=None, keep_runs=False, **kwargs):
+    """
+Runs a chunk of simulations. Returns a pair (runs, summary) where
+summary maps the names in summary_fields to the states of the
+accumulators (see stats.get_state()), which are much smaller than the
+runs themselves. runs is None unless keep_runs is true.
+"""
+    runs = run_chunk(seed, chunk, size, context=context, **kwargs)
+    summary = summarize(runs, kwargs["elo"])
+    summary = dict([(name, s.get_state()) for name, s in summary.items()])
+    return (runs if keep_runs else None), summary
+
+
+def merged(totals, summary):
+    """
+A new dictionary of accumulators with the samples of totals and those
+of summary, which maps (some of) the names in summary_fields to
+accumulator states (see summarize_chunk()). totals is not modified.
+"""
+    ret = {}
+    for name in summary_fields:
+        ret[name] = stats.stats()
+        ret[name].set_state(totals[name].get_state())
+        if name in summary:
+            s = stats.stats()
+            s.set_state(summary[name])
+            ret[name].merge(s)
+    return ret
+
+
+_worker_context = None
+
+
+def _init_worker(draw_elo, biases, book=None):
+    global _worker_context
+    weights = None
+    if book is not None:
+        # every worker maps the file, so the book is shared
+        biases, weights = context.load_book(book)
+    _worker_context = context.context(draw_elo, biases, weights)
+
+
+def _summarize_chunk(seed, chunk, size, keep_runs, kwargs):
+    return summarize_chunk(
+        seed, chunk, size, context=_worker_context, keep_runs=keep_runs, **kwargs
+    )
+
+
+def chunks_serial(seed, chunk_size, context, keep_runs=False, first_chunk=0, **kwargs):
+    """
+    Generator yielding the output of summarize_chunk() for consecutive
+    chunks, starting with first_chunk. The output is the same as that of
+    chunks_parallel().
+"""
+    chunk = first_chunk
+    while True:
+        yield summarize_chunk(
+            seed, chunk, chunk_size, context=context, keep_runs=keep_runs, **kwargs
+        )
+        chunk += 1
+
+
+def chunks_parallel(
+    seed,
+    workers,
+    chunk_size,
+    draw_elo,
+    biases,
+    book=None,
+    keep_runs=False,
+    first_chunk=0,
+    **kwargs
+):
+    """
+    Generator yielding the output of summarize_chunk() computed by a pool
+    of worker processes. Every chunk has its own random number generator
+    derived from the seed, and the chunks are yielded in order. So the
+    output only depends on the seed and the chunk size (and not on the
+    number of workers).
+    If book is the path of a file with biases (see context.load_book())
+    then it is used instead of biases.
+"""
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(draw_elo, biases, book)
+    ) as executor:
+        pending = collections.deque()
+        chunk = first_chunk
+        try:
+            while True:
+                while len(pending) < 2 * workers:
+                    pending.append(
+                        executor.submit(
+                            _summarize_chunk, seed, chunk, chunk_size, keep_runs, kwargs
+                        )
+                    )
+                    chunk += 1
+                yield pending.popleft().result()
+        finally:
+            # do not wait for chunks which nobody will use
+            for f in pending:
+                f.cancel()
+
+
+def half_widths(totals):
+    """
+The half widths of the confidence intervals for the pass probability
+and the expected length. For the pass probability we use (k+1)/(n+2)
+instead of the observed frequency k/n, so that a point which has not
+produced a pass (or a fail) yet is not considered to be known exactly.
+With importance sampling the samples are weight*passed, which are not
+binomial, so we use the confidence interval of their mean (see
+summarize()).
+"""
+    n = totals["pass"].n
+    if n < 2:
+        return float("inf"), float("inf")
+    if totals["weight"].M2 > 0:  # importance sampling, as in report()
+        p = totals["pass"].ci_mean()
+        pass_hw = (p[2] - p[0]) / 2
+    else:
+        p = (totals["pass"].mean * n + 1) / (n + 2)
+        pass_hw = 1.96 * (p * (1 - p) / n) ** 0.5
+    l = totals["length"].ci_mean()
+    return pass_hw, (l[2] - l[0]) / 2
+
+
+def precision_chunks(
+    seed,
+    elos,
+    pass_width=None,
+    length_width=None,
+    chunk_size=10,
+    context=None,
+    executor=None,
+    window=1,
+    min_chunks=2,
+    **kwargs
+):
+    """
+    Simulates tests for every elo in the list elos until the half widths
+    of the confidence intervals for the pass probability and the
+    expected length (see half_widths()) are at most pass_width and
+    length_width (None means no target).
+
+    After min_chunks chunks for every elo, the next chunk always goes to
+    the elo whose confidence intervals are widest relative to the
+    targets, so that the total number of simulations stays small.
+
+    This is a generator yielding (i, totals) after every chunk, where i
+    is the index of the elo of the chunk and totals is a list with a
+    dictionary of accumulators (see summarize()) for every elo.
+    If executor is a pool of processes initialized with _init_worker()
+    then up to window chunks are simulated concurrently.
+"""
+    targets = (pass_width, length_width)
+    totals = [dict([(name, stats.stats()) for name in summary_fields]) for _ in elos]
+    submitted = [0] * len(elos)
+    finished = [0] * len(elos)
+
+    def ratio(i):
+        if finished[i] == 0:
+            return 0  # wait for the first results
+        r = max(
+            [hw / t for hw, t in zip(half_widths(totals[i]), targets) if t is not None]
+            + [0]
+        )
+        # account for the chunks which are still being simulated
+        return r * (finished[i] / submitted[i]) ** 0.5
+
+    def next_elo():
+        for i in range(len(elos)):
+            if submitted[i] < min_chunks:
+                return i
+        r, i = max([(ratio(i), i) for i in range(len(elos))])
+        return i if r > 1 else None
+
+    pending = collections.deque()
+    while True:
+        while len(pending) < window:
+            i = next_elo()
+            if i is None:
+                break
+            # every elo has its own stream of random numbers
+            args = ([seed, i], submitted[i], chunk_size)
+            kwargs_ = dict(kwargs, elo=elos[i])
+            if executor is None:
+                pending.append((i, summarize_chunk(*args, context=context, **kwargs_)))
+            else:
+                future = executor.submit(_summarize_chunk, *args, False, kwargs_)
+                pending.append((i, future))
+            submitted[i] += 1
+        if len(pending) == 0:
+            return
+        i, summary = pending.popleft()
+        if executor is not None:
+            summary = summary.result()
+        for name, state in summary[1].items():
+            s = stats.stats()
+            s.set_state(state)
+            totals[i][name].merge(s)
+        finished[i] += 1
+        yield i, totals
+
+
+def save_checkpoint(path, checkpoint):
+    """
+Writes the dictionary checkpoint as JSON. The file is replaced
+atomically, so an interruption leaves either the old or the new
+checkpoint.
+"""
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def load_checkpoint(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def report(totals):
+    """
+The line of output describing the accumulators in totals.
+"""
+    pass_ = totals["pass"].ci_mean()
+    l = totals["length"].ci_mean()
+    LLR0 = totals["LLR_H0"].ci_mean()
+    LLR1 = totals["LLR_H1"].ci_mean()
+    elo_l_ci = totals["elo_l"].ci_mean()
+    elo_ci = totals["elo"].ci_mean()
+    elo_u_ci = totals["elo_u"].ci_mean()
+    ret = (
+        "n=%d pass=%.4f[%.4f,%.4f] length=%.1f[%.1f,%.1f]"
+        + " LLR0=%.3f LLR1=%.3f l=%.4f[%.4f,%.4f]"
+        + " m=%.4f[%.4f,%.4f] u=%.4f[%.4f,%.4f]"
+    ) % (
+        totals["pass"].n,
+        pass_[1],
+        pass_[0],
+        pass_[2],
+        l[1],
+        l[0],
+        l[2],
+        LLR0[1],
+        LLR1[1],
+        elo_l_ci[1],
+        elo_l_ci[0],
+        elo_l_ci[2],
+        elo_ci[1],
+        elo_ci[0],
+        elo_ci[2],
+        elo_u_ci[1],
+        elo_u_ci[0],
+        elo_u_ci[2],
+    )
+    if totals["weight"].M2 > 0:  # importance sampling
+        weight = totals["weight"].ci_mean()
+        ret += " weight=%.4f[%.4f,%.4f]" % (weight[1], weight[0], weight[2])
+    return ret
+
+
+def precision_main(
+    seed,
+    elos,
+    pass_width,
+    length_width,
+    chunk_size,
+    context,
+    workers,
+    draw_elo,
+    biases,
+    book,
+    report_interval,
+    report_every,
+    **kwargs
+):
+    """
+The driver for --pass_width/--length_width. It prints (throttled)
+progress lines and finally the results for every elo.
+"""
+    last_report, last_n = time.time(), 0
+    executor = None
+    if workers > 0:
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(draw_elo, biases, book),
+        )
+    try:
+        for i, totals in precision_chunks(
+            seed,
+            elos,
+            pass_width=pass_width,
+            length_width=length_width,
+            chunk_size=chunk_size,
+            context=context,
+            executor=executor,
+            window=max(1, 2 * workers),
+            **kwargs
+        ):
+            now = time.time()
+            n = sum([t["pass"].n for t in totals])
+            if now - last_report >= report_interval and n - last_n >= report_every:
+                print("elo=%.2f %s" % (elos[i], report(totals[i])))
+                sys.stdout.flush()
+                last_report, last_n = now, n
+    finally:
+        if executor is not None:
+            if sys.version_info >= (3, 9):
+                executor.shutdown(cancel_futures=True)
+            else:
+                # cancel_futures is not available, the queued chunks
+                # are simulated before we exit
+                executor.shutdown()
+    print("")
+    print("total        : n=%d" % sum([t["pass"].n for t in totals]))
+    for elo, t in zip(elos, totals):
+        pass_hw, length_hw = half_widths(t)
+        print(
+            "elo=%.2f %s (half widths %.4f %.1f)" % (elo, report(t), pass_hw, length_hw)
+        )
 
 
 if __name__ == "__main__":
@@ -75,13 +720,24 @@ if __name__ == "__main__":
         nargs="+",
         default=default_biases,
     )
+    parser.add_argument(
+        "--book",
+        help="file with the biases (and optionally weights), see context.load_book()",
+        default=None,
+    )
     parser.add_argument(
         "--mode",
         help="'trinomial' or 'pentanomial'",
         choices=["trinomial", "pentanomial"],
         default="pentanomial",
     )
-    parser.add_argument("--elo", help="actual elo", type=float, required=True)
+    parser.add_argument(
+        "--elo",
+        help="actual elo (several values are allowed with --pass_width or --length_width)",
+        type=float,
+        nargs="+",
+        required=True,
+    )
     parser.add_argument(
         "--elo_model",
         help="logistic or normalized",
@@ -89,18 +745,141 @@ if __name__ == "__main__":
         choices=("logistic", "normalized"),
     )
     parser.add_argument("--verbose", "-v", help="verbose", action="store_true")
+    parser.add_argument(
+        "--per_test",
+        help="print the running results after every test instead of after every chunk",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--workers",
+        help="number of worker processes (0: simulate in the main process)",
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "--seed",
+        help="seed for the random number generators (default: random)",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--chunk_size",
+        help="number of simulations per task for the worker processes",
+        type=int,
+        default=10,
+    )
+    parser.add_argument(
+        "--vectorized",
+        help="simulate the tests of a chunk side by side (faster with large chunks, e.g. --chunk_size 1000)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        help="file in which the state of the simulation is saved periodically",
+        default=None,
+    )
+    parser.add_argument(
+        "--checkpoint_interval",
+        help="seconds between checkpoints",
+        type=float,
+        default=60,
+    )
+    parser.add_argument(
+        "--resume",
+        help="continue the simulation saved in the checkpoint file",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--report_interval",
+        help="minimal number of seconds between two reports",
+        type=float,
+        default=0,
+    )
+    parser.add_argument(
+        "--report_every",
+        help="minimal number of simulations between two reports",
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "--tilt_elo",
+        help="simulate the tests for this elo and reweight them (importance sampling, e.g. elo1 for estimating the pass probability at elo0)",
+        type=float,
+        default=None,
+    )
+    parser.add_argument(
+        "--pass_width",
+        help="stop when the half width of the confidence interval for the pass probability is at most this (for every elo)",
+        type=float,
+        default=None,
+    )
+    parser.add_argument(
+        "--length_width",
+        help="stop when the half width of the confidence interval for the expected length is at most this (for every elo)",
+        type=float,
+        default=None,
+    )
+    parser.add_argument(
+        "--store",
+        help="directory of a run store (see runstore.py) to which every run is appended",
+        default=None,
+    )
     args = parser.parse_args()
     alpha = args.alpha
     beta = args.beta
     elo0 = args.elo0
     elo1 = args.elo1
-    elo = args.elo
+    elos = args.elo
+    elo = elos[0]
+    precision = args.pass_width is not None or args.length_width is not None
+    if len(elos) > 1 and not precision:
+        parser.error("several values of --elo require --pass_width or --length_width")
+    if precision and args.checkpoint is not None:
+        parser.error("--checkpoint cannot be combined with --pass_width/--length_width")
+    if precision and args.store is not None:
+        parser.error("--store cannot be combined with --pass_width/--length_width")
+    if precision and args.per_test:
+        parser.error("--per_test cannot be combined with --pass_width/--length_width")
     mode = args.mode
     draw_elo = args.draw_elo
     biases = args.biases
     elo_model = args.elo_model
     verbose = args.verbose
-    c = context.context(draw_elo, biases)
+    workers = args.workers
+    seed = args.seed
+    # everything that determines the simulations, except the seed
+    params = dict(
+        alpha=alpha,
+        beta=beta,
+        elo0=elo0,
+        elo1=elo1,
+        elo=elo,
+        mode=mode,
+        elo_model=elo_model,
+        tilt_elo=args.tilt_elo,
+        draw_elo=draw_elo,
+        biases=biases,
+        book=args.book,
+        chunk_size=args.chunk_size,
+        vectorized=args.vectorized,
+    )
+    checkpoint = None
+    if args.resume:
+        if args.checkpoint is None:
+            parser.error("--resume requires --checkpoint")
+        checkpoint = load_checkpoint(args.checkpoint)
+        for k, v in params.items():
+            if checkpoint["params"][k] != v:
+                parser.error("--%s does not match the checkpoint" % k)
+        if seed is not None and seed != checkpoint["seed"]:
+            parser.error("--seed does not match the checkpoint")
+        seed = checkpoint["seed"]
+    if seed is None:
+        seed = random.SystemRandom().getrandbits(64)
+    weights = None
+    if args.book is not None:
+        biases, weights = context.load_book(args.book)
+    c = context.context(draw_elo, biases, weights)
     sp = sprta5.SPRT(
         alpha=alpha,
         beta=beta,
@@ -110,91 +889,186 @@ if __name__ == "__main__":
         mode=mode,
         elo_model=elo_model,
     )
-    pass_prob, expected_length = sp.characteristics(elo)
     print("elo0         : %.2f" % elo0)
     print("elo1         : %.2f" % elo1)
-    print("elo          : %.2f" % elo)
+    if not precision:
+        pass_prob, expected_length = sp.characteristics(elo)
+        print("elo          : %.2f" % elo)
     print("draw_elo     : %.2f" % draw_elo)
-    print("biases (be)  : %s" % (str(biases)))
+    if args.book is not None:
+        print("book         : %s (%d biases)" % (args.book, len(biases)))
+    else:
+        print("biases (be)  : %s" % (str(biases)))
     print("elo_model    : %s" % elo_model)
-    print("pass_prob    : %.3f" % pass_prob)
-    print("expected     : %.0f" % expected_length)
+    if args.tilt_elo is not None:
+        print("tilt_elo     : %.2f" % args.tilt_elo)
+    if not precision:
+        print("pass_prob    : %.3f" % pass_prob)
+        print("expected     : %.0f" % expected_length)
+    else:
+        print("pass_width   : %s" % args.pass_width)
+        print("length_width : %s" % args.length_width)
+        for elo_ in elos:
+            print(
+                "%-13s: pass_prob=%.3f expected=%.0f"
+                % (("elo=%.2f" % elo_,) + sp.characteristics(elo_))
+            )
+    print("seed         : %d" % seed)
+    totals = dict([(name, stats.stats()) for name in summary_fields])
+    first_chunk = 0
+    if checkpoint is not None:
+        for name in summary_fields:
+            totals[name].set_state(checkpoint["totals"][name])
+        first_chunk = checkpoint["chunks"]
+        print("resumed at   : n=%d" % totals["pass"].n)
+    store = None
+    if args.store is not None:
+        store = runstore.runstore(
+            args.store, "a", width=5 if mode == "pentanomial" else 3
+        )
+        if store.meta["width"] != (5 if mode == "pentanomial" else 3):
+            parser.error("--store contains runs of a different mode")
+        if checkpoint is not None and "store" in checkpoint:
+            # forget the runs after the checkpoint, they will be redone
+            store.truncate(checkpoint["store"])
+        print("store        : %s (%d runs)" % (args.store, len(store)))
     print("")
-    s_pass = stats.stats()
-    s_length = stats.stats()
-    s_LLR_H0 = stats.stats()
-    s_LLR_H1 = stats.stats()
-    s_elo_l = stats.stats()
-    s_elo = stats.stats()
-    s_elo_u = stats.stats()
-    n = 0
-    while True:
-        n += 1
-        status, length, LLR, results = simulate(
-            alpha=alpha,
-            beta=beta,
-            elo0=elo0,
-            elo1=elo1,
-            elo=elo,
-            context=c,
-            mode=mode,
-            elo_model=elo_model,
+    kwargs = dict(
+        alpha=alpha,
+        beta=beta,
+        elo0=elo0,
+        elo1=elo1,
+        elo=elo,
+        mode=mode,
+        elo_model=elo_model,
+        tilt_elo=args.tilt_elo,
+        vectorized=args.vectorized,
+    )
+    if precision:
+        precision_main(
+            seed,
+            elos,
+            args.pass_width,
+            args.length_width,
+            args.chunk_size,
+            c,
+            workers,
+            draw_elo,
+            args.biases,
+            args.book,
+            args.report_interval,
+            args.report_every,
+            **kwargs
         )
-        sp_elo = sprt.sprt(
-            alpha=alpha, beta=beta, elo0=elo0, elo1=elo1, elo_model=elo_model
+        sys.exit(0)
+    # The workers send summaries of their chunks, unless we need
+    # the individual runs for verbose output or for the store.
+    keep_runs = verbose or args.per_test or store is not None
+    if workers > 0:
+        chunks = chunks_parallel(
+            seed,
+            workers,
+            args.chunk_size,
+            draw_elo,
+            args.biases,
+            args.book,
+            keep_runs=keep_runs,
+            first_chunk=first_chunk,
+            **kwargs
         )
-        sp_elo.set_state(results)
-        elo_sprt_l = sp_elo.lelo_to_elo(sp_elo.analytics()["ci"][0])
-        elo_sprt = sp_elo.lelo_to_elo(sp_elo.analytics()["elo"])
-        elo_sprt_u = sp_elo.lelo_to_elo(sp_elo.analytics()["ci"][1])
-        if verbose:
-            print(
-                "**** status=%s length=%d LLR=%.3f elo=%.3f[%.3f,%.3f] results=%s"
-                % (status, length, LLR, elo_sprt, elo_sprt_l, elo_sprt_u, str(results))
-            )
-        s_elo_l.add(elo <= elo_sprt_l)
-        s_elo.add(elo <= elo_sprt)
-        s_elo_u.add(elo <= elo_sprt_u)
-        s_length.add(length)
-        if status == "H1":
-            s_pass.add(1.0)
-            s_LLR_H1.add(LLR)
-        else:
-            s_pass.add(0.0)
-            s_LLR_H0.add(LLR)
-        pass_ = s_pass.ci_mean()
-        l = s_length.ci_mean()
-        LLR0 = s_LLR_H0.ci_mean()
-        LLR1 = s_LLR_H1.ci_mean()
-        elo_l_ci = s_elo_l.ci_mean()
-        elo_ci = s_elo.ci_mean()
-        elo_u_ci = s_elo_u.ci_mean()
-        print(
-            (
-                "n=%d pass=%.4f[%.4f,%.4f] length=%.1f[%.1f,%.1f]"
-                + " LLR0=%.3f LLR1=%.3f l=%.4f[%.4f,%.4f]"
-                + " m=%.4f[%.4f,%.4f] u=%.4f[%.4f,%.4f]"
-            )
-            % (
-                n,
-                pass_[1],
-                pass_[0],
-                pass_[2],
-                l[1],
-                l[0],
-                l[2],
-                LLR0[1],
-                LLR1[1],
-                elo_l_ci[1],
-                elo_l_ci[0],
-                elo_l_ci[2],
-                elo_ci[1],
-                elo_ci[0],
-                elo_ci[2],
-                elo_u_ci[1],
-                elo_u_ci[0],
-                elo_u_ci[2],
-            )
+    else:
+        chunks = chunks_serial(
+            seed,
+            args.chunk_size,
+            c,
+            keep_runs=keep_runs,
+            first_chunk=first_chunk,
+            **kwargs
         )
 
-        sys.stdout.flush()
+    # The state of the simulation after the last completed chunk: the
+    # totals, the number of the next chunk and the number of runs in the
+    # store. It is replaced by a single assignment, so an interruption
+    # leaves either the old or the new state, and never totals which do
+    # not match the chunk count.
+    progress = (totals, first_chunk, len(store) if store is not None else 0)
+
+    def checkpoint_():
+        # The random number generator of a chunk is determined by the
+        # seed and the number of the chunk, so this is all we need.
+        totals, chunk, stored = progress
+        checkpoint = {
+            "params": params,
+            "seed": seed,
+            "chunks": chunk,
+            "totals": dict(
+                [(name, totals[name].get_state()) for name in summary_fields]
+            ),
+        }
+        if store is not None:
+            # runs after "stored" are forgotten when resuming
+            store.flush()
+            checkpoint["store"] = stored
+        save_checkpoint(args.checkpoint, checkpoint)
+
+    last_checkpoint = last_report = time.time()
+    last_n = totals["pass"].n
+    try:
+        for runs, summary in chunks:
+            totals, chunk, stored = progress
+            if verbose or args.per_test:
+                partial = totals
+                for r in runs:
+                    status, length, LLR, results, elo_l, elo_, elo_u, w = r
+                    if verbose:
+                        print(
+                            "**** status=%s length=%d LLR=%.3f elo=%.3f[%.3f,%.3f] results=%s%s"
+                            % (
+                                status,
+                                length,
+                                LLR,
+                                elo_,
+                                elo_l,
+                                elo_u,
+                                str(results),
+                                "" if w == 1 else " weight=%.4g" % w,
+                            )
+                        )
+                    if args.per_test:
+                        summary_ = summarize([r], elo)
+                        partial = merged(
+                            partial,
+                            dict([(k, v.get_state()) for k, v in summary_.items()]),
+                        )
+                        print(report(partial))
+            if store is not None:
+                store.append(runs, elo)
+                stored += len(runs)
+            progress = (merged(totals, summary), chunk + 1, stored)
+            totals = progress[0]
+            now = time.time()
+            n = totals["pass"].n
+            if args.per_test:
+                sys.stdout.flush()
+            elif (
+                verbose
+                or now - last_report >= args.report_interval
+                and n - last_n >= args.report_every
+            ):
+                print(report(totals))
+                sys.stdout.flush()
+                last_report, last_n = now, n
+            if args.checkpoint is not None:
+                if now - last_checkpoint >= args.checkpoint_interval:
+                    checkpoint_()
+                    last_checkpoint = now
+    except KeyboardInterrupt:
+        chunks.close()
+        if args.checkpoint is not None:
+            checkpoint_()
+        if store is not None:
+            # drop the runs of an unfinished chunk
+            store.flush()
+            store.truncate(progress[2])
+            store.close()
+        print(report(progress[0]))
@@ -1,6 +1,8 @@
 from __future__ import division
 import math
+import numpy as np
 import LLRcalc
+import SPRT_vectorized
 
 
 class SPRT:
@@ -15,6 +17,12 @@ class SPRT:
 
     To record the outcome of a game pair use the method record(result)  
     where "result" is a half integer in the interval [0,2]
+
+    To record a sequence of outcomes use record_many(results). This
+    is equivalent to calling record() for each of them, but the LLRs
+    of all intermediate states are computed in one vectorized pass.
+
+    To add a batch of frequencies at once use add_results(delta).
 """
 
     def __init__(
@@ -46,14 +54,78 @@ class SPRT:
         self.o1 = 0.0
         self.elo_model = elo_model
 
+        # Solver state. We keep the regularized frequencies and their
+        # first moments up to date, as well as the Lagrange multipliers
+        # of the last MLE computations, which are excellent starting
+        # values after a single frequency has changed.
+        # The results are the same as those of LLRcalc.LLR_logistic
+        # and LLRcalc.LLR_normalized.
+        l = len(self.results_)
+        self.values_ = [i / (l - 1) for i in range(0, l)]
+        self.reg_ = LLRcalc.regularize(self.results_)
+        self.N_ = sum(self.reg_)
+        self.S1_ = sum([r * a for r, a in zip(self.reg_, self.values_)])
+        self.S2_ = sum([r * a * a for r, a in zip(self.reg_, self.values_)])
+        self.s0, self.s1 = [LLRcalc.L_(elo) for elo in (elo0, elo1)]
+        self.x0 = None
+        self.x1 = None
+
+    def _LLR_logistic(self):
+        N = self.N_
+        pdf = [(a, r / N) for a, r in zip(self.values_, self.reg_)]
+        s0, s1 = self.s0, self.s1
+        self.x0 = x0 = LLRcalc.MLE_multiplier(pdf, s0, self.x0)
+        self.x1 = x1 = LLRcalc.MLE_multiplier(pdf, s1, self.x1)
+        return sum(
+            [
+                r * (math.log(1 + x0 * (a - s0)) - math.log(1 + x1 * (a - s1)))
+                for a, r in zip(self.values_, self.reg_)
+            ]
+        )
+
+    def _LLR_normalized(self):
+        N = self.N_
+        mu = self.S1_ / N
+        var = self.S2_ / N - mu * mu
+        return LLRcalc.LLR_normalized_stats(
+            self.elo0, self.elo1, N, mu, var, len(self.results_)
+        )
+
     def record(self, result):
         if self.status_ != "":
             return
         self.results_[result] += 1
+        delta = self.results_[result] - self.reg_[result]
+        self.reg_[result] = self.results_[result]
+        a = self.values_[result]
+        self.N_ += delta
+        self.S1_ += delta * a
+        self.S2_ += delta * a * a
+        self._update()
+
+    def add_results(self, delta):
+        """
+Adds the frequencies in "delta" (a list of the same length as results())
+in one go, as happens when a worker reports a batch of game pairs for
+a live test. The LLR and the overshoot correction are updated once.
+Returns False (and ignores delta) if the test has already finished.
+"""
+        if self.status_ != "":
+            return False
+        assert len(delta) == len(self.results_)
+        self.results_ = [r + d for r, d in zip(self.results_, delta)]
+        self.reg_ = LLRcalc.regularize(self.results_)
+        self.N_ = sum(self.reg_)
+        self.S1_ = sum([r * a for r, a in zip(self.reg_, self.values_)])
+        self.S2_ = sum([r * a * a for r, a in zip(self.reg_, self.values_)])
+        self._update()
+        return True
+
+    def _update(self):
         if self.elo_model == "logistic":
-            self.LLR_ = LLRcalc.LLR_logistic(self.elo0, self.elo1, self.results_)
+            self.LLR_ = self._LLR_logistic()
         else:
-            self.LLR_ = LLRcalc.LLR_normalized(self.elo0, self.elo1, self.results_)
+            self.LLR_ = self._LLR_normalized()
 
         # Dynamic overshoot correction using
         # Siegmund - Sequential Analysis - Corollary 8.33.
@@ -71,6 +143,71 @@ class SPRT:
         elif self.LLR_ < self.LA + self.o0:
             self.status_ = "H0"
 
+    def record_many(self, results):
+        """
+Returns the number of results that were actually recorded (if the test
+finishes early the remaining ones are ignored).
+"""
+        if self.status_ != "":
+            return 0
+        results = np.asarray(results)
+        m = len(results)
+        if m == 0:
+            return 0
+        l = len(self.results_)
+        # the frequencies after each record, shape (l,m)
+        counts = np.array(self.results_)[:, None] + np.cumsum(
+            np.arange(l)[:, None] == results, axis=1
+        )
+        reg = SPRT_vectorized.regularize(counts)
+        if self.elo_model == "logistic":
+            x0 = np.full(m, 0.0 if self.x0 is None else self.x0)
+            x1 = np.full(m, 0.0 if self.x1 is None else self.x1)
+            LLR, x0, x1 = SPRT_vectorized._LLR_logistic(self.s0, self.s1, reg, x0, x1)
+        else:
+            a = np.array(self.values_)
+            LLR = SPRT_vectorized._LLR_normalized(
+                self.elo0, self.elo1, reg.sum(axis=0), a @ reg, (a * a) @ reg, l
+            )
+
+        # Dynamic overshoot correction (see record()) along the sequence.
+        prev_max = np.maximum.accumulate(np.concatenate(([self.max_LLR], LLR)))
+        max_LLR, prev_max = prev_max[1:], prev_max[:-1]
+        up = LLR > prev_max
+        sq1 = np.cumsum(
+            np.concatenate(([self.sq1], np.where(up, (LLR - prev_max) ** 2, 0)))
+        )[1:]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            o1 = np.where(max_LLR > 0, sq1 / max_LLR / 2, self.o1)
+        prev_min = np.minimum.accumulate(np.concatenate(([self.min_LLR], LLR)))
+        min_LLR, prev_min = prev_min[1:], prev_min[:-1]
+        down = LLR < prev_min
+        sq0 = np.cumsum(
+            np.concatenate(([self.sq0], np.where(down, (LLR - prev_min) ** 2, 0)))
+        )[1:]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            o0 = np.where(min_LLR < 0, -sq0 / min_LLR / 2, self.o0)
+
+        H1 = LLR > self.LB - o1
+        H0 = LLR < self.LA + o0
+        stop = np.flatnonzero(H1 | H0)
+        k = stop[0] if len(stop) > 0 else m - 1
+        if len(stop) > 0:
+            self.status_ = "H1" if H1[k] else "H0"
+
+        self.results_ = counts[:, k].tolist()
+        self.reg_ = LLRcalc.regularize(self.results_)
+        self.N_ = sum(self.reg_)
+        self.S1_ = sum([r * a for r, a in zip(self.reg_, self.values_)])
+        self.S2_ = sum([r * a * a for r, a in zip(self.reg_, self.values_)])
+        if self.elo_model == "logistic":
+            self.x0, self.x1 = float(x0[k]), float(x1[k])
+        self.LLR_ = float(LLR[k])
+        self.max_LLR, self.min_LLR = float(max_LLR[k]), float(min_LLR[k])
+        self.sq1, self.sq0 = float(sq1[k]), float(sq0[k])
+        self.o1, self.o0 = float(o1[k]), float(o0[k])
+        return k + 1
+
     def status(self):
         return self.status_
 
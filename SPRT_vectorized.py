@@ -0,0 +1,385 @@
+from __future__ import division
+import math
+import numpy as np
+import LLRcalc
+import instrument
+
+"""
+A vectorized version of SPRT_pentanomial.SPRT. It runs many independent
+GSPRTs side by side, the frequencies, LLRs and overshoot accumulators
+being stored in numpy arrays with one row (entry) per test.
+
+The functions MLE_multipliers, LLR_logistic and LLR_normalized are
+vectorized versions of the corresponding functions in LLRcalc. They act
+on arrays of frequencies of shape (m,3) or (m,5).
+"""
+
+epsilon = 1e-3  # regularization, as in LLRcalc.regularize
+
+
+def regularize(results):
+    results = np.asarray(results, dtype=float)
+    return np.where(results == 0, epsilon, results)
+
+
+def values(l):
+    return np.arange(l) / (l - 1)
+
+
+def MLE_multipliers(probs, s, x=None):
+    """
+Vectorized version of LLRcalc.MLE_multiplier for the rows of
+probs (an array of shape (m,l)) which are assumed to be supported
+on 0,1/(l-1),...,1. The optional argument x contains starting values.
+"""
+    probs = np.asarray(probs, dtype=float)
+    return _MLE_multipliers(np.ascontiguousarray(probs.T), s, x)
+
+
+def _MLE_multipliers(probs, s, x=None):
+    """
+Same as MLE_multipliers but probs is transposed, i.e. it has shape (l,m).
+
+We use safeguarded Newton iteration on the stationarity equation.
+It is decreasing on the interval (l,u) of Proposition 1.1 so Newton
+steps leaving the current bracket may be replaced by bisection.
+"""
+    l, m = probs.shape
+    d = (values(l) - s)[:, None]
+    lo = np.full(m, -1 / d[-1, 0])
+    hi = np.full(m, -1 / d[0, 0])
+    if x is None:
+        x = np.zeros(m)
+    else:
+        x = np.where((lo < x) & (x < hi), x, 0.0)
+    # The iteration acts on the unconverged entries only, the first
+    # pass being done in place.
+    todo = slice(None)
+    p_, x_, lo_, hi_ = probs, x, lo, hi
+    if instrument.enabled:
+        instrument.counters["SPRT_vectorized.MLE.calls"] += m
+    for _ in range(200):
+        if instrument.enabled:
+            instrument.counters["SPRT_vectorized.MLE.newton_steps"] += len(x_)
+        t = d / (1 + d * x_)
+        pt = p_ * t
+        f = pt.sum(axis=0)
+        fp = -(pt * t).sum(axis=0)
+        np.copyto(lo_, x_, where=f > 0)
+        np.copyto(hi_, x_, where=f < 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            xn = x_ - f / fp
+        bad = ~((lo_ < xn) & (xn < hi_))
+        if bad.any():
+            xn[bad] = (lo_[bad] + hi_[bad]) / 2
+        # the same stopping criterion as LLRcalc._MLE_refine()
+        converged = np.abs(xn - x_) <= 1e-14 * np.maximum(1, np.abs(x_))
+        x[todo] = xn
+        if converged.all():
+            break
+        if isinstance(todo, slice):
+            todo = np.flatnonzero(~converged)
+            p_, x_, lo_, hi_ = probs[:, todo], x[todo], lo[todo], hi[todo]
+        else:
+            keep = ~converged
+            todo = todo[keep]
+            p_, x_, lo_, hi_ = p_[:, keep], xn[keep], lo_[keep], hi_[keep]
+    else:
+        assert False
+    return x
+
+
+def _LLR_logistic(s0, s1, reg, x0=None, x1=None):
+    """
+reg has shape (l,m).
+"""
+    N = reg.sum(axis=0)
+    probs = reg / N
+    x0 = _MLE_multipliers(probs, s0, x0)
+    x1 = _MLE_multipliers(probs, s1, x1)
+    a = values(reg.shape[0])[:, None]
+    LLR = (reg * (np.log1p(x0 * (a - s0)) - np.log1p(x1 * (a - s1)))).sum(axis=0)
+    return LLR, x0, x1
+
+
+def LLR_logistic(elo0, elo1, results):
+    """
+Vectorized version of LLRcalc.LLR_logistic. "results" is an array
+of shape (m,3) or (m,5).
+"""
+    s0, s1 = [LLRcalc.L_(elo) for elo in (elo0, elo1)]
+    reg = np.ascontiguousarray(regularize(results).T)
+    return _LLR_logistic(s0, s1, reg)[0]
+
+
+def _LLR_normalized(nelo0, nelo1, N, S1, S2, l):
+    mu = S1 / N
+    var = S2 / N - mu * mu
+    if l == 5:
+        sigma_pg = (2 * var) ** 0.5
+        games = 2 * N
+    elif l == 3:
+        sigma_pg = var ** 0.5
+        games = N
+    else:
+        assert False
+    nt0, nt1 = [nelo / LLRcalc.nelo_divided_by_nt for nelo in (nelo0, nelo1)]
+    nt = (mu - 0.5) / sigma_pg
+    return (games / 2.0) * np.log(
+        (1 + (nt - nt0) * (nt - nt0)) / (1 + (nt - nt1) * (nt - nt1))
+    )
+
+
+def LLR_normalized(nelo0, nelo1, results):
+    """
+Vectorized version of LLRcalc.LLR_normalized. "results" is an array
+of shape (m,3) or (m,5).
+"""
+    reg = regularize(results)
+    l = reg.shape[1]
+    a = values(l)
+    return _LLR_normalized(nelo0, nelo1, reg.sum(axis=1), reg @ a, reg @ (a * a), l)
+
+
+class SPRT:
+    """
+This class performs n independent GSPRTs for H0:elo=elo0 versus
+H1:elo=elo1, exactly as SPRT_pentanomial.SPRT does for a single one.
+
+To record the outcomes of a game pair (or a game in trinomial mode)
+for all tests use the method record(results), where "results" is an
+integer array of length n. Tests which have already finished are
+not affected. Finished tests may be retired with the method select().
+
+status() returns an array with entries 0 (running), -1 (H0) or 1 (H1).
+"""
+
+    def __init__(
+        self,
+        n,
+        alpha=0.05,
+        beta=0.05,
+        elo0=0,
+        elo1=5,
+        mode="pentanomial",
+        elo_model="logistic",
+    ):
+        assert elo_model in ("logistic", "normalized")
+        assert mode in ("trinomial", "pentanomial")
+        self.elo0 = elo0
+        self.elo1 = elo1
+        self.elo_model = elo_model
+        l = 5 if mode == "pentanomial" else 3
+        self.LA = math.log(beta / (1 - alpha))
+        self.LB = math.log((1 - beta) / alpha)
+        # frequencies are stored transposed, i.e. with shape (l,n)
+        self.results_ = np.zeros((l, n), dtype=np.int64)
+        self.reg_ = regularize(self.results_)
+        self.values_ = values(l)
+        self.N_ = self.reg_.sum(axis=0)
+        self.S1_ = self.values_ @ self.reg_
+        self.S2_ = (self.values_ * self.values_) @ self.reg_
+        self.s0, self.s1 = [LLRcalc.L_(elo) for elo in (elo0, elo1)]
+        self.x0 = np.zeros(n)
+        self.x1 = np.zeros(n)
+        self.status_ = np.zeros(n, dtype=np.int8)
+        self.LLR_ = np.zeros(n)
+        self.min_LLR = np.zeros(n)
+        self.max_LLR = np.zeros(n)
+        self.sq0 = np.zeros(n)
+        self.sq1 = np.zeros(n)
+        self.o0 = np.zeros(n)
+        self.o1 = np.zeros(n)
+
+    _fields = (
+        "N_",
+        "S1_",
+        "S2_",
+        "x0",
+        "x1",
+        "status_",
+        "LLR_",
+        "min_LLR",
+        "max_LLR",
+        "sq0",
+        "sq1",
+        "o0",
+        "o1",
+    )
+
+    def select(self, keep):
+        """
+Only keep the tests for which the boolean array "keep" is true.
+"""
+        self.results_ = self.results_[:, keep]
+        self.reg_ = self.reg_[:, keep]
+        for field in self._fields:
+            setattr(self, field, getattr(self, field)[keep])
+
+    def record(self, results):
+        running = self.status_ == 0
+        if running.all():
+            self._record(slice(None), results)
+        else:
+            idx = np.flatnonzero(running)
+            self._record(idx, results[idx])
+
+    def _record(self, idx, results):
+        n = len(results)
+        cols = np.arange(self.results_.shape[1])[idx]
+        self.results_[results, cols] += 1
+        new = self.results_[results, cols]
+        delta = new - self.reg_[results, cols]
+        self.reg_[results, cols] = new
+        a = self.values_[results]
+        self.N_[idx] += delta
+        self.S1_[idx] += delta * a
+        self.S2_[idx] += delta * a * a
+        if self.elo_model == "logistic":
+            LLR, self.x0[idx], self.x1[idx] = _LLR_logistic(
+                self.s0, self.s1, self.reg_[:, idx], self.x0[idx], self.x1[idx]
+            )
+        else:
+            LLR = _LLR_normalized(
+                self.elo0,
+                self.elo1,
+                self.N_[idx],
+                self.S1_[idx],
+                self.S2_[idx],
+                len(self.values_),
+            )
+        self.LLR_[idx] = LLR
+
+        # Dynamic overshoot correction using
+        # Siegmund - Sequential Analysis - Corollary 8.33.
+        max_LLR = self.max_LLR[idx]
+        up = LLR > max_LLR
+        if up.any():
+            sq1 = self.sq1[idx]
+            sq1[up] += (LLR[up] - max_LLR[up]) ** 2
+            max_LLR[up] = LLR[up]
+            self.sq1[idx] = sq1
+            self.max_LLR[idx] = max_LLR
+            o1 = self.o1[idx]
+            o1[up] = sq1[up] / LLR[up] / 2
+            self.o1[idx] = o1
+        min_LLR = self.min_LLR[idx]
+        down = LLR < min_LLR
+        if down.any():
+            sq0 = self.sq0[idx]
+            sq0[down] += (LLR[down] - min_LLR[down]) ** 2
+            min_LLR[down] = LLR[down]
+            self.sq0[idx] = sq0
+            self.min_LLR[idx] = min_LLR
+            o0 = self.o0[idx]
+            o0[down] = -sq0[down] / LLR[down] / 2
+            self.o0[idx] = o0
+
+        status = np.zeros(n, dtype=np.int8)
+        H1 = LLR > self.LB - self.o1[idx]
+        status[H1] = 1
+        status[~H1 & (LLR < self.LA + self.o0[idx])] = -1
+        self.status_[idx] = status
+
+    def record_many(self, results):
+        """
+Records up to m outcomes for every test at once. "results" is an
+integer array of shape (n,m) whose rows are the consecutive outcomes
+for the tests. Every running test records its row until it finishes,
+the remaining outcomes being ignored. Tests which have already
+finished are not affected. Returns an integer array with the number
+of outcomes recorded by every test.
+
+This gives the same result as calling record() on the columns of
+"results" one by one, but the LLRs are computed for the whole block
+at once (see SPRT_pentanomial.SPRT.record_many()).
+"""
+        results = np.asarray(results)
+        n, m = results.shape
+        recorded = np.zeros(n, dtype=np.int64)
+        idx = np.flatnonzero(self.status_ == 0)
+        if len(idx) == 0 or m == 0:
+            return recorded
+        results = results[idx]
+        k = len(idx)
+        l = self.results_.shape[0]
+        # the frequencies after each record, shape (l,k,m)
+        counts = self.results_[:, idx, None] + np.cumsum(
+            np.arange(l)[:, None, None] == results, axis=2
+        )
+        reg = regularize(counts)
+        flat = reg.reshape(l, k * m)
+        if self.elo_model == "logistic":
+            x0 = np.repeat(self.x0[idx], m)
+            x1 = np.repeat(self.x1[idx], m)
+            LLR, x0, x1 = _LLR_logistic(self.s0, self.s1, flat, x0, x1)
+            x0, x1 = x0.reshape(k, m), x1.reshape(k, m)
+        else:
+            a = self.values_
+            LLR = _LLR_normalized(
+                self.elo0, self.elo1, flat.sum(axis=0), a @ flat, (a * a) @ flat, l
+            )
+        LLR = LLR.reshape(k, m)
+
+        # Dynamic overshoot correction (see _record()) along the rows.
+        prev_max = np.maximum.accumulate(
+            np.column_stack((self.max_LLR[idx], LLR)), axis=1
+        )
+        max_LLR, prev_max = prev_max[:, 1:], prev_max[:, :-1]
+        up = LLR > prev_max
+        sq1 = self.sq1[idx, None] + np.cumsum(
+            np.where(up, (LLR - prev_max) ** 2, 0), axis=1
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            o1 = np.where(max_LLR > 0, sq1 / max_LLR / 2, self.o1[idx, None])
+        prev_min = np.minimum.accumulate(
+            np.column_stack((self.min_LLR[idx], LLR)), axis=1
+        )
+        min_LLR, prev_min = prev_min[:, 1:], prev_min[:, :-1]
+        down = LLR < prev_min
+        sq0 = self.sq0[idx, None] + np.cumsum(
+            np.where(down, (LLR - prev_min) ** 2, 0), axis=1
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            o0 = np.where(min_LLR < 0, -sq0 / min_LLR / 2, self.o0[idx, None])
+
+        H1 = LLR > self.LB - o1
+        H0 = LLR < self.LA + o0
+        stop = H1 | H0
+        # the first crossing in every row, or the last column
+        stopped = stop.any(axis=1)
+        last = np.where(stopped, stop.argmax(axis=1), m - 1)
+        rows = np.arange(k)
+
+        self.results_[:, idx] = counts[:, rows, last]
+        reg = reg[:, rows, last]
+        self.reg_[:, idx] = reg
+        self.N_[idx] = reg.sum(axis=0)
+        self.S1_[idx] = self.values_ @ reg
+        self.S2_[idx] = (self.values_ * self.values_) @ reg
+        if self.elo_model == "logistic":
+            self.x0[idx], self.x1[idx] = x0[rows, last], x1[rows, last]
+        self.LLR_[idx] = LLR[rows, last]
+        self.max_LLR[idx], self.min_LLR[idx] = max_LLR[rows, last], min_LLR[rows, last]
+        self.sq1[idx], self.sq0[idx] = sq1[rows, last], sq0[rows, last]
+        self.o1[idx], self.o0[idx] = o1[rows, last], o0[rows, last]
+        status = np.where(H1[rows, last], 1, -1).astype(np.int8)
+        self.status_[idx] = np.where(stopped, status, 0)
+        recorded[idx] = last + 1
+        return recorded
+
+    def status(self):
+        return self.status_
+
+    def length(self):
+        l = self.results_.shape[0]
+        return ((l - 1) / 2) * self.results_.sum(axis=0)
+
+    def LLR(self):
+        return self.LLR_
+
+    def results(self):
+        """
+Array of shape (n,l).
+"""
+        return self.results_.T
@@ -0,0 +1,231 @@
+from __future__ import division
+import sys, time, json, argparse, platform, random
+
+import numpy as np
+
+import LLRcalc
+import SPRT_pentanomial
+import context
+import sprt
+import sprta5
+import LLRsimulate
+from brownian import Brownian
+
+"""
+Benchmarks for the hot paths of the package.
+
+Every benchmark is run for the parameter sets below (a short and a long
+time control). The timings are written as JSON (see --output) so that a
+later run can be compared against them with --compare.
+"""
+
+# Representative parameter sets. The STC draw ratio is lower than the
+# LTC one, which corresponds to the default draw_elo of 327.
+parameter_sets = {
+    "STC": {
+        "draw_elo": context.draw_elo_calc(0.55),
+        "biases": [-90, 200],
+        "elo0": 0.0,
+        "elo1": 2.0,
+        "pairs": 60000,
+    },
+    "LTC": {
+        "draw_elo": context.LTC_defaults.draw_elo(),
+        "biases": context.LTC_defaults.biases(),
+        "elo0": 0.5,
+        "elo1": 2.5,
+        "pairs": 40000,
+    },
+}
+
+
+def measure(f, min_time=0.2, repeat=5):
+    """
+Times the callable f. The number of calls per repetition is chosen
+such that a repetition takes at least min_time seconds. Returns a
+dictionary with the best and the median time per call (in seconds).
+"""
+    number = 1
+    while True:
+        t = time.perf_counter()
+        for _ in range(number):
+            f()
+        elapsed = time.perf_counter() - t
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed == 0 else max(2, int(1.2 * min_time / elapsed))
+    times = [elapsed / number]
+    for _ in range(repeat - 1):
+        t = time.perf_counter()
+        for _ in range(number):
+            f()
+        times.append((time.perf_counter() - t) / number)
+    times.sort()
+    return {"best": times[0], "median": times[len(times) // 2], "number": number}
+
+
+def benchmarks(params):
+    """
+Returns a list of pairs (name, f) for the parameter set params.
+"""
+    draw_elo, biases = params["draw_elo"], params["biases"]
+    elo0, elo1 = params["elo0"], params["elo1"]
+    elo = (elo0 + elo1) / 2
+    c = context.context(draw_elo, biases)
+    probs5 = c.probs(elo)[1]
+    # the expected frequencies of a test of the given length at elo
+    results = [int(round(params["pairs"] * p)) for p in probs5]
+    pdf = LLRcalc.results_to_pdf(results)[1]
+    s = LLRcalc.L_(elo1)
+    ret = []
+
+    ret.append(("LLRcalc.MLE", lambda: LLRcalc.MLE(pdf, s)))
+    ret.append(
+        ("LLRcalc.LLR_logistic", lambda: LLRcalc.LLR_logistic(elo0, elo1, results))
+    )
+    ret.append(
+        ("LLRcalc.LLR_normalized", lambda: LLRcalc.LLR_normalized(elo0, elo1, results))
+    )
+
+    rng = random.Random(1)
+    sequence = [sum(c.pick(elo, rng=rng)) for _ in range(1000)]
+
+    def record():
+        # the bounds are far away, so the test does not finish
+        sp = SPRT_pentanomial.SPRT(alpha=1e-12, beta=1e-12, elo0=elo0, elo1=elo1)
+        for r in sequence:
+            sp.record(r)
+
+    ret.append(("SPRT_pentanomial.SPRT.record[1000]", record))
+    ret.append(("context.pick", lambda: c.pick(elo, rng=rng)))
+
+    def elo_to_belo():
+        c._cache.clear()
+        return c.elo_to_belo(elo)
+
+    ret.append(("context.elo_to_belo", elo_to_belo))
+    c_table = context.context(draw_elo, biases)
+    c_table.build_table()
+
+    def elo_to_belo_table():
+        c_table._cache.clear()
+        return c_table.elo_to_belo(elo)
+
+    ret.append(("context.elo_to_belo[table]", elo_to_belo_table))
+
+    sp = sprt.sprt(elo0=elo0, elo1=elo1)
+    sp.set_state(results)
+    mu, var = LLRcalc.LLR_drift_variance(sp.pdf, sp.s0, sp.s1, s)
+    b = Brownian(a=sp.a, b=sp.b, mu=mu, sigma=var ** 0.5)
+    ret.append(("Brownian.outcome_cdf", lambda: b.outcome_cdf(T=sp.T, y=sp.llr)))
+
+    def analytics():
+        sp_ = sprt.sprt(elo0=elo0, elo1=elo1)
+        sp_.set_state(results)
+        return sp_.analytics()
+
+    ret.append(("sprt.analytics", analytics))
+
+    sp5 = sprta5.SPRT(elo0=elo0, elo1=elo1, context=c)
+
+    def characteristics():
+        c._cache.clear()
+        return sp5.characteristics(elo)
+
+    ret.append(("sprta5.SPRT.characteristics", characteristics))
+
+    # always the same simulated test, so that the timings are comparable
+    ret.append(
+        (
+            "LLRsimulate.simulate",
+            lambda: LLRsimulate.simulate(
+                elo0=elo0, elo1=elo1, elo=elo, context=c, rng=np.random.default_rng(1)
+            ),
+        )
+    )
+    return ret
+
+
+def run(filter=None, min_time=0.2, repeat=5, verbose=True):
+    ret = {}
+    for set_name, params in parameter_sets.items():
+        for name, f in benchmarks(params):
+            key = "%s/%s" % (set_name, name)
+            if filter is not None and filter not in key:
+                continue
+            ret[key] = measure(f, min_time=min_time, repeat=repeat)
+            if verbose:
+                print(
+                    "%-45s %12.1f us %12.1f us (median)"
+                    % (key, 1e6 * ret[key]["best"], 1e6 * ret[key]["median"])
+                )
+                sys.stdout.flush()
+    return ret
+
+
+def compare(old, new, threshold=0.1):
+    """
+Prints the ratios new/old of the best times. Returns the list of the
+benchmarks which are more than a fraction threshold slower.
+"""
+    regressions = []
+    for key in sorted(new):
+        if key not in old:
+            continue
+        ratio = new[key]["best"] / old[key]["best"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  <===== slower"
+            regressions.append(key)
+        elif ratio < 1 - threshold:
+            flag = "  faster"
+        print("%-45s %6.2fx%s" % (key, ratio, flag))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--output", help="save the results in this JSON file")
+    parser.add_argument(
+        "--compare", help="compare with the results in this JSON file", default=None
+    )
+    parser.add_argument(
+        "--threshold",
+        help="relative slowdown which is reported as a regression",
+        type=float,
+        default=0.1,
+    )
+    parser.add_argument(
+        "--filter", help="only run benchmarks whose name contains this", default=None
+    )
+    parser.add_argument(
+        "--min_time",
+        help="minimal duration of a repetition (in seconds)",
+        type=float,
+        default=0.2,
+    )
+    parser.add_argument("--repeat", help="number of repetitions", type=int, default=5)
+    args = parser.parse_args()
+    results = run(filter=args.filter, min_time=args.min_time, repeat=args.repeat)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                    "python": platform.python_version(),
+                    "numpy": np.__version__,
+                    "machine": platform.machine(),
+                    "results": results,
+                },
+                f,
+                indent=1,
+            )
+    if args.compare is not None:
+        with open(args.compare) as f:
+            old = json.load(f)["results"]
+        print("")
+        regressions = compare(old, results, threshold=args.threshold)
+        if len(regressions) > 0:
+            sys.exit(1)
@@ -2,18 +2,22 @@ from __future__ import division
 
 import math
 
-import scipy.stats
+import numpy as np
 
+import instrument
+from numerics import isscalar, Phi
 
-def Phi(x):
-    """
-Cumulative standard normal distribution.
 """
-    return scipy.stats.norm.cdf(x)
+The methods of Brownian accept arrays for T and y and the
+parameters mu and sigma may be arrays as well. The arguments
+are broadcast against each other. If they are all scalars
+we use plain Python arithmetic, which is much faster than
+numpy for a single value.
+"""
 
 
 def U(n, gamma, A, y):
-    """ 
+    """
 This is a primitive function of e^(gamma y)sin ((n pi y)/A),
 multiplied by 2/A*exp(-gamma*y).
 """
@@ -23,6 +27,34 @@ multiplied by 2/A*exp(-gamma*y).
     ) / (A ** 2 * gamma ** 2 + math.pi ** 2 * n ** 2)
 
 
+def U_(n, gamma, A, y):
+    """
+Vectorized version of U.
+"""
+    return (
+        2 * A * gamma * np.sin(math.pi * n * y / A)
+        - 2 * math.pi * n * np.cos(math.pi * n * y / A)
+    ) / (A ** 2 * gamma ** 2 + math.pi ** 2 * n ** 2)
+
+
+def series_length(cT, log_t0, eps=1e-9):
+    """
+The number of terms of the series in outcome_cdf_alt1 which are needed
+to make the truncation error less than eps. Here cT=(lambda_2-lambda_1)*T/3
+and t0 is the common prefactor of the terms.
+
+Since |U(n,...)|<=2*sqrt(2)/(pi*n)<=1 the n'th term is bounded by
+t0*exp(-(n^2-1)*cT) and the ratio between consecutive bounds is at
+most q=exp(-3*cT). So it suffices that the bound for the first
+omitted term is at most eps*(1-q).
+"""
+    if isscalar(cT) and isscalar(log_t0):
+        r = log_t0 - math.log(eps * -math.expm1(-3 * cT))
+        return int(math.ceil(math.sqrt(1 + max(r, 0) / cT)))
+    r = log_t0 - np.log(eps * -np.expm1(-3 * cT))
+    return np.ceil(np.sqrt(1 + np.maximum(r, 0) / cT)).astype(int)
+
+
 class Brownian:
     def __init__(self, a=-1.0, b=1.0, mu=0.0, sigma=0.005):
         self.a = a
@@ -32,45 +64,72 @@ class Brownian:
         self.sigma2 = sigma ** 2
         gamma = self.mu / self.sigma2
 
+    def _scalar(self, T, y):
+        return (
+            isscalar(T) and isscalar(y) and isscalar(self.mu) and isscalar(self.sigma)
+        )
+
     def outcome_cdf(self, T=None, y=None):
         # in case of slow convergence use Siegmund approximation.
         sigma2 = self.sigma2
         mu = self.mu
         gamma = mu / sigma2
         A = self.b - self.a
-        if sigma2 * T / A ** 2 < 1e-2 or abs(gamma * A) > 15:
-            ret = self.outcome_cdf_alt2(T, y)
-        else:
-            ret = self.outcome_cdf_alt1(T, y)
-        assert -1e-3 <= ret <= 1 + 1e-3
+        if self._scalar(T, y):
+            if sigma2 * T / A ** 2 < 1e-2 or abs(gamma * A) > 15:
+                if instrument.enabled:
+                    instrument.counters["Brownian.outcome_cdf.siegmund"] += 1
+                ret = self.outcome_cdf_alt2(T, y)
+            else:
+                if instrument.enabled:
+                    instrument.counters["Brownian.outcome_cdf.series"] += 1
+                ret = self.outcome_cdf_alt1(T, y)
+            assert -1e-3 <= ret <= 1 + 1e-3
+            return ret
+        T, y, mu, sigma = np.broadcast_arrays(
+            *[np.asarray(v, dtype=float) for v in (T, y, self.mu, self.sigma)]
+        )
+        gamma = mu / sigma ** 2
+        alt2 = (sigma ** 2 * T / A ** 2 < 1e-2) | (np.abs(gamma * A) > 15)
+        if instrument.enabled:
+            instrument.counters["Brownian.outcome_cdf.siegmund"] += int(alt2.sum())
+            instrument.counters["Brownian.outcome_cdf.series"] += int((~alt2).sum())
+        ret = np.empty(T.shape)
+        for mask, f in ((alt2, "outcome_cdf_alt2"), (~alt2, "outcome_cdf_alt1")):
+            if mask.any():
+                b = Brownian(a=self.a, b=self.b, mu=mu[mask], sigma=sigma[mask])
+                ret[mask] = getattr(b, f)(T[mask], y[mask])
+        assert np.all((-1e-3 <= ret) & (ret <= 1 + 1e-3))
         return ret
 
     def outcome_cdf_alt1(self, T=None, y=None):
-        """ 
+        """
 Computes the probability that the particle passes to the
 right of (T,y), the time axis being vertically oriented.
-This may give a numerical exception if math.pi**2*sigma2*T/(2*A**2) 
+This may give a numerical exception if math.pi**2*sigma2*T/(2*A**2)
 is small.
 """
         mu = self.mu
         sigma2 = self.sigma2
         A = self.b - self.a
         x = 0 - self.a
-        y = y - self.a
         gamma = mu / sigma2
-        n = 1
-        s = 0.0
         lambda_1 = ((math.pi / A) ** 2) * sigma2 / 2 + (mu ** 2 / sigma2) / 2
-        t0 = math.exp(-lambda_1 * T - x * gamma + y * gamma)
-        while True:
-            lambda_n = ((n * math.pi / A) ** 2) * sigma2 / 2 + (mu ** 2 / sigma2) / 2
-            t1 = math.exp(-(lambda_n - lambda_1) * T)
+        c = ((math.pi / A) ** 2) * sigma2 / 2  # lambda_n-lambda_1=c*(n^2-1)
+        log_t0 = -lambda_1 * T - x * gamma + (y - self.a) * gamma
+        N = series_length(c * T, log_t0)
+        if instrument.enabled:
+            instrument.counters["Brownian.outcome_cdf_alt1.terms"] += int(np.sum(N))
+        if not self._scalar(T, y):
+            return self._outcome_cdf_alt1(T, y, N.max())
+        y = y - self.a
+        t0 = math.exp(log_t0)
+        s = 0.0
+        for n in range(1, N + 1):
+            t1 = math.exp(-c * (n ** 2 - 1) * T)
             t3 = U(n, gamma, A, y)
             t4 = math.sin(n * math.pi * x / A)
             s += t1 * t3 * t4
-            if abs(t0 * t1 * t3) <= 1e-9:
-                break
-            n += 1
         if gamma * A > 30:  # avoid numerical overflow
             pre = math.exp(-2 * gamma * x)
         elif abs(gamma * A) < 1e-8:  # avoid division by zero
@@ -79,12 +138,48 @@ is small.
             pre = (1 - math.exp(2 * gamma * (A - x))) / (1 - math.exp(2 * gamma * A))
         return pre + t0 * s
 
+    def _outcome_cdf_alt1(self, T, y, N):
+        """
+Vectorized version of outcome_cdf_alt1 using the first N terms
+of the series. The series index runs along an extra last axis.
+"""
+        T, y, mu, sigma2 = [
+            np.asarray(v, dtype=float)[..., None]
+            for v in np.broadcast_arrays(T, y, self.mu, self.sigma2)
+        ]
+        A = self.b - self.a
+        x = 0 - self.a
+        y = y - self.a
+        gamma = mu / sigma2
+        n = np.arange(1, N + 1)
+        lambda_1 = ((math.pi / A) ** 2) * sigma2 / 2 + (mu ** 2 / sigma2) / 2
+        c = ((math.pi / A) ** 2) * sigma2 / 2
+        t0 = np.exp(-lambda_1 * T - x * gamma + y * gamma)
+        t1 = np.exp(-c * (n ** 2 - 1) * T)
+        t3 = U_(n, gamma, A, y)
+        t4 = np.sin(n * math.pi * x / A)
+        s = (t1 * t3 * t4).sum(axis=-1)
+        gamma, t0 = gamma[..., 0], t0[..., 0]
+        with np.errstate(over="ignore", divide="ignore", invalid="ignore"):
+            pre = np.where(
+                gamma * A > 30,  # avoid numerical overflow
+                np.exp(-2 * gamma * x),
+                np.where(
+                    np.abs(gamma * A) < 1e-8,  # avoid division by zero
+                    (A - x) / A,
+                    np.expm1(2 * gamma * (A - x)) / np.expm1(2 * gamma * A),
+                ),
+            )
+        return pre + t0 * s
+
     def outcome_cdf_alt2(self, T=None, y=None):
         """
 Siegmund's approximation. We use it as backup if our
 exact formula converges too slowly. To make the evaluation
 robust we use the asymptotic development of Phi.
 """
+        if not self._scalar(T, y):
+            return self._outcome_cdf_alt2(T, y)
         denom = math.sqrt(T * self.sigma2)
         offset = self.mu * T
         gamma = self.mu / self.sigma2
@@ -111,3 +206,37 @@ robust we use the asymptotic development of Phi.
         else:
             t3 = math.exp(2 * gamma * b) * Phi(zb)
         return t1 + t2 - t3
+
+    def _outcome_cdf_alt2(self, T, y):
+        """
+Vectorized version of outcome_cdf_alt2.
+"""
+        T, y, mu, sigma2 = [
+            np.asarray(v, dtype=float)
+            for v in np.broadcast_arrays(T, y, self.mu, self.sigma2)
+        ]
+        denom = np.sqrt(T * sigma2)
+        offset = mu * T
+        gamma = mu / sigma2
+        a = self.a
+        b = self.b
+        z = (y - offset) / denom
+        za = (-y + offset + 2 * a) / denom
+        zb = (y - offset - 2 * b) / denom
+        t1 = Phi(z)
+        with np.errstate(over="ignore", divide="ignore", invalid="ignore"):
+            t2 = np.where(
+                gamma * a >= 5,
+                -np.exp(-za ** 2 / 2 + 2 * gamma * a)
+                / math.sqrt(2 * math.pi)
+                * (1 / za - 1 / za ** 3),
+                np.exp(2 * gamma * a) * Phi(za),
+            )
+            t3 = np.where(
+                gamma * b >= 5,
+                -np.exp(-zb ** 2 / 2 + 2 * gamma * b)
+                / math.sqrt(2 * math.pi)
+                * (1 / zb - 1 / zb ** 3),
+                np.exp(2 * gamma * b) * Phi(zb),
+            )
+        return t1 + t2 - t3
@@ -1,7 +1,9 @@
 from __future__ import division
-import sys, copy, math, random
+import sys, copy, math, random, bisect, hashlib
+import numpy as np
 import stats_pentanomial
-import scipy
+import instrument
+import numerics
 
 """
 Here we model pentanomial probabilities using the BayesElo model.
@@ -12,7 +14,10 @@ bias and the variation of the bias.
 
 Rather than modeling the biases with a continuous distribution we
 model them with a list of biases occuring with identical
-probabilities.
+probabilities (or optionally with given weights). Large opening
+books may be stored in a binary file and loaded with load_book(),
+which memory maps the file. The computations over the biases
+are vectorized.
 
 Relistic values are:
 
@@ -64,34 +69,172 @@ def ldw(belo, draw_elo, bias):
     return l, d, w
 
 
-def probs_(belo, draw_elo, bias):
-    ldw1 = ldw(belo, draw_elo, bias)
-    ldw2 = ldw(belo, draw_elo, -bias)
-    return (
-        stats_pentanomial.avg([ldw1, ldw2]),
-        stats_pentanomial.trinomial_to_pentanomial(ldw1, ldw2),
-    )
+def L_(x):
+    """
+Vectorized version of L.
+"""
+    return np.exp(-np.logaddexp(0, -bb * x))
+
+
+def ldw_(belo, draw_elo, biases):
+    """
+Vectorized version of ldw (for an array of biases).
+"""
+    w = L_(belo - draw_elo + biases)
+    l = L_(-belo - draw_elo - biases)
+    d = 1 - w - l
+    return np.stack((l, d, w))
+
+
+def load_book(path):
+    """
+Memory maps a book of biases stored in a binary file. This is either
+a .npy file or a file of raw little endian doubles. If the array
+has two columns then the second column contains weights.
+Returns a tuple (biases, weights) (weights is None if absent).
+
+Since the file is memory mapped, processes using the same book
+share its memory.
+"""
+    if path.endswith(".npy"):
+        book = np.load(path, mmap_mode="r")
+    else:
+        book = np.memmap(path, dtype="<f8", mode="r")
+    if book.ndim == 2:
+        assert book.shape[1] == 2
+        return book[:, 0], book[:, 1]
+    assert book.ndim == 1
+    return book, None
+
+
+_chunk_size = 1 << 16
+
+# Books up to this size are handled with plain Python loops, since
+# for them the overhead of numpy dominates.
+_small_book = 64
+
+
+def _book_chunks(biases, weights=None):
+    """
+Iterates over the book in chunks, yielding pairs (biases, weights)
+of arrays, the weights being normalized so that they sum to 1.
+This keeps the temporary arrays small for large books.
+"""
+    n = len(biases)
+    total = n if weights is None else np.sum(weights)
+    for i in range(0, n, _chunk_size):
+        b = np.asarray(biases[i : i + _chunk_size], dtype=float)
+        if weights is None:
+            w = np.full(len(b), 1 / total)
+        else:
+            w = np.asarray(weights[i : i + _chunk_size], dtype=float) / total
+        yield b, w
+
+
+def elo_and_slope(belo, draw_elo, biases, weights=None):
+    """
+The logistic elo corresponding to belo (in the context given by draw_elo
+and biases) together with its derivative with respect to belo.
+"""
+    s = 0
+    ds = 0
+    for b_, w_ in _book_chunks(biases, weights):
+        for b in (b_, -b_):
+            w = L_(belo - draw_elo + b)
+            l = L_(-belo - draw_elo - b)
+            s += w_ @ (1 + w - l)
+            ds += w_ @ (w * (1 - w) + l * (1 - l))
+    s /= 4
+    ds *= bb / 4
+    return score_to_elo(s), ds / (bb * s * (1 - s))
+
+
+# Tables for elo_to_belo, shared between contexts with the same draw_elo
+# and biases.
+_tables = {}
 
 
 class context:
-    def __init__(self, draw_elo=None, biases=None):
+    def __init__(self, draw_elo=None, biases=None, weights=None):
+        """
+biases is a list or an array (e.g. as returned by load_book()).
+The optional weights are the relative frequencies of the biases.
+"""
         self._draw_elo = draw_elo
         self._biases = biases
+        self._weights = weights
+        if len(biases) <= _small_book:
+            # list of pairs (bias, weight)
+            self._small = [
+                (float(b), float(w))
+                for b_, w_ in _book_chunks(biases, weights)
+                for b, w in zip(b_, w_)
+            ]
+        else:
+            self._small = None
         self._cache = {}
-        self._ldw_cache = {}
+        self._joint_cache = {}
+        self._alias_cache = {}
+        self._table = None
         self.ldws = []
 
+    def _book_key(self):
+        """
+A digest identifying the book.
+"""
+        h = hashlib.sha1()
+        for b, w in _book_chunks(self._biases, self._weights):
+            h.update(b.tobytes())
+            h.update(w.tobytes())
+        return h.hexdigest()
+
+    def _joint(self, belo):
+        """
+The joint distribution of the outcomes of a game pair
+as a 3x3 matrix (list of lists). BayesElo input!
+"""
+        if self._small is not None:
+            p = [3 * [0] for i in range(0, 3)]
+            for bias, weight in self._small:
+                ldw1 = ldw(belo, self._draw_elo, bias)
+                ldw2 = ldw(belo, self._draw_elo, -bias)
+                for i in range(0, 3):
+                    for j in range(0, 3):
+                        p[i][j] += weight * ldw1[i] * ldw2[j]
+            return p
+        p = np.zeros((3, 3))
+        for b, w in _book_chunks(self._biases, self._weights):
+            ldw1 = ldw_(belo, self._draw_elo, b)
+            ldw2 = ldw_(belo, self._draw_elo, -b)
+            p += (ldw1 * w) @ ldw2.T
+        return p.tolist()
+
     def _probs(self, belo):
         """
 BayesElo input!
 """
-        probs3 = []
-        probs5 = []
-        for bias in self._biases:
-            prob3, prob5 = probs_(belo, self._draw_elo, bias)
-            probs3.append(prob3)
-            probs5.append(prob5)
-        return (stats_pentanomial.avg(probs3), stats_pentanomial.avg(probs5))
+        p = self._joint(belo)
+        probs3 = [(sum(p[k]) + p[0][k] + p[1][k] + p[2][k]) / 2 for k in range(0, 3)]
+        probs5 = [
+            sum([p[i][k - i] for i in range(max(0, k - 2), min(2, k) + 1)])
+            for k in range(0, 5)
+        ]
+        return probs3, probs5
+
+    def _elo_and_slope(self, belo):
+        if self._small is None:
+            return elo_and_slope(belo, self._draw_elo, self._biases, self._weights)
+        s = 0
+        ds = 0
+        for bias, weight in self._small:
+            for b in (bias, -bias):
+                w = L(belo - self._draw_elo + b)
+                l = L(-belo - self._draw_elo - b)
+                s += weight * (1 + w - l)
+                ds += weight * (w * (1 - w) + l * (1 - l))
+        s /= 4
+        ds *= bb / 4
+        return score_to_elo(s), ds / (bb * s * (1 - s))
 
     def probs(self, elo):
         belo = self.elo_to_belo(elo)
@@ -100,14 +243,20 @@ BayesElo input!
     def stats_biases(self):
         m1 = 0
         m2 = 0
-        l = len(self._biases)
-        for bias in self._biases:
-            probs3 = ldw(0, self._draw_elo, bias)
-            s = stats_pentanomial.score(probs3)
-            m1 += s
-            m2 += s * s
-        mu = m1 / l
-        sigma2 = m2 / l - mu ** 2
+        if self._small is not None:
+            for bias, weight in self._small:
+                probs3 = ldw(0, self._draw_elo, bias)
+                s = stats_pentanomial.score(probs3)
+                m1 += weight * s
+                m2 += weight * s * s
+        else:
+            for b, w in _book_chunks(self._biases, self._weights):
+                probs3 = ldw_(0, self._draw_elo, b)
+                s = probs3[1] / 2 + probs3[2]
+                m1 += w @ s
+                m2 += w @ (s * s)
+        mu = float(m1)
+        sigma2 = float(m2) - mu ** 2
         return (mu - 1 / 2, sigma2)
 
     def elo_to_belo(self, elo):
@@ -115,17 +264,136 @@ BayesElo input!
 With this function logistic elo
 can be converted to BayesElo for
 the current context.
+
+If an interpolation table has been built (see build_table())
+it is used to obtain an initial approximation, which is then
+refined by one Newton step. If the residual of the result
+(see build_table()) is not small enough we solve exactly.
 """
         if elo in self._cache:
+            if instrument.enabled:
+                instrument.counters["context._cache.hits"] += 1
             return self._cache[elo]
-        s = L(elo)
-        f = lambda x: stats_pentanomial.score(self._probs(x)[1]) - s
-        x, res = scipy.optimize.brentq(f, -1000, 1000, full_output=True, disp=False)
-        assert res.converged
-        belo = x
+        if instrument.enabled:
+            instrument.counters["context._cache.misses"] += 1
+        belo = None
+        if self._table is not None:
+            belo = self._table_lookup(elo)
+        if belo is None:
+            s = L(elo)
+            f = lambda x: stats_pentanomial.score(self._probs(x)[1]) - s
+            x, res = numerics.brentq(f, -1000, 1000, full_output=True, disp=False)
+            assert res.converged
+            belo = x
+            if instrument.enabled:
+                c = instrument.counters
+                c["context.elo_to_belo.brentq_calls"] += 1
+                c["context.elo_to_belo.brentq_iterations"] += res.iterations
         self._cache[elo] = belo
         return belo
 
+    def build_table(self, nodes=201):
+        """
+Builds a table for elo_to_belo() consisting of the values
+and derivatives of belo->elo at equally spaced points in
+[-1000,1000]. Between the nodes the inverse function
+elo->belo is approximated by cubic Hermite interpolation.
+
+The table is built only once for every (draw_elo, biases).
+
+The table also contains a constant K such that the error after the
+Newton step in elo_to_belo() is about K*delta^2, delta being the
+Newton step. K is an estimate from finite differences of the slopes
+at the nodes, not a rigorous bound. So it is only used to skip the
+Newton step when it is clearly insufficient: the result is accepted
+when the residual at the corrected value, divided by the slope, is
+below 1e-10. Otherwise elo_to_belo() solves exactly.
+"""
+        key = (self._draw_elo, self._book_key(), nodes)
+        if key not in _tables:
+            belos = [-1000 + 2000 * k / (nodes - 1) for k in range(0, nodes)]
+            elos, slopes = [], []
+            for belo in belos:
+                elo, slope = self._elo_and_slope(belo)
+                elos.append(elo)
+                slopes.append(slope)
+            # K estimates the constant in |error after| ~ K*|error before|^2
+            # for a Newton step, i.e. max|elo''|/(2*min elo'). The second
+            # derivative is estimated from the nodes, with a safety factor.
+            h = belos[1] - belos[0]
+            d2 = max([abs(slopes[k + 1] - slopes[k]) / h for k in range(0, nodes - 1)])
+            K = 4 * d2 / (2 * min(slopes))
+            _tables[key] = {
+                "draw_elo": self._draw_elo,
+                "book": key[1],
+                "belos": belos,
+                "elos": elos,
+                "slopes": slopes,
+                "K": K,
+            }
+        self._table = _tables[key]
+
+    def with_table(self, nodes=201):
+        """
+A copy of the context with an interpolation table (see build_table()).
+The copy shares the book but has its own caches, so the context itself
+is not affected.
+"""
+        ret = copy.copy(self)
+        ret._cache = {}
+        ret._joint_cache = {}
+        ret._alias_cache = {}
+        ret.build_table(nodes)
+        return ret
+
+    def table(self):
+        """
+The interpolation table for elo_to_belo() as a dictionary
+(None if it has not been built). It only contains lists and
+numbers so it can be serialized with json or pickle, and
+restored with set_table().
+"""
+        return self._table
+
+    def set_table(self, table):
+        assert table["draw_elo"] == self._draw_elo
+        assert table["book"] == self._book_key()
+        self._table = table
+
+    def _table_lookup(self, elo):
+        t = self._table
+        elos, belos, slopes = t["elos"], t["belos"], t["slopes"]
+        k = bisect.bisect_right(elos, elo) - 1
+        if k < 0 or k >= len(elos) - 1:
+            return None
+        # cubic Hermite interpolation of the inverse function
+        x0, x1 = elos[k], elos[k + 1]
+        h = x1 - x0
+        u = (elo - x0) / h
+        h00 = (1 + 2 * u) * (1 - u) ** 2
+        h10 = u * (1 - u) ** 2
+        h01 = u * u * (3 - 2 * u)
+        h11 = u * u * (u - 1)
+        belo = (
+            h00 * belos[k]
+            + h10 * h / slopes[k]
+            + h01 * belos[k + 1]
+            + h11 * h / slopes[k + 1]
+        )
+        # one Newton step
+        elo_, slope = self._elo_and_slope(belo)
+        delta = (elo - elo_) / slope
+        if t["K"] * delta * delta > 1e-10:
+            return None
+        belo += delta
+        # K is only an estimate, so we check the result
+        elo_, slope = self._elo_and_slope(belo)
+        if abs(elo - elo_) > 1e-10 * slope:
+            if instrument.enabled:
+                instrument.counters["context._table_lookup.rejected"] += 1
+            return None
+        return belo
+
     def stats(self, elo):
         stats = {}
         probs3, probs5 = self.probs(elo)
@@ -149,18 +417,55 @@ the current context.
         stats["ratio_predicted"] = (v - sigma2) / (v + mu ** 2)
         return stats
 
-    def pick(self, elo):
+    def pair_probs(self, elo):
+        """
+The joint distribution of the outcomes (i,j) of a game pair
+as returned by pick(), as a 3x3 matrix (list of lists).
+"""
         belo = self.elo_to_belo(elo)
-        bias = random.choice(self._biases)
-        if (belo, bias) in self._ldw_cache:
-            ldw1, ldw2 = self._ldw_cache[(belo, bias)]
-        else:
-            ldw1 = ldw(belo, self._draw_elo, bias)
-            ldw2 = ldw(belo, self._draw_elo, -bias)
-            self._ldw_cache[(belo, bias)] = ldw1, ldw2
-        i = stats_pentanomial.pick(ldw1)
-        j = stats_pentanomial.pick(ldw2)
-        return i, j
+        if belo not in self._joint_cache:
+            if instrument.enabled:
+                instrument.counters["context._joint_cache.misses"] += 1
+            self._joint_cache[belo] = self._joint(belo)
+        elif instrument.enabled:
+            instrument.counters["context._joint_cache.hits"] += 1
+        return self._joint_cache[belo]
+
+    def _alias_table(self, elo):
+        """
+Alias table for the outcomes 3*i+j of a game pair.
+"""
+        if elo in self._alias_cache:
+            return self._alias_cache[elo]
+        p = self.pair_probs(elo)
+        table = stats_pentanomial.alias_table(p[0] + p[1] + p[2])
+        self._alias_cache[elo] = table
+        return table
+
+    def pick(self, elo, rng=random):
+        """
+Returns the outcomes (i,j) of a game pair. The joint distribution
+of (i,j) is sampled in constant time using an alias table which
+is computed once for every elo.
+rng is a random number generator with the same interface as the
+random module (e.g. an instance of random.Random).
+"""
+        k = stats_pentanomial.alias_pick(self._alias_table(elo), rng=rng)
+        return k // 3, k % 3
+
+    def pick_many(self, elo, n, rng=None):
+        """
+Vectorized version of pick(). Returns two integer arrays i, j of
+length n containing the outcomes of n game pairs. rng is a numpy
+random Generator.
+"""
+        if rng is None:
+            rng = np.random.default_rng()
+        prob, alias = self._alias_table(elo)
+        u = 9 * rng.random(n)
+        k = u.astype(np.intp)
+        k = np.where(u - k < np.take(prob, k), k, np.take(alias, k))
+        return k // 3, k % 3
 
     def draw_elo(self):
         return self._draw_elo
@@ -168,5 +473,8 @@ the current context.
     def biases(self):
         return self._biases
 
+    def weights(self):
+        return self._weights
+
 
 LTC_defaults = context(draw_elo=327, biases=[-90, 200])
@@ -0,0 +1,65 @@
+from __future__ import division
+import sys, json, collections
+
+"""
+Opt-in counters for the numerical hot paths.
+
+Instrumentation is off by default. The instrumented code guards every
+update with a test of the module variable "enabled", so the overhead
+is negligible when it is off:
+
+    if instrument.enabled:
+        instrument.counters["module.function.event"] += 1
+
+    import instrument
+    instrument.enable()
+    ...
+    instrument.report()  # or instrument.dump()
+    instrument.reset()
+
+The counters are per process. Those of worker processes are not
+collected.
+"""
+
+enabled = False
+counters = collections.Counter()
+
+
+def enable(on=True):
+    global enabled
+    enabled = on
+
+
+def reset():
+    counters.clear()
+
+
+def dump():
+    """
+The counters as a dictionary. For every pair of counters "x.hits" and
+"x.misses" the hit ratio is added as "x.hit_ratio".
+"""
+    ret = dict(sorted(counters.items()))
+    for name in list(ret):
+        if name.endswith(".hits"):
+            base = name[: -len(".hits")]
+            total = ret[name] + ret.get(base + ".misses", 0)
+            ret[base + ".hit_ratio"] = ret[name] / total
+    return dict(sorted(ret.items()))
+
+
+def report(file=None, format="text"):
+    """
+Writes dump() as text (one counter per line) or as JSON.
+"""
+    if file is None:
+        file = sys.stdout
+    d = dump()
+    if format == "json":
+        print(json.dumps(d), file=file)
+        return
+    for name, value in d.items():
+        if isinstance(value, float):
+            print("%-40s %.4f" % (name, value), file=file)
+        else:
+            print("%-40s %d" % (name, value), file=file)
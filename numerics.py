@@ -0,0 +1,134 @@
+from __future__ import division
+
+import math, sys
+
+import numpy as np
+
+"""
+The few numerical routines we used to take from scipy. Importing
+scipy takes much longer than most of our computations, so we avoid it
+in the modules which are loaded by the command line tools and by the
+worker processes.
+
+brentq() is a transcription of the C implementation in scipy
+(scipy/optimize/Zeros/brentq.c), so it performs exactly the same
+iterations and returns the same roots. It has the same signature as
+scipy.optimize.brentq.
+"""
+
+_rtol = 4 * sys.float_info.epsilon
+
+
+class RootResults:
+    """
+A subset of scipy.optimize.RootResults.
+"""
+
+    def __init__(self, root, iterations, function_calls, converged):
+        self.root = root
+        self.iterations = iterations
+        self.function_calls = function_calls
+        self.converged = converged
+        self.flag = "converged" if converged else "convergence error"
+
+    def __repr__(self):
+        return (
+            "RootResults(root=%r, iterations=%d, function_calls=%d, converged=%r)"
+            % (self.root, self.iterations, self.function_calls, self.converged)
+        )
+
+
+def brentq(
+    f, a, b, args=(), xtol=2e-12, rtol=_rtol, maxiter=100, full_output=False, disp=True,
+):
+    """
+Finds a root of f in the interval [a,b] using Brent's method. f(a) and
+f(b) must have different signs. If full_output is true the return
+value is a pair (root, RootResults). If disp is true a RuntimeError
+is raised when the method does not converge in maxiter iterations.
+"""
+    if xtol <= 0:
+        raise ValueError("xtol too small (%g <= 0)" % xtol)
+    if rtol < _rtol:
+        raise ValueError("rtol too small (%g < %g)" % (rtol, _rtol))
+    xpre, xcur = float(a), float(b)
+    xblk = fblk = spre = scur = 0.0
+    fpre = f(xpre, *args)
+    fcur = f(xcur, *args)
+    funcalls = 2
+    iterations = 0
+    converged = True
+    if fpre == 0:
+        xcur = xpre
+    elif fcur == 0:
+        pass
+    elif (fpre < 0) == (fcur < 0):
+        raise ValueError("f(a) and f(b) must have different signs")
+    else:
+        converged = False
+        for iterations in range(1, maxiter + 1):
+            if fpre != 0 and fcur != 0 and (fpre < 0) != (fcur < 0):
+                xblk = xpre
+                fblk = fpre
+                spre = scur = xcur - xpre
+            if abs(fblk) < abs(fcur):
+                xpre, xcur, xblk = xcur, xblk, xcur
+                fpre, fcur, fblk = fcur, fblk, fcur
+            delta = (xtol + rtol * abs(xcur)) / 2
+            sbis = (xblk - xcur) / 2
+            if fcur == 0 or abs(sbis) < delta:
+                converged = True
+                break
+            if abs(spre) > delta and abs(fcur) < abs(fpre):
+                if xpre == xblk:
+                    # interpolate
+                    stry = -fcur * (xcur - xpre) / (fcur - fpre)
+                else:
+                    # extrapolate
+                    dpre = (fpre - fcur) / (xpre - xcur)
+                    dblk = (fblk - fcur) / (xblk - xcur)
+                    stry = (
+                        -fcur
+                        * (fblk * dblk - fpre * dpre)
+                        / (dblk * dpre * (fblk - fpre))
+                    )
+                if 2 * abs(stry) < min(abs(spre), 3 * abs(sbis) - delta):
+                    # good short step
+                    spre = scur
+                    scur = stry
+                else:
+                    # bisect
+                    spre = scur = sbis
+            else:
+                # bisect
+                spre = scur = sbis
+            xpre, fpre = xcur, fcur
+            if abs(scur) > delta:
+                xcur += scur
+            else:
+                xcur += delta if sbis > 0 else -delta
+            fcur = f(xcur, *args)
+            funcalls += 1
+    if not converged and disp:
+        raise RuntimeError(
+            "Failed to converge after %d iterations, value is %s" % (iterations, xcur)
+        )
+    if full_output:
+        return xcur, RootResults(xcur, iterations, funcalls, converged)
+    return xcur
+
+
+def isscalar(x):
+    return isinstance(x, (float, int)) or np.ndim(x) == 0
+
+
+_erfc = np.frompyfunc(math.erfc, 1, 1)
+
+
+def Phi(x):
+    """
+Cumulative standard normal distribution.
+"""
+    if isscalar(x):
+        return math.erfc(-x / math.sqrt(2)) / 2
+    return _erfc(-np.asarray(x, dtype=float) / math.sqrt(2)).astype(float) / 2
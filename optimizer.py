@@ -0,0 +1,270 @@
+from __future__ import division
+
+import math, argparse
+
+import numpy as np
+
+import context
+import sprta5
+
+"""
+Chooses the SPRT parameters elo0, elo1, alpha and beta which minimize
+the expected number of games, averaged over a prior on the actual elo,
+subject to a maximal probability of a false positive at fp_elo and of a
+false negative at fn_elo.
+
+The characteristics are computed with the random walk approximation of
+sprta5 (see SPRT.characteristics_probs()). The pentanomial probabilities
+at the elos of the prior do not depend on the design, so they are
+computed only once. The search uses SLSQP from scipy, with gradients
+obtained by finite differences from cached evaluations.
+"""
+
+
+class design_problem:
+    def __init__(
+        self,
+        context,
+        elos,
+        weights=None,
+        fp_elo=0.0,
+        max_fp=0.05,
+        fn_elo=5.0,
+        max_fn=0.05,
+        mode="pentanomial",
+        elo_model="logistic",
+    ):
+        """
+elos and weights describe the prior on the actual elo (by default all
+elos have the same weight).
+"""
+        # the table is built on a copy, see sprta5.SPRT.characteristics_curve()
+        self.context = context.with_table()
+        self.elos = np.asarray(elos, dtype=float)
+        if weights is None:
+            weights = np.ones(len(self.elos))
+        weights = np.asarray(weights, dtype=float)
+        self.weights = weights / weights.sum()
+        self.fp_elo, self.max_fp = fp_elo, max_fp
+        self.fn_elo, self.max_fn = fn_elo, max_fn
+        self.mode = mode
+        self.elo_model = elo_model
+        self.evaluations = 0
+        self._cache = {}
+        self._gradients = {}
+        self.probs = self.sprt(self.x0()).curve_probs(
+            np.concatenate((self.elos, [fp_elo, fn_elo]))
+        )
+
+    def x0(self):
+        """
+The natural starting point: the test of fp_elo versus fn_elo with the
+maximal error probabilities. The variables are (elo0, elo1,
+log(alpha), log(beta)).
+"""
+        return np.array(
+            [self.fp_elo, self.fn_elo, math.log(self.max_fp), math.log(self.max_fn)]
+        )
+
+    def sprt(self, x):
+        elo0, elo1, log_alpha, log_beta = x
+        return sprta5.SPRT(
+            alpha=math.exp(log_alpha),
+            beta=math.exp(log_beta),
+            elo0=elo0,
+            elo1=elo1,
+            context=self.context,
+            mode=self.mode,
+            elo_model=self.elo_model,
+        )
+
+    def values(self, x):
+        """
+A triple (expected number of games, probability of a false positive
+at fp_elo, probability of a false negative at fn_elo).
+"""
+        key = tuple([float(v) for v in x])
+        if key not in self._cache:
+            self.evaluations += 1
+            prob_H1, E = self.sprt(key).characteristics_probs(self.probs)
+            self._cache[key] = np.array(
+                [np.dot(self.weights, E[:-2]), prob_H1[-2], 1 - prob_H1[-1]]
+            )
+        return self._cache[key]
+
+    def gradients(self, x, h=1e-6):
+        """
+The Jacobian of values() (by forward differences).
+"""
+        key = tuple([float(v) for v in x])
+        if key not in self._gradients:
+            v = self.values(x)
+            jac = np.empty((3, 4))
+            for k in range(0, 4):
+                y = np.array(key)
+                y[k] += h
+                jac[:, k] = (self.values(y) - v) / h
+            self._gradients[key] = jac
+        return self._gradients[key]
+
+
+def optimize(problem, x0=None, min_width=0.5, min_error=1e-4, max_error=0.5):
+    """
+Minimizes the expected number of games of problem (a design_problem).
+elo1-elo0 is kept at least min_width and alpha, beta between min_error
+and max_error. Returns a dictionary with the optimal design.
+"""
+    import scipy.optimize  # slow to import and only needed here
+
+    if x0 is None:
+        x0 = problem.x0()
+    scale = problem.values(x0)[0]
+    max_fp, max_fn = problem.max_fp, problem.max_fn
+    constraints = [
+        {
+            "type": "ineq",
+            "fun": lambda x: (max_fp - problem.values(x)[1]) / max_fp,
+            "jac": lambda x: -problem.gradients(x)[1] / max_fp,
+        },
+        {
+            "type": "ineq",
+            "fun": lambda x: (max_fn - problem.values(x)[2]) / max_fn,
+            "jac": lambda x: -problem.gradients(x)[2] / max_fn,
+        },
+        {
+            "type": "ineq",
+            "fun": lambda x: x[1] - x[0] - min_width,
+            "jac": lambda x: np.array([-1.0, 1.0, 0.0, 0.0]),
+        },
+    ]
+    log_bounds = (math.log(min_error), math.log(max_error))
+    res = scipy.optimize.minimize(
+        lambda x: problem.values(x)[0] / scale,
+        x0,
+        jac=lambda x: problem.gradients(x)[0] / scale,
+        method="SLSQP",
+        bounds=[(None, None), (None, None), log_bounds, log_bounds],
+        constraints=constraints,
+        options={"ftol": 1e-9, "maxiter": 200},
+    )
+    expected, fp, fn = problem.values(res.x)
+    return {
+        "elo0": res.x[0],
+        "elo1": res.x[1],
+        "alpha": math.exp(res.x[2]),
+        "beta": math.exp(res.x[3]),
+        "expected": expected,
+        "fp": fp,
+        "fn": fn,
+        "success": bool(res.success),
+        "message": res.message,
+        "evaluations": problem.evaluations,
+    }
+
+
+if __name__ == "__main__":
+    defaults = context.LTC_defaults
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument(
+        "--elo",
+        help="elos of the prior on the actual elo",
+        type=float,
+        nargs="+",
+        required=True,
+    )
+    parser.add_argument(
+        "--prior",
+        help="weights of the elos of the prior (default: equal weights)",
+        type=float,
+        nargs="+",
+        default=None,
+    )
+    parser.add_argument(
+        "--fp_elo",
+        help="elo at which false positives are counted",
+        type=float,
+        default=0.0,
+    )
+    parser.add_argument(
+        "--max_fp",
+        help="maximal probability of a false positive",
+        type=float,
+        default=0.05,
+    )
+    parser.add_argument(
+        "--fn_elo",
+        help="elo at which false negatives are counted",
+        type=float,
+        default=5.0,
+    )
+    parser.add_argument(
+        "--max_fn",
+        help="maximal probability of a false negative",
+        type=float,
+        default=0.05,
+    )
+    parser.add_argument(
+        "--draw_elo", help="draw_elo", type=float, default=defaults.draw_elo()
+    )
+    parser.add_argument(
+        "--biases",
+        help="biases (expressed in BayesElo)",
+        type=float,
+        nargs="+",
+        default=defaults.biases(),
+    )
+    parser.add_argument(
+        "--book",
+        help="file with the biases (and optionally weights), see context.load_book()",
+        default=None,
+    )
+    parser.add_argument(
+        "--mode",
+        help="'trinomial' or 'pentanomial'",
+        choices=["trinomial", "pentanomial"],
+        default="pentanomial",
+    )
+    parser.add_argument(
+        "--elo_model",
+        help="logistic or normalized",
+        choices=["logistic", "normalized"],
+        default="logistic",
+    )
+    args = parser.parse_args()
+    if args.prior is not None and len(args.prior) != len(args.elo):
+        parser.error("--prior needs one weight for every value of --elo")
+    biases, weights = args.biases, None
+    if args.book is not None:
+        biases, weights = context.load_book(args.book)
+    c = context.context(args.draw_elo, biases, weights)
+    problem = design_problem(
+        c,
+        args.elo,
+        args.prior,
+        fp_elo=args.fp_elo,
+        max_fp=args.max_fp,
+        fn_elo=args.fn_elo,
+        max_fn=args.max_fn,
+        mode=args.mode,
+        elo_model=args.elo_model,
+    )
+    expected, fp, fn = problem.values(problem.x0())
+    print(
+        "start        : elo0=%.2f elo1=%.2f alpha=%.4f beta=%.4f"
+        % (args.fp_elo, args.fn_elo, args.max_fp, args.max_fn)
+    )
+    print("               expected=%.0f fp=%.4f fn=%.4f" % (expected, fp, fn))
+    r = optimize(problem)
+    print(
+        "optimum      : elo0=%.2f elo1=%.2f alpha=%.4f beta=%.4f"
+        % (r["elo0"], r["elo1"], r["alpha"], r["beta"])
+    )
+    print(
+        "               expected=%.0f fp=%.4f fn=%.4f (%+.1f%%)"
+        % (r["expected"], r["fp"], r["fn"], 100 * (r["expected"] / expected - 1))
+    )
+    print("evaluations  : %d" % r["evaluations"])
+    if not r["success"]:
+        print("warning      : %s" % r["message"])
@@ -2,6 +2,10 @@ from __future__ import division
 
 import math, sys
 
+import numpy as np
+
+import instrument
+
 
 def _aux(x):
     """
@@ -36,6 +40,42 @@ _aux2(x).
         return (_aux(x) - 2 * _aux2(x)) / x
 
 
+def _aux_(x):
+    """
+Vectorized version of _aux.
+"""
+    with np.errstate(over="ignore", invalid="ignore"):
+        return np.where(
+            np.abs(x) < 1e-4,
+            x / 2 + x ** 2 / 6 + x ** 3 / 24 + x ** 4 / 120,
+            np.expm1(x) / x - 1,
+        )
+
+
+def _aux2_(x):
+    """
+Vectorized version of _aux2.
+"""
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        return np.where(
+            np.abs(x) < 1e-3,
+            x / 6 + x ** 2 / 24 + x ** 3 / 120 + x ** 4 / 720,
+            (np.expm1(x) - x - x * x / 2) / (x * x),
+        )
+
+
+def _paux2_(x):
+    """
+Vectorized version of _paux2.
+"""
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        return np.where(
+            np.abs(x) < 1e-4,
+            1 / 6 + x / 12 + x ** 2 / 40 + x ** 3 / 180,
+            (_aux_(x) - 2 * _aux2_(x)) / x,
+        )
+
+
 class RandomWalk:
     def __init__(self, a, b, jumps):
         """
@@ -67,6 +107,8 @@ of a list of tuples (jump,probablity).
             )
             gp = e * tp + t
             e -= g / gp
+            if instrument.enabled:
+                instrument.counters["RandomWalk._e.newton_steps"] += 1
         return e
 
     def characteristics(self):
@@ -84,3 +126,163 @@ of a list of tuples (jump,probablity).
             / (b - a + b * _aux(h * b) - a * _aux(h * a))
         )
         return prob_H1, E
+
+
+class RandomWalks:
+    def __init__(self, a, b, jumps, probs):
+        """
+Vectorized version of RandomWalk for m random walks at once.
+jumps and probs are arrays of shape (m,k) such that the jump
+distribution of the i'th walk consists of the jumps jumps[i]
+with probabilities probs[i]. The boundaries a and b are scalars
+or arrays of length m.
+"""
+        self.jumps = np.asarray(jumps, dtype=float)
+        self.probs = np.asarray(probs, dtype=float)
+        m = self.jumps.shape[0]
+        self.a = np.broadcast_to(np.asarray(a, dtype=float), (m,))
+        self.b = np.broadcast_to(np.asarray(b, dtype=float), (m,))
+        self.mu = (self.probs * self.jumps).sum(axis=1)
+        self.m2 = (self.probs * self.jumps * self.jumps).sum(axis=1)
+
+    def _e(self):
+        """
+Newton iteration as in RandomWalk._e, acting only on the
+entries which have not converged yet.
+"""
+        e = -2 / self.m2
+        todo = np.arange(len(e))
+        mu, m2, jumps, probs = self.mu, self.m2, self.jumps, self.probs
+        for _ in range(100):
+            e_ = e[todo]
+            mu_ = mu[:, None]
+            t = m2 / 2 + (
+                probs * jumps * jumps * _aux2_(e_[:, None] * mu_ * jumps)
+            ).sum(axis=1)
+            g = 1 + e_ * t
+            done = np.abs(g * mu) < 1e-12  # adhoc stopping condition
+            if done.all():
+                break
+            keep = ~done
+            todo = todo[keep]
+            mu, m2, jumps, probs = mu[keep], m2[keep], jumps[keep], probs[keep]
+            e_, t, g, mu_ = e_[keep], t[keep], g[keep], mu_[keep]
+            tp = (
+                probs * jumps * jumps * jumps * mu_ * _paux2_(e_[:, None] * mu_ * jumps)
+            ).sum(axis=1)
+            gp = e_ * tp + t
+            e[todo] = e_ - g / gp
+            if instrument.enabled:
+                instrument.counters["RandomWalk._e.newton_steps"] += len(todo)
+        else:
+            assert False
+        return e
+
+    def characteristics(self):
+        """
+Arrays with the values of RandomWalk.characteristics() for all walks.
+"""
+        a = self.a
+        b = self.b
+        mu = self.mu
+        e = self._e()
+        h = e * mu
+        denom = b - a + b * _aux_(h * b) - a * _aux_(h * a)
+        prob_H1 = -(a + a * _aux_(h * a)) / denom
+        E = e * a * b * (b / 2 - a / 2 + b * _aux2_(h * b) - a * _aux2_(h * a)) / denom
+        return prob_H1, E
+
+
+class DiscretizedRandomWalk:
+    def __init__(self, a, b, jumps, points=2000):
+        """
+Same arguments as RandomWalk. Instead of the Brownian approximation we
+compute the distribution of a discretized walk step by step. The
+interval (a,b) is replaced by "points" equally spaced grid points and
+every jump is split between the two neighbouring multiples of the
+grid spacing, with weights chosen such that the mean is preserved.
+Every step is a sparse matrix-vector product with about
+points*2*len(jumps) nonzero entries.
+"""
+        self.a = a
+        self.b = b
+        self.jumps = jumps
+        self.points = points
+        self.h = (b - a) / (points + 1)  # grid point i is a+(i+1)*h
+
+    def _transitions(self):
+        """
+The transition matrix of the discretized walk as a sparse matrix
+of shape (points+2,points). Row 0 collects the mass absorbed at a,
+row points+1 the mass absorbed at b and the other rows correspond to
+the grid points.
+"""
+        import scipy.sparse  # slow to import and only needed here
+
+        M = self.points
+        offsets, weights = [], []
+        for jump, prob in self.jumps:
+            x = jump / self.h
+            k = int(math.floor(x))
+            offsets += [k, k + 1]
+            weights += [(1 - (x - k)) * prob, (x - k) * prob]
+        cols = np.tile(np.arange(M), len(offsets))
+        rows = np.clip(cols + np.repeat(offsets, M), -1, M) + 1
+        data = np.repeat(weights, M)
+        return scipy.sparse.coo_matrix((data, (rows, cols)), shape=(M + 2, M)).tocsr()
+
+    def _start(self):
+        """
+The initial distribution. The walk starts at 0 which is also split
+between the two neighbouring grid points.
+"""
+        x = -self.a / self.h - 1
+        k = int(math.floor(x))
+        v = np.zeros(self.points)
+        v[k] += 1 - (x - k)
+        v[k + 1] += x - k
+        return v
+
+    def distribution(self, tol=1e-12, max_steps=None):
+        """
+Returns a pair of arrays (pass_pmf, fail_pmf) where pass_pmf[n]
+(resp. fail_pmf[n]) is the probability that the walk exits through
+b (resp. a) at step n. The propagation stops when the mass which
+has not been absorbed drops below tol, or after max_steps steps.
+Every step is a separate sparse matrix-vector product, so this is
+slow for long walks (roughly a million steps per 15 seconds with
+the default number of points).
+"""
+        T = self._transitions()
+        v = self._start()
+        pass_pmf = [0.0]
+        fail_pmf = [0.0]
+        n = 0
+        while max_steps is None or n < max_steps:
+            out = T @ v
+            fail_pmf.append(out[0])
+            pass_pmf.append(out[-1])
+            v = out[1:-1]
+            n += 1
+            if n % 64 == 0 and v.sum() < tol:
+                break
+        return np.array(pass_pmf), np.array(fail_pmf)
+
+    def characteristics(self):
+        """
+Returns a pair (prob_H1, E) like RandomWalk.characteristics(). With Q
+the transition matrix restricted to the grid points and v the initial
+distribution, u=(I-Q)^(-1)v is the expected number of visits to every
+grid point. So E is the sum of u and prob_H1 is the mass u sends to b.
+Both follow from a single sparse solve, independently of the length of
+the walk.
+"""
+        import scipy.sparse, scipy.sparse.linalg
+
+        T = self._transitions()
+        Q = T[1:-1]
+        identity = scipy.sparse.identity(self.points, format="csr")
+        u = scipy.sparse.linalg.spsolve((identity - Q).tocsc(), self._start())
+        prob_H1 = T[-1] @ u
+        E = u.sum()
+        return float(prob_H1[0]), float(E)
@@ -0,0 +1,213 @@
+from __future__ import division
+import os, json, argparse
+
+import numpy as np
+
+import stats
+
+"""
+An append-only store for the individual runs of LLRsimulate.
+
+A store is a directory with one file per column, containing the raw
+little endian values of fixed width, and a file meta.json with the
+number of records. The records are written in bulk and meta.json is
+replaced (atomically) afterwards, so the count in meta.json is always
+that of complete records. Data beyond it (from an interrupted write)
+is discarded when the store is opened again for appending.
+
+The columns are read with numpy.memmap, so even a store with tens of
+millions of runs is opened instantly.
+
+    s = runstore("runs", "a")
+    s.append(runs, elo)  # runs as returned by LLRsimulate.run()
+    s.flush()
+    c = runstore("runs").columns()
+    c["length"][c["status"] == 1].mean()
+"""
+
+# (name, dtype) of the columns. The names match the output of
+# LLRsimulate.run(), true_elo is the elo for which the test was
+# simulated and status is 1 for H1 and 0 for H0.
+columns_ = (
+    ("true_elo", "<f8"),
+    ("status", "u1"),
+    ("length", "<i8"),
+    ("LLR", "<f8"),
+    ("results", "<u4"),  # one entry per category (3 or 5), see meta["width"]
+    ("elo_l", "<f8"),
+    ("elo", "<f8"),
+    ("elo_u", "<f8"),
+    ("weight", "<f8"),
+)
+
+
+class runstore:
+    def __init__(self, path, mode="r", width=5, buffer_size=65536):
+        """
+mode is "r" (read only) or "a" (append, the store is created if
+necessary). width is the number of result categories (3 for trinomial
+and 5 for pentanomial tests) of a new store. Appended runs are buffered
+until there are buffer_size of them (or until flush()).
+"""
+        assert mode in ("r", "a")
+        self.path = path
+        self.mode = mode
+        self.buffer_size = buffer_size
+        self._buffer = []
+        meta = os.path.join(path, "meta.json")
+        if os.path.exists(meta):
+            with open(meta) as f:
+                self.meta = json.load(f)
+        elif mode == "a":
+            os.makedirs(path, exist_ok=True)
+            self.meta = {"version": 1, "count": 0, "width": width}
+            self._write_meta()
+        else:
+            raise IOError("%s is not a run store" % path)
+        if mode == "a":
+            self.truncate(self.meta["count"])
+
+    def __len__(self):
+        return self.meta["count"]
+
+    def _file(self, name):
+        return os.path.join(self.path, name + ".bin")
+
+    def _shape(self, name, n):
+        return (n, self.meta["width"]) if name == "results" else (n,)
+
+    def _write_meta(self):
+        meta = os.path.join(self.path, "meta.json")
+        with open(meta + ".tmp", "w") as f:
+            json.dump(self.meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(meta + ".tmp", meta)
+
+    def truncate(self, n):
+        """
+Keeps only the first n records.
+"""
+        assert self.mode == "a" and n <= self.meta["count"]
+        self.meta["count"] = n
+        self._write_meta()
+        for name, dtype in columns_:
+            size = np.dtype(dtype).itemsize * int(np.prod(self._shape(name, n)))
+            with open(self._file(name), "ab") as f:
+                f.truncate(size)
+
+    def append(self, runs, elo):
+        """
+Appends the output of LLRsimulate.run() for a list of tests simulated
+for the given elo.
+"""
+        assert self.mode == "a"
+        self._buffer.extend([(elo,) + tuple(r) for r in runs])
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if len(self._buffer) == 0:
+            return
+        rows = list(zip(*self._buffer))
+        rows[1] = [s == "H1" for s in rows[1]]
+        for (name, dtype), values in zip(columns_, rows):
+            a = np.array(values, dtype=dtype)
+            assert a.shape == self._shape(name, len(self._buffer))
+            with open(self._file(name), "ab") as f:
+                a.tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+        self.meta["count"] += len(self._buffer)
+        self._buffer = []
+        self._write_meta()
+
+    def close(self):
+        if self.mode == "a":
+            self.flush()
+
+    def columns(self, names=None):
+        """
+A dictionary of (read only) memory mapped arrays with the columns
+in names (default: all).
+"""
+        n = self.meta["count"]
+        ret = {}
+        for name, dtype in columns_:
+            if names is not None and name not in names:
+                continue
+            if n == 0:
+                ret[name] = np.empty(self._shape(name, 0), dtype=dtype)
+            else:
+                ret[name] = np.memmap(
+                    self._file(name), dtype=dtype, mode="r", shape=self._shape(name, n)
+                )
+        return ret
+
+    def query(self, where=None, names=None):
+        """
+The columns in names of the records selected by where, which is a
+function mapping the dictionary of all columns to a boolean array.
+
+    s.query(lambda c: (c["status"] == 1) & (c["true_elo"] == 0), ["length"])
+"""
+        c = self.columns()
+        mask = slice(None) if where is None else where(c)
+        return dict(
+            [
+                (k, np.asarray(v[mask]))
+                for k, v in c.items()
+                if names is None or k in names
+            ]
+        )
+
+    def aggregate(self, value, by="true_elo", where=None, weighted=False):
+        """
+A dictionary mapping every distinct value of the column "by" to a
+stats.stats accumulator for the column (or function of the columns)
+"value" over the records selected by where (see query()). If weighted
+is true the values are multiplied by the importance sampling weights,
+as in LLRsimulate.summarize().
+"""
+        c = self.query(where)
+        x = value(c) if callable(value) else c[value]
+        x = np.asarray(x, dtype=float)
+        if weighted:
+            x = x * c["weight"]
+        ret = {}
+        keys = c[by]
+        for key in np.unique(keys):
+            s = stats.stats()
+            s.add_many(x[keys == key])
+            ret[key.item()] = s
+        return ret
+
+    def histogram(self, name, bins=50, where=None, weighted=False):
+        """
+numpy.histogram() of a column over the records selected by where.
+"""
+        c = self.query(where)
+        return np.histogram(
+            c[name], bins=bins, weights=c["weight"] if weighted else None
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("store", help="directory of the store")
+    parser.add_argument(
+        "--value", help="column to aggregate by true elo", default="length",
+    )
+    parser.add_argument(
+        "--weighted",
+        help="multiply the values by the importance sampling weights",
+        action="store_true",
+    )
+    args = parser.parse_args()
+    s = runstore(args.store)
+    print("runs         : %d" % len(s))
+    for elo, a in sorted(s.aggregate(args.value, weighted=args.weighted).items()):
+        l, m, u = a.ci_mean()
+        print("elo=%-8.2f  n=%-9d %s=%.4f[%.4f,%.4f]" % (elo, a.n, args.value, m, l, u))
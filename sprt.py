@@ -1,9 +1,11 @@
 from __future__ import division
-import math, copy
+import math, copy, sys, json, csv, itertools, collections
 import argparse
+import concurrent.futures
 from brownian import Brownian
-import scipy
 import LLRcalc
+import instrument
+import numerics
 
 
 class sprt:
@@ -49,6 +51,7 @@ For external use. "elo" is expressed in our current elo_model.
             else:
                 assert False
         self.s0, self.s1 = [self.elo_to_score(elo) for elo in (self.elo0, self.elo1)]
+        self._outcome_probs = {}
 
         mu_LLR, var_LLR = self.LLR_drift_variance(self.pdf, self.s0, self.s1, None)
 
@@ -72,59 +75,230 @@ For external use. "elo" is expressed in our current elo_model.
         """
 The probability of a test with the given elo with worse outcome
 (faster fail, slower pass or a pass changed into a fail).
+
+The values are cached until the next call of set_state().
 """
+        if elo in self._outcome_probs:
+            return self._outcome_probs[elo]
         s = LLRcalc.L_(elo)
         mu_LLR, var_LLR = self.LLR_drift_variance(self.pdf, self.s0, self.s1, s)
         sigma_LLR = math.sqrt(var_LLR)
-        return Brownian(a=self.a, b=self.b, mu=mu_LLR, sigma=sigma_LLR).outcome_cdf(
+        prob = Brownian(a=self.a, b=self.b, mu=mu_LLR, sigma=sigma_LLR).outcome_cdf(
             T=self.T, y=self.llr
         )
+        self._outcome_probs[elo] = prob
+        return prob
 
     def lower_cb(self, p):
         """
 Maximal elo value such that the observed outcome of the test has probability
 less than p.
+"""
+        return self.lower_cbs([p])[0]
+
+    def lower_cbs(self, ps):
+        """
+Same as lower_cb() but for a list of probabilities.
+
+The roots are found together. The bracketing interval is shared and
+since outcome_prob() is monotone in elo, every evaluation made
+while solving for one probability narrows the bracket for the others.
 """
         avg_elo = (self.elo0 + self.elo1) / 2
         delta = self.elo1 - self.elo0
+        targets = [1 - p for p in ps]
         N = 30
         # Various error conditions must be handled better here!
         while True:
             elo0 = max(avg_elo - N * delta, -1000)
             elo1 = min(avg_elo + N * delta, 1000)
-            try:
-                sol, res = scipy.optimize.brentq(
-                    lambda elo: self.outcome_prob(elo) - (1 - p),
-                    elo0,
-                    elo1,
-                    full_output=True,
-                    disp=False,
-                )
-            except ValueError:
-                if elo0 > -1000 or elo1 < 1000:
-                    N *= 2
-                    continue
-                else:
-                    if self.outcome_prob(elo0) - (1 - p) > 0:
-                        return elo1
-                    else:
-                        return elo0
+            f0 = self.outcome_prob(elo0)
+            f1 = self.outcome_prob(elo1)
+            if elo0 == -1000 and elo1 == 1000:
+                break
+            if all([(f0 - t) * (f1 - t) <= 0 for t in targets]):
+                break
+            N *= 2
+        ret = []
+        for t in targets:
+            if (f0 - t) * (f1 - t) > 0:
+                ret.append(elo1 if f0 - t > 0 else elo0)
+                continue
+            # the tightest bracket from the evaluations so far
+            points = sorted(
+                [(x, f) for x, f in self._outcome_probs.items() if elo0 <= x <= elo1]
+            )
+            for k in range(0, len(points) - 1):
+                (x0, y0), (x1, y1) = points[k], points[k + 1]
+                if (y0 - t) * (y1 - t) <= 0:
+                    break
+            sol, res = numerics.brentq(
+                lambda elo: self.outcome_prob(elo) - t,
+                x0,
+                x1,
+                full_output=True,
+                disp=False,
+            )
             assert res.converged
-            break
-        return sol
+            if instrument.enabled:
+                instrument.counters["sprt.lower_cb.brentq_calls"] += 1
+                instrument.counters["sprt.lower_cb.brentq_iterations"] += res.iterations
+            ret.append(sol)
+        return ret
 
-    def analytics(self, p=0.05):
+    def analytics(self, p=0.05, fields=None):
+        """
+fields is an optional list of the keys of the returned dictionary
+which are wanted (e.g. ["LOS"]). Only those are computed.
+"""
+        if fields is None:
+            fields = ("clamped", "a", "b", "elo", "ci", "LOS", "LLR")
         ret = {}
-        ret["clamped"] = self.clamped
-        ret["a"] = self.a
-        ret["b"] = self.b
-        ret["elo"] = self.lower_cb(0.5)
-        ret["ci"] = [self.lower_cb(p / 2), self.lower_cb(1 - p / 2)]
-        ret["LOS"] = self.outcome_prob(0)
-        ret["LLR"] = self.llr
+        if "clamped" in fields:
+            ret["clamped"] = self.clamped
+        if "a" in fields:
+            ret["a"] = self.a
+        if "b" in fields:
+            ret["b"] = self.b
+        ps = []
+        if "elo" in fields:
+            ps.append(0.5)
+        if "ci" in fields:
+            ps += [p / 2, 1 - p / 2]
+        if len(ps) > 0:
+            cbs = self.lower_cbs(ps)
+            if "elo" in fields:
+                ret["elo"] = cbs.pop(0)
+            if "ci" in fields:
+                ret["ci"] = cbs
+        if "LOS" in fields:
+            ret["LOS"] = self.outcome_prob(0)
+        if "LLR" in fields:
+            ret["LLR"] = self.llr
         return ret
 
 
+# The parameters of a test which may be given per row in bulk mode.
+_bulk_params = ("alpha", "beta", "elo0", "elo1", "elo_model", "level")
+
+
+def analyze(row, defaults):
+    """
+Bulk mode. row is a dictionary with the frequencies under "results"
+and optionally the parameters in _bulk_params (otherwise those in the
+dictionary defaults are used). Returns the dictionary row updated
+with the output of analytics(), or with an "error" field.
+"""
+    if isinstance(row, dict) and "error" in row:
+        return dict(row)
+    ret = {}
+    try:
+        if not isinstance(row, dict):
+            raise TypeError("a row must be an object, not %s" % type(row).__name__)
+        ret = dict(row)
+        params = dict(defaults)
+        for k in _bulk_params:
+            if row.get(k) not in (None, ""):
+                params[k] = row[k] if k == "elo_model" else float(row[k])
+        if not 0 < params["level"] < 1:
+            raise ValueError("level must be between 0 and 1")
+        results = row["results"]
+        if isinstance(results, str):
+            results = [int(r) for r in results.split()]
+        if len(results) not in (3, 5):
+            raise ValueError("expected 3 or 5 frequencies")
+        s = sprt(
+            alpha=params["alpha"],
+            beta=params["beta"],
+            elo0=params["elo0"],
+            elo1=params["elo1"],
+            elo_model=params["elo_model"],
+        )
+        s.set_state(results)
+        ret.update(s.analytics(1 - params["level"]))
+    except Exception as e:
+        ret["error"] = "%s: %s" % (type(e).__name__, e)
+    return ret
+
+
+def _analyze_chunk(rows, defaults):
+    return [analyze(row, defaults) for row in rows]
+
+
+def bulk(rows, defaults, workers=0, chunk_size=100):
+    """
+Generator yielding analyze(row, defaults) for the rows of the iterable
+"rows", in order. If workers>0 the rows are analyzed in chunks by a pool
+of worker processes. Only a bounded number of chunks is in flight, so
+the memory use does not depend on the number of rows.
+"""
+    rows = iter(rows)
+    chunks = iter(lambda: list(itertools.islice(rows, chunk_size)), [])
+    if workers == 0:
+        for chunk in chunks:
+            for r in _analyze_chunk(chunk, defaults):
+                yield r
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(executor.submit(_analyze_chunk, chunk, defaults))
+            if len(pending) >= 2 * workers:
+                for r in pending.popleft().result():
+                    yield r
+        while pending:
+            for r in pending.popleft().result():
+                yield r
+
+
+def _json_rows(f):
+    for line in f:
+        if line.strip() == "":
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield {"error": "%s: %s" % (type(e).__name__, e)}
+
+
+def _csv_rows(reader):
+    for row in reader:
+        if None in row:
+            # csv.DictReader stores the extra fields under None
+            del row[None]
+            row["error"] = "ValueError: more fields than in the header"
+        yield row
+
+
+def _bulk_main(args, defaults):
+    f = sys.stdin if args.bulk == "-" else open(args.bulk, newline="")
+    fmt = args.format
+    if fmt is None:
+        fmt = "csv" if args.bulk.endswith(".csv") else "jsonl"
+    if fmt == "csv":
+        reader = csv.DictReader(f)
+        rows = _csv_rows(reader)
+        fields = ["elo", "ci_lower", "ci_upper", "LOS", "LLR", "clamped", "error"]
+        # an empty input has no header, the output has only our fields
+        columns = reader.fieldnames or []
+        fields = columns + [k for k in fields if k not in columns]
+        writer = csv.DictWriter(sys.stdout, fieldnames=fields)
+        writer.writeheader()
+    else:
+        rows = _json_rows(f)
+    for r in bulk(rows, defaults, workers=args.workers, chunk_size=args.chunk_size):
+        if fmt == "csv":
+            if "ci" in r:
+                r["ci_lower"], r["ci_upper"] = r.pop("ci")
+            for k in ("a", "b"):
+                r.pop(k, None)
+            writer.writerow(r)
+        else:
+            print(json.dumps(r))
+    if f is not sys.stdin:
+        f.close()
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -151,12 +325,52 @@ if __name__ == "__main__":
         help="trinomial of pentanomial frequencies, low to high",
         nargs="*",
         type=int,
-        required=True,
+    )
+    parser.add_argument(
+        "--bulk",
+        help="file (or - for stdin) with one test per row, see analyze()",
+        default=None,
+    )
+    parser.add_argument(
+        "--format",
+        help="format of the bulk input and output (default: from the file name)",
+        choices=["jsonl", "csv"],
+        default=None,
+    )
+    parser.add_argument(
+        "--workers", help="number of worker processes in bulk mode", type=int, default=0
+    )
+    parser.add_argument(
+        "--chunk_size",
+        help="number of rows per task for the worker processes",
+        type=int,
+        default=100,
+    )
+    parser.add_argument(
+        "--instrument", help="print the instrumentation counters", action="store_true"
     )
     args = parser.parse_args()
+    instrument.enable(args.instrument)
+    if args.bulk is not None:
+        defaults = {
+            "alpha": args.alpha,
+            "beta": args.beta,
+            "elo0": args.elo0,
+            "elo1": args.elo1,
+            "elo_model": args.elo_model,
+            "level": args.level,
+        }
+        _bulk_main(args, defaults)
+        if args.instrument:
+            instrument.report(file=sys.stderr)
+        sys.exit(0)
     results = args.results
+    if results is None:
+        parser.error("one of the arguments --results --bulk is required")
     if len(results) != 3 and len(results) != 5:
         parser.error("argument --results: expected 3 or 5 arguments")
+    if not 0 < args.level < 1:
+        parser.error("argument --level: must be between 0 and 1")
     alpha = args.alpha
     beta = args.beta
     elo0 = args.elo0
@@ -187,3 +401,7 @@ if __name__ == "__main__":
         "LLR [u,l]                   :  %.2f %s [%.2f,%.2f]"
         % (a["LLR"], "(clamped)" if a["clamped"] else "", a["a"], a["b"])
     )
+    if args.instrument:
+        print("Instrumentation")
+        print("===============")
+        instrument.report()
@@ -0,0 +1,259 @@
+from __future__ import division
+import json, argparse, asyncio
+import concurrent.futures
+
+import SPRT_pentanomial
+import sprt
+
+"""
+A long running service which keeps the SPRT state of many live tests
+in memory.
+
+The protocol consists of JSON objects, one per line, over TCP or a Unix
+socket. Every request has a field "op" and may have a field "tag" which
+is copied into the reply, so that replies (which are not necessarily
+sent in order, see "analytics") can be matched with requests.
+
+{"op": "create", "id": ..., "alpha": 0.05, "beta": 0.05, "elo0": 0, "elo1": 5,
+ "mode": "pentanomial", "elo_model": "logistic"}
+    Creates a test. All fields except "id" are optional.
+
+{"op": "update", "updates": [{"id": ..., "results": [...]}, ...]}
+    Adds frequencies (deltas) to one or more tests. The reply contains
+    the new state of each test under "tests". A single test may be
+    updated with {"op": "update", "id": ..., "results": [...]}.
+    The whole batch is checked before anything is applied, so a batch
+    with an error has no effect. The deltas for a test which has already
+    finished are discarded, which is indicated by "applied": false in
+    its state.
+
+{"op": "status", "id": ...}
+    The state (status, LLR, length, results) of a test.
+
+{"op": "analytics", "id": ..., "p": 0.05, "fields": [...]}
+    The output of sprt.analytics() for the current results. This is
+    computed in a pool of worker processes so that it does not delay
+    other requests.
+
+{"op": "delete", "id": ...}
+    Forgets a test.
+
+Errors (including lines which are not JSON objects) are reported as
+{"error": "..."}. A request may be up to line_limit bytes long, which is
+enough for a batch update of many thousands of tests. Longer lines are
+discarded with an error.
+"""
+
+line_limit = 16 * 2 ** 20
+
+
+def _analytics(params, results, p, fields):
+    s = sprt.sprt(
+        alpha=params["alpha"],
+        beta=params["beta"],
+        elo0=params["elo0"],
+        elo1=params["elo1"],
+        elo_model=params["elo_model"],
+    )
+    s.set_state(results)
+    return s.analytics(p, fields)
+
+
+class service:
+    def __init__(self, executor=None):
+        """
+executor is used for the analytics requests (None means the default
+executor of the event loop).
+"""
+        self.executor = executor
+        self.tests = {}
+
+    def state(self, id):
+        sp = self.tests[id]["sprt"]
+        return {
+            "id": id,
+            "status": sp.status(),
+            "LLR": sp.LLR(),
+            "length": sp.length(),
+            "results": sp.results(),
+        }
+
+    def create(self, msg):
+        id = msg["id"]
+        if id in self.tests:
+            raise ValueError("test %s exists" % id)
+        params = {
+            "alpha": msg.get("alpha", 0.05),
+            "beta": msg.get("beta", 0.05),
+            "elo0": msg.get("elo0", 0),
+            "elo1": msg.get("elo1", 5),
+            "mode": msg.get("mode", "pentanomial"),
+            "elo_model": msg.get("elo_model", "logistic"),
+        }
+        self.tests[id] = {
+            "params": params,
+            "sprt": SPRT_pentanomial.SPRT(**params),
+        }
+        return self.state(id)
+
+    def _check_update(self, u):
+        if not isinstance(u, dict):
+            raise ValueError("an update must be a JSON object")
+        if u.get("id") not in self.tests:
+            raise KeyError(u.get("id"))
+        results = u.get("results")
+        width = len(self.tests[u["id"]]["sprt"].results())
+        if (
+            not isinstance(results, list)
+            or len(results) != width
+            or not all(
+                [
+                    isinstance(r, int) and not isinstance(r, bool) and r >= 0
+                    for r in results
+                ]
+            )
+        ):
+            raise ValueError(
+                "results of %s must be %d non-negative integers" % (u["id"], width)
+            )
+
+    def update(self, msg):
+        updates = msg["updates"] if "updates" in msg else [msg]
+        if not isinstance(updates, list):
+            raise ValueError("updates must be a list")
+        # check everything first, so that a batch is applied entirely or not at all
+        for u in updates:
+            self._check_update(u)
+        ret = []
+        for u in updates:
+            applied = self.tests[u["id"]]["sprt"].add_results(u["results"])
+            state = self.state(u["id"])
+            state["applied"] = applied
+            ret.append(state)
+        return {"tests": ret}
+
+    def status(self, msg):
+        return self.state(msg["id"])
+
+    def delete(self, msg):
+        del self.tests[msg["id"]]
+        return {"id": msg["id"]}
+
+    async def analytics(self, msg):
+        test = self.tests[msg["id"]]
+        loop = asyncio.get_running_loop()
+        ret = await loop.run_in_executor(
+            self.executor,
+            _analytics,
+            test["params"],
+            list(test["sprt"].results()),
+            msg.get("p", 0.05),
+            msg.get("fields"),
+        )
+        ret["id"] = msg["id"]
+        return ret
+
+    async def _reply(self, writer, lock, msg, error=None):
+        try:
+            if error is not None:
+                raise ValueError(error)
+            if msg is None:
+                raise ValueError("invalid JSON")
+            if not isinstance(msg, dict):
+                raise ValueError("a request must be a JSON object")
+            op = msg["op"]
+            if op == "analytics":
+                ret = await self.analytics(msg)
+            elif op in ("create", "update", "status", "delete"):
+                ret = getattr(self, op)(msg)
+            else:
+                raise ValueError("unknown op %s" % op)
+        except Exception as e:
+            ret = {"error": "%s: %s" % (type(e).__name__, e)}
+        if isinstance(msg, dict) and "tag" in msg:
+            ret["tag"] = msg["tag"]
+        async with lock:
+            writer.write((json.dumps(ret) + "\n").encode())
+            await writer.drain()
+
+    async def handle(self, reader, writer):
+        lock = asyncio.Lock()
+        pending = set()
+        while True:
+            try:
+                line = await reader.readuntil(b"\n")
+            except asyncio.IncompleteReadError as e:
+                line = e.partial  # the connection was closed
+            except asyncio.LimitOverrunError:
+                await _discard_line(reader)
+                await self._reply(writer, lock, None, "request line too long")
+                continue
+            if not line:
+                break
+            try:
+                msg = json.loads(line)
+            except ValueError:
+                msg = None
+            if isinstance(msg, dict) and msg.get("op") == "analytics":
+                # analytics may be slow, so we do not wait for it
+                task = asyncio.ensure_future(self._reply(writer, lock, msg))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            else:
+                await self._reply(writer, lock, msg)
+        if pending:
+            await asyncio.wait(pending)
+        writer.close()
+        await writer.wait_closed()
+
+
+async def _discard_line(reader):
+    """
+Skips the rest of an overlong line.
+"""
+    while True:
+        try:
+            await reader.readuntil(b"\n")
+            return
+        except asyncio.IncompleteReadError:
+            return
+        except asyncio.LimitOverrunError as e:
+            await reader.readexactly(e.consumed)
+
+
+async def serve(service_, host="127.0.0.1", port=8123, path=None):
+    if path is not None:
+        server = await asyncio.start_unix_server(
+            service_.handle, path=path, limit=line_limit
+        )
+    else:
+        server = await asyncio.start_server(
+            service_.handle, host=host, port=port, limit=line_limit
+        )
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--host", help="address to listen on", default="127.0.0.1")
+    parser.add_argument("--port", help="port to listen on", type=int, default=8123)
+    parser.add_argument(
+        "--unix", help="listen on this Unix socket instead of TCP", default=None
+    )
+    parser.add_argument(
+        "--workers",
+        help="number of worker processes for the analytics requests",
+        type=int,
+        default=2,
+    )
+    args = parser.parse_args()
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=args.workers)
+    try:
+        asyncio.run(serve(service(executor), args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        executor.shutdown()
@@ -1,8 +1,12 @@
 from __future__ import division
 
-import math, sys, argparse
+import math, sys, copy, argparse
+import concurrent.futures
 
-import stats_pentanomial, context, LLRcalc, random_walk
+import numpy as np
+
+import stats_pentanomial, context, LLRcalc, random_walk, SPRT_vectorized
+import instrument
 
 """
 This program computes passing probabilities and expected running times for SPRT tests.
@@ -74,6 +78,15 @@ class SPRT:
         """ 
 Expected running time and power of SPRT test using Brownian approximation.
 See e.g. [W1].
+"""
+        LA, LB, jumps = self._random_walk(elo_diff)
+        r = random_walk.RandomWalk(LA, LB, jumps)
+        prob_H1, E = r.characteristics()
+        return prob_H1, 2 * E
+
+    def _random_walk(self, elo_diff):
+        """
+The boundaries and the jumps of the LLR random walk.
 """
         alpha = self.alpha
         beta = self.beta
@@ -85,10 +98,106 @@ See e.g. [W1].
         probs5 = stats_["probs5"]
         pdf = LLRcalc.results_to_pdf(probs5)[1]
         jumps = LLRcalc.LLRjumps(pdf, self.score0, self.score1)
-        r = random_walk.RandomWalk(LA, LB, jumps)
+        return LA, LB, jumps
+
+    def characteristics_discretized(self, elo_diff, points=2000):
+        """
+Same as characteristics() but instead of the Brownian approximation the
+LLR is modeled by a random walk on a grid with the given number of
+points, which moves game pair by game pair. Returns a pair (power,
+expected running time).
+
+This is not exact. The LLR is discretized and, as in characteristics(),
+it is modeled by a random walk with the jumps of the MLE at elo_diff.
+In trinomial mode the walk moves per game pair with the pentanomial
+jumps and the bounds are divided by the variance ratio var5/var3.
+
+Both numbers come from a sparse linear solve whose cost does not
+depend on the length of the test.
+"""
+        LA, LB, jumps = self._random_walk(elo_diff)
+        r = random_walk.DiscretizedRandomWalk(LA, LB, jumps, points=points)
         prob_H1, E = r.characteristics()
         return prob_H1, 2 * E
 
+    def length_distribution(self, elo_diff, points=2000, tol=1e-12, max_pairs=None):
+        """
+The distribution of the length of the test for the discretized random
+walk of characteristics_discretized(). Returns an array pmf where
+pmf[n] is the probability that the test stops after n game pairs.
+
+The distribution is propagated game pair by game pair until the
+remaining mass is below tol, or for at most max_pairs game pairs. This
+costs one sparse matrix-vector product per game pair, so for tests with
+small elo1-elo0 it is best to choose max_pairs as a small multiple of
+the expected number of game pairs.
+"""
+        LA, LB, jumps = self._random_walk(elo_diff)
+        r = random_walk.DiscretizedRandomWalk(LA, LB, jumps, points=points)
+        pass_pmf, fail_pmf = r.distribution(tol=tol, max_steps=max_pairs)
+        return pass_pmf + fail_pmf
+
+    def characteristics_curve(self, elo_diffs, workers=None):
+        """
+Vectorized version of characteristics(). Returns two arrays with the
+power and the expected running time for every entry of elo_diffs.
+
+The elos are converted with an interpolation table, on a copy of the
+context (see context.with_table()), and the MLEs for all elos are
+computed together. If workers is not None then the elos are divided
+between that many (at least one) worker processes.
+"""
+        if workers is not None and workers < 1:
+            raise ValueError("workers must be at least 1")
+        elo_diffs = np.asarray(elo_diffs, dtype=float)
+        sp = copy.copy(self)
+        sp.context = self.context.with_table()
+        if workers is None:
+            return sp._characteristics_curve(elo_diffs)
+        chunks = np.array_split(elo_diffs, workers)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(sp._characteristics_curve, chunks))
+        return tuple(np.concatenate(r) for r in zip(*results))
+
+    def _characteristics_curve(self, elo_diffs):
+        return self.characteristics_probs(self.curve_probs(elo_diffs))
+
+    def curve_probs(self, elo_diffs):
+        """
+The (regularized) pentanomial probabilities for every entry of
+elo_diffs, as rows of an array. They depend only on the context, the
+mode and the elo model, so they may be reused for other bounds with
+characteristics_probs().
+"""
+        probs = []
+        for elo_diff in elo_diffs:
+            score = self.elo_to_score(elo_diff)
+            elo_diff_logistic = Linv(score)
+            probs.append(self.context.probs(elo_diff_logistic)[1])  # input is logistic
+        probs = SPRT_vectorized.regularize(probs)
+        probs /= probs.sum(axis=1)[:, None]
+        return probs
+
+    def characteristics_probs(self, probs):
+        """
+Same as characteristics_curve() but for the output of curve_probs().
+"""
+        alpha = self.alpha
+        beta = self.beta
+        LA = math.log(beta / (1 - alpha)) / self.ratio
+        LB = math.log((1 - beta) / alpha) / self.ratio
+        x0, x1 = [
+            SPRT_vectorized.MLE_multipliers(probs, s)
+            for s in (self.score0, self.score1)
+        ]
+        a = SPRT_vectorized.values(probs.shape[1])
+        # log(pdf1/pdf0) where pdfi=probs/(1+xi*(a-si)), see LLRcalc.MLE
+        jumps = np.log1p(x0[:, None] * (a - self.score0)) - np.log1p(
+            x1[:, None] * (a - self.score1)
+        )
+        prob_H1, E = random_walk.RandomWalks(LA, LB, jumps, probs).characteristics()
+        return prob_H1, 2 * E
+
 
 if __name__ == "__main__":
     defaults = context.LTC_defaults
@@ -120,13 +229,27 @@ if __name__ == "__main__":
         nargs="+",
         default=default_biases,
     )
+    parser.add_argument(
+        "--book",
+        help="file with the biases (and optionally weights), see context.load_book()",
+        default=None,
+    )
     parser.add_argument(
         "--mode",
         help="'trinomial' or 'pentanomial'",
         choices=["trinomial", "pentanomial"],
         default="pentanomial",
     )
+    parser.add_argument(
+        "--discretized",
+        help="also compute the characteristics of the discretized LLR",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--instrument", help="print the instrumentation counters", action="store_true"
+    )
     args = parser.parse_args()
+    instrument.enable(args.instrument)
     alpha = args.alpha
     beta = args.beta
     elo0 = args.elo0
@@ -134,14 +257,20 @@ if __name__ == "__main__":
     elo = args.elo
     draw_elo = args.draw_elo
     biases = args.biases
-    c = context.context(draw_elo, biases)
+    weights = None
+    if args.book is not None:
+        biases, weights = context.load_book(args.book)
+    c = context.context(draw_elo, biases, weights)
     mode = args.mode
 
     print("elo0      : %.2f" % elo0)
     print("elo1      : %.2f" % elo1)
     print("elo       : %.2f" % elo)
     print("draw_elo  : %.2f" % draw_elo)
-    print("biases    : %s" % biases)
+    if args.book is not None:
+        print("book      : %s (%d biases)" % (args.book, len(biases)))
+    else:
+        print("biases    : %s" % biases)
     print("mode      : %s" % mode)
 
     alpha = 0.05
@@ -152,3 +281,12 @@ if __name__ == "__main__":
 
     print("pass probability:      %4.2f%%" % (100 * power))
     print("avg running time: %10.0f" % expected)
+
+    if args.discretized:
+        (power, expected) = s.characteristics_discretized(elo)
+        print("discr. pass prob.:     %4.2f%%" % (100 * power))
+        print("discr. running time:%8.0f" % expected)
+
+    if args.instrument:
+        print("")
+        instrument.report()
@@ -2,41 +2,111 @@ from __future__ import division
 
 import math
 
+import numpy as np
+
 
 class stats:
     """
 A helper class for tracking the mean and variance
 of a random variable.
+
+Samples may be weighted. The accumulators of different runs can be
+combined exactly with merge(), and get_state()/set_state() convert an
+accumulator to and from a short list of numbers (e.g. to send it from
+a worker process to the main process).
 """
 
     def __init__(self):
         self.mean = 0
         self.M2 = 0
-        self.n = 0
+        self.n = 0  # number of samples
+        self.w = 0  # sum of the weights
+        self.w2 = 0  # sum of the squares of the weights
 
-    def add(self, dx):
-        # Wikipedia!
+    def add(self, dx, weight=1):
+        # Wikipedia! (weighted incremental algorithm of West)
         self.n += 1
+        self.w += weight
+        self.w2 += weight * weight
         delta = dx - self.mean
-        self.mean += delta / self.n
-        self.M2 += delta * (dx - self.mean)
+        self.mean += delta * weight / self.w
+        self.M2 += weight * delta * (dx - self.mean)
+
+    def add_many(self, dxs, weights=None):
+        """
+Adds an array of samples (with optional weights) at once.
+"""
+        dxs = np.asarray(dxs, dtype=float)
+        if len(dxs) == 0:
+            return
+        other = stats()
+        other.n = len(dxs)
+        if weights is None:
+            other.w = other.w2 = len(dxs)
+            other.mean = float(dxs.mean())
+            other.M2 = float(((dxs - other.mean) ** 2).sum())
+        else:
+            weights = np.asarray(weights, dtype=float)
+            other.w = float(weights.sum())
+            other.w2 = float((weights * weights).sum())
+            other.mean = float((weights * dxs).sum()) / other.w
+            other.M2 = float((weights * (dxs - other.mean) ** 2).sum())
+        self.merge(other)
+
+    def merge(self, other):
+        """
+Adds the samples of the accumulator "other", using the formulas of
+
+T.F. Chan, G.H. Golub, R.J. LeVeque, Updating formulae and a pairwise
+algorithm for computing sample variances.
+"""
+        if other.w == 0:
+            return
+        w = self.w + other.w
+        delta = other.mean - self.mean
+        self.mean += delta * other.w / w
+        self.M2 += other.M2 + delta * delta * self.w * other.w / w
+        self.n += other.n
+        self.w = w
+        self.w2 += other.w2
+
+    def get_state(self):
+        return [self.n, self.w, self.w2, self.mean, self.M2]
+
+    def set_state(self, state):
+        self.n, self.w, self.w2, self.mean, self.M2 = state
+
+    def n_eff(self):
+        """
+Kish's effective sample size. It is equal to n for unit weights.
+"""
+        return self.w * self.w / self.w2
+
+    def var(self):
+        """
+Unbiased estimate of the variance (for reliability weights). It is
+infinite if there is effectively only one sample (e.g. a single sample,
+or all the weight on one sample).
+"""
+        d = self.w - self.w2 / self.w if self.w > 0 else 0
+        if d <= 1e-12 * self.w:
+            return float("inf")
+        return self.M2 / d
 
     def params(self):
-        if self.n < 2:
+        if self.n < 2 or self.w == 0:
             return (0, 0)  # adhoc for our application
         else:
-            return self.mean, math.sqrt(self.M2 / (self.n - 1))
+            return self.mean, math.sqrt(self.var())
 
     def ci_mean(self):
-        if self.n < 2:
+        if self.n < 2 or self.w == 0:
             return (0, 0, 0)  # adhoc for our application
         else:
             return (
-                self.mean
-                - 1.96 * math.sqrt(self.M2 / (self.n - 1)) / math.sqrt(self.n),
+                self.mean - 1.96 * math.sqrt(self.var()) / math.sqrt(self.n_eff()),
                 self.mean,
-                self.mean
-                + 1.96 * math.sqrt(self.M2 / (self.n - 1)) / math.sqrt(self.n),
+                self.mean + 1.96 * math.sqrt(self.var()) / math.sqrt(self.n_eff()),
             )
 
 
@@ -35,8 +35,8 @@ def avg(lists):
     return mult_scalar(1 / len(lists), l)
 
 
-def pick(probs):
-    s = random.random()
+def pick(probs, rng=random):
+    s = rng.random()
     p = 0
     for i in range(0, len(probs)):
         pp = probs[i]
@@ -45,6 +45,42 @@ def pick(probs):
             return i
 
 
+def alias_table(probs):
+    """
+Walker's alias table for the distribution probs (Vose's construction).
+It allows to draw from probs in constant time with alias_pick().
+"""
+    l = len(probs)
+    total = sum(probs)
+    scaled = [l * p / total for p in probs]
+    prob = l * [1.0]
+    alias = list(range(0, l))
+    small = [i for i in range(0, l) if scaled[i] < 1]
+    large = [i for i in range(0, l) if scaled[i] >= 1]
+    while small and large:
+        s = small.pop()
+        g = large.pop()
+        prob[s] = scaled[s]
+        alias[s] = g
+        scaled[g] -= 1 - scaled[s]
+        if scaled[g] < 1:
+            small.append(g)
+        else:
+            large.append(g)
+    # the remaining entries are 1 up to rounding errors
+    return prob, alias
+
+
+def alias_pick(table, rng=random):
+    """
+Draws from an alias table using a single uniform random number.
+"""
+    prob, alias = table
+    u = len(prob) * rng.random()
+    i = int(u)
+    return i if u - i < prob[i] else alias[i]
+
+
 def trinomial_to_pentanomial(ldw1, ldw2):
     p = 5 * [0]
     for i in range(0, 3):
@@ -0,0 +1,276 @@
+from __future__ import division
+import sys, os, json, argparse, itertools, collections
+import concurrent.futures
+
+import context
+import sprta5
+
+"""
+Compares SPRT designs. For every combination of the parameters in the
+grid we compute the pass probability and the expected length (in
+games) at a list of actual elos, see sprta5.SPRT.characteristics_curve().
+
+The output is written as JSON, one row per (design, elo), as soon as a
+design has been evaluated. If the output file exists then the rows
+which it already contains are not computed again, so an interrupted
+sweep can be resumed by running the same command again (or extended
+with more elos or designs).
+"""
+
+# The parameters of a design. The context is determined by draw_elo
+# and biases and it is built only once for every combination.
+design_params = (
+    "draw_elo",
+    "biases",
+    "elo0",
+    "elo1",
+    "alpha",
+    "beta",
+    "mode",
+    "elo_model",
+)
+
+
+def designs(grid):
+    """
+The list of all designs (dictionaries) in grid, which maps every name in
+design_params to a list of values. Designs with the same context are
+consecutive.
+"""
+    ret = []
+    for values in itertools.product(*[grid[k] for k in design_params]):
+        ret.append(dict(zip(design_params, values)))
+    return ret
+
+
+def _normalized(value):
+    if isinstance(value, (list, tuple)):
+        return [_normalized(v) for v in value]
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+
+def design_key(design):
+    """
+A string identifying the design. The numbers are converted to floats,
+so that e.g. 0 from a --grid file and 0.0 from the command line give
+the same key.
+"""
+    return json.dumps([_normalized(design[k]) for k in design_params])
+
+
+_contexts = {}
+
+
+def _context(draw_elo, biases):
+    """
+The contexts are kept for the lifetime of the process.
+"""
+    key = (draw_elo, tuple(biases))
+    if key not in _contexts:
+        _contexts[key] = context.context(draw_elo, biases)
+    return _contexts[key]
+
+
+def evaluate(design, elos):
+    """
+Returns a list of rows, one for every entry of elos, with the design
+parameters, the elo, the pass probability and the expected length.
+"""
+    c = _context(design["draw_elo"], design["biases"])
+    s = sprta5.SPRT(
+        alpha=design["alpha"],
+        beta=design["beta"],
+        elo0=design["elo0"],
+        elo1=design["elo1"],
+        context=c,
+        mode=design["mode"],
+        elo_model=design["elo_model"],
+    )
+    pass_prob, expected = s.characteristics_curve(elos)
+    ret = []
+    for elo, p, e in zip(elos, pass_prob, expected):
+        row = dict(design)
+        row.update({"elo": elo, "pass_prob": float(p), "expected": float(e)})
+        ret.append(row)
+    return ret
+
+
+def missing(design, elos, done):
+    """
+The entries of elos for which there is no row of design yet. done is
+the output of completed().
+"""
+    found = done.get(design_key(design), ())
+    return [elo for elo in elos if elo not in found]
+
+
+def _evaluate_chunk(designs, elos, done):
+    return [evaluate(d, missing(d, elos, done)) for d in designs]
+
+
+def sweep(designs, elos, workers=0, chunk_size=10, done=None):
+    """
+Generator yielding evaluate(design, elos) for every design, in order,
+leaving out the elos for which done (see completed()) already contains
+a row. If workers>0 the designs are evaluated in chunks by a pool of
+worker processes. Every worker builds a context at most once.
+"""
+    if done is None:
+        done = {}
+    designs = [d for d in designs if len(missing(d, elos, done)) > 0]
+    chunks = [designs[i : i + chunk_size] for i in range(0, len(designs), chunk_size)]
+    if workers == 0:
+        for chunk in chunks:
+            for rows in _evaluate_chunk(chunk, elos, done):
+                yield rows
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        for chunk in chunks:
+            # only pass the part of done which the chunk needs
+            done_ = dict(
+                [
+                    (design_key(d), done[design_key(d)])
+                    for d in chunk
+                    if design_key(d) in done
+                ]
+            )
+            pending.append(executor.submit(_evaluate_chunk, chunk, elos, done_))
+            if len(pending) >= 2 * workers:
+                for rows in pending.popleft().result():
+                    yield rows
+        while pending:
+            for rows in pending.popleft().result():
+                yield rows
+
+
+def completed(path):
+    """
+A dictionary mapping the keys (see design_key()) of the designs in the
+file path to the sets of elos for which it contains a row. A partial
+last line (from an interrupted write) is removed from the file. Other
+lines which are not valid JSON are ignored.
+"""
+    done = collections.defaultdict(set)
+    if not os.path.exists(path):
+        return done
+    offset = 0
+    valid = 0  # the end of the last line which ends with a newline
+    with open(path, "rb") as f:
+        for line in f:
+            offset += len(line)
+            if not line.endswith(b"\n"):
+                break
+            valid = offset
+            try:
+                row = json.loads(line)
+                done[design_key(row)].add(row["elo"])
+            except (ValueError, TypeError, KeyError):
+                continue
+    if valid < offset:
+        with open(path, "r+b") as f:
+            f.truncate(valid)
+    return done
+
+
+if __name__ == "__main__":
+    defaults = context.LTC_defaults
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument(
+        "--elo",
+        help="actual elos at which the designs are evaluated",
+        type=float,
+        nargs="+",
+        default=None,
+    )
+    parser.add_argument(
+        "--elo0", help="values of H0", type=float, nargs="+", default=[0.0]
+    )
+    parser.add_argument(
+        "--elo1", help="values of H1", type=float, nargs="+", default=[5.0]
+    )
+    parser.add_argument(
+        "--alpha",
+        help="values of the probability of a false positive",
+        type=float,
+        nargs="+",
+        default=[0.05],
+    )
+    parser.add_argument(
+        "--beta",
+        help="values of the probability of a false negative",
+        type=float,
+        nargs="+",
+        default=[0.05],
+    )
+    parser.add_argument(
+        "--draw_elo",
+        help="values of draw_elo",
+        type=float,
+        nargs="+",
+        default=[defaults.draw_elo()],
+    )
+    parser.add_argument(
+        "--biases",
+        help='sets of biases (expressed in BayesElo), each one quoted, e.g. "-90 200" "0 150"',
+        nargs="+",
+        default=[" ".join([str(b) for b in defaults.biases()])],
+    )
+    parser.add_argument(
+        "--mode",
+        help="values of the mode",
+        choices=["trinomial", "pentanomial"],
+        nargs="+",
+        default=["pentanomial"],
+    )
+    parser.add_argument(
+        "--elo_model",
+        help="values of the elo model",
+        choices=["logistic", "normalized"],
+        nargs="+",
+        default=["logistic"],
+    )
+    parser.add_argument(
+        "--grid",
+        help="JSON file with lists of values for (some of) the parameters above, which take precedence",
+        default=None,
+    )
+    parser.add_argument(
+        "--output", help="file to which the rows are appended", required=True
+    )
+    parser.add_argument(
+        "--workers", help="number of worker processes", type=int, default=0
+    )
+    parser.add_argument(
+        "--chunk_size",
+        help="number of designs per task for the worker processes",
+        type=int,
+        default=10,
+    )
+    args = parser.parse_args()
+    grid = dict([(k, getattr(args, k)) for k in design_params + ("elo",)])
+    grid["biases"] = [[float(b) for b in s.split()] for s in grid["biases"]]
+    if args.grid is not None:
+        with open(args.grid) as f:
+            grid.update(json.load(f))
+    elos = grid["elo"]
+    if elos is None:
+        parser.error("the actual elos are required (--elo or in --grid)")
+    all_designs = designs(grid)
+    done = completed(args.output)
+    todo = [d for d in all_designs if len(missing(d, elos, done)) > 0]
+    print("designs      : %d" % len(all_designs))
+    print("done         : %d (in %s)" % (len(all_designs) - len(todo), args.output))
+    sys.stdout.flush()
+    with open(args.output, "a") as f:
+        for rows in sweep(
+            todo, elos, workers=args.workers, chunk_size=args.chunk_size, done=done
+        ):
+            # the rows of a design are written together
+            f.write("".join([json.dumps(row) + "\n" for row in rows]))
+            f.flush()
+    print("evaluated    : %d" % len(todo))
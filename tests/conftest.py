@@ -0,0 +1,4 @@
+import os, sys
+
+# The modules live at the top level of the repository.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
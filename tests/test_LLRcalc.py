@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+import LLRcalc
+import numerics
+
+
+def brentq_multiplier(pdf, s):
+    v, w = pdf[0][0], pdf[-1][0]
+    l, u = -1 / (w - s), 1 / (s - v)
+    f = lambda x: sum([p * (a - s) / (1 + x * (a - s)) for a, p in pdf])
+    return numerics.brentq(f, l + 1e-12, u - 1e-12, xtol=1e-15)
+
+
+@pytest.mark.parametrize("l", [3, 5])
+def test_MLE_multiplier(l):
+    rng = np.random.default_rng(1)
+    a = [i / (l - 1) for i in range(l)]
+    for _ in range(50):
+        p = rng.dirichlet(np.ones(l))
+        pdf = list(zip(a, p.tolist()))
+        for s in (0.3, 0.49, 0.5, 0.52, 0.7):
+            x = LLRcalc.MLE_multiplier(pdf, s)
+            assert x == pytest.approx(brentq_multiplier(pdf, s), rel=1e-9, abs=1e-9)
+            # warm starts converge to the same solution
+            assert LLRcalc.MLE_multiplier(pdf, s, x * 0.9) == pytest.approx(
+                x, rel=1e-12, abs=1e-12
+            )
+
+
+def test_MLE_multiplier_general():
+    pdf = [(0.0, 0.2), (0.3, 0.3), (0.6, 0.1), (1.0, 0.4)]
+    x = LLRcalc.MLE_multiplier(pdf, 0.45)
+    assert x == pytest.approx(brentq_multiplier(pdf, 0.45), rel=1e-9)
+
+
+def test_MLE():
+    pdf = [(0.0, 0.1), (0.25, 0.2), (0.5, 0.4), (0.75, 0.2), (1.0, 0.1)]
+    for s in (0.45, 0.5, 0.55):
+        mle = LLRcalc.MLE(pdf, s)
+        assert sum([p for a, p in mle]) == pytest.approx(1)
+        assert sum([a * p for a, p in mle]) == pytest.approx(s)
@@ -0,0 +1,155 @@
+import itertools, os, signal, subprocess, sys, time
+
+import pytest
+
+import context
+import LLRsimulate
+import runstore
+import stats
+
+draw_elo = context.LTC_defaults.draw_elo()
+biases = context.LTC_defaults.biases()
+root = os.path.join(os.path.dirname(__file__), "..")
+kwargs = dict(alpha=0.05, beta=0.05, elo0=-10, elo1=10, elo=2)
+
+
+def take(chunks, n):
+    ret = list(itertools.islice(chunks, n))
+    chunks.close()
+    return ret
+
+
+def test_serial_equals_parallel():
+    c = context.context(draw_elo, biases)
+    serial = take(LLRsimulate.chunks_serial(7, 3, c, keep_runs=True, **kwargs), 4)
+    parallel = take(
+        LLRsimulate.chunks_parallel(
+            7, 2, 3, draw_elo, biases, keep_runs=True, **kwargs
+        ),
+        4,
+    )
+    assert serial == parallel
+
+
+def test_first_chunk():
+    c = context.context(draw_elo, biases)
+    all_ = take(LLRsimulate.chunks_serial(8, 2, c, keep_runs=True, **kwargs), 3)
+    rest = take(
+        LLRsimulate.chunks_serial(8, 2, c, keep_runs=True, first_chunk=1, **kwargs), 2,
+    )
+    assert all_[1:] == rest
+
+
+def test_merged():
+    c = context.context(draw_elo, biases)
+    (runs, a), (_, b) = take(
+        LLRsimulate.chunks_serial(9, 5, c, keep_runs=True, **kwargs), 2
+    )
+    totals = LLRsimulate.merged(
+        dict([(k, stats.stats()) for k in LLRsimulate.summary_fields]), a
+    )
+    state = dict([(k, v.get_state()) for k, v in totals.items()])
+    both = LLRsimulate.merged(totals, b)
+    assert dict([(k, v.get_state()) for k, v in totals.items()]) == state
+    assert both["pass"].n == 10
+    direct = LLRsimulate.summarize(runs, kwargs["elo"])
+    for k, v in direct.items():
+        assert totals[k].get_state() == pytest.approx(v.get_state(), rel=1e-12)
+
+
+def simulate_cli(args, seconds, cwd):
+    """
+Runs the command line tool for the given number of seconds and then
+interrupts it. Returns the lines of the output starting with n=, without
+repetitions (the last one is printed again after the interruption).
+"""
+    p = subprocess.Popen(
+        [sys.executable, "-u", os.path.join(root, "LLRsimulate.py")] + args,
+        cwd=str(cwd),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    time.sleep(seconds)
+    p.send_signal(signal.SIGINT)
+    out, err = p.communicate(timeout=60)
+    assert p.returncode == 0, err
+    ret = []
+    for l in out.splitlines():
+        if l.startswith("n=") and (len(ret) == 0 or ret[-1] != l):
+            ret.append(l)
+    return ret
+
+
+def test_resume(tmp_path):
+    args = "--elo 2 --elo0 -10 --elo1 10 --seed 11 --chunk_size 2".split()
+    resumable = args + "--checkpoint ck.json --checkpoint_interval 0".split()
+    resumable += ["--store", "runs"]
+    lines = simulate_cli(resumable, 3, tmp_path)
+    checkpoint = LLRsimulate.load_checkpoint(str(tmp_path / "ck.json"))
+    n = checkpoint["totals"]["pass"][0]
+    assert n > 0
+    assert n == 2 * checkpoint["chunks"] == checkpoint["store"]
+    assert len(runstore.runstore(str(tmp_path / "runs"))) == n
+    assert lines[-1].startswith("n=%d " % n)
+    lines += simulate_cli(resumable + ["--resume"], 3, tmp_path)
+    checkpoint = LLRsimulate.load_checkpoint(str(tmp_path / "ck.json"))
+    assert len(runstore.runstore(str(tmp_path / "runs"))) == checkpoint["store"]
+    assert checkpoint["store"] == checkpoint["totals"]["pass"][0] > n
+    # the same output as an uninterrupted simulation
+    seconds = 6
+    while True:
+        whole = simulate_cli(args, seconds, tmp_path)
+        if len(whole) >= len(lines):
+            break
+        seconds *= 2
+    assert whole[: len(lines)] == lines
+
+
+def fake_runs(weights):
+    return [
+        ("H1" if i % 3 == 0 else "H0", 100 + i, 1.0, [], -1.0, 0.0, 1.0, w)
+        for i, w in enumerate(weights)
+    ]
+
+
+def test_half_widths():
+    totals = LLRsimulate.summarize(fake_runs(30 * [1.0]), 0.0)
+    pass_hw, length_hw = LLRsimulate.half_widths(totals)
+    p = (10 + 1) / (30 + 2)
+    assert pass_hw == pytest.approx(1.96 * (p * (1 - p) / 30) ** 0.5)
+    l = totals["length"].ci_mean()
+    assert length_hw == pytest.approx((l[2] - l[0]) / 2)
+
+
+def test_half_widths_tilted():
+    weights = [0.01 * (1 + i % 5) for i in range(30)]
+    totals = LLRsimulate.summarize(fake_runs(weights), 0.0)
+    pass_hw, _ = LLRsimulate.half_widths(totals)
+    p = totals["pass"].ci_mean()
+    assert pass_hw == pytest.approx((p[2] - p[0]) / 2)
+    # the binomial form would be far too wide for a mean of about 0.01
+    assert pass_hw < 0.01
+
+
+def test_tilted_pass_rate():
+    # The pass rate at elo0 (about alpha) estimated by simulating at elo1
+    # and reweighting agrees with the plain estimate.
+    c = context.context(draw_elo, biases)
+    kwargs_ = dict(alpha=0.05, beta=0.05, elo0=0, elo1=10, elo=0, context=c)
+    plain = LLRsimulate.run_chunk(1, 0, 1000, vectorized=True, **kwargs_)
+    plain = LLRsimulate.summarize(plain, 0)["pass"].ci_mean()
+    for vectorized in (False, True):
+        runs = LLRsimulate.run_chunk(
+            1, 1, 200, vectorized=vectorized, tilt_elo=10, **kwargs_
+        )
+        totals = LLRsimulate.summarize(runs, 0)
+        tilted = totals["pass"].ci_mean()
+        assert (
+            abs(tilted[1] - plain[1])
+            <= (tilted[2] - tilted[0]) / 2 + (plain[2] - plain[0]) / 2
+        )
+        # the importance sampling estimate is much more precise
+        assert tilted[2] - tilted[0] < (plain[2] - plain[0]) / 3
+        w = totals["weight"].ci_mean()
+        assert w[0] <= 1 <= w[2]
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+import LLRcalc
+import SPRT_pentanomial
+
+
+def state(sp):
+    return (
+        sp.status(),
+        sp.results(),
+        sp.LLR(),
+        sp.min_LLR,
+        sp.max_LLR,
+        sp.sq0,
+        sp.sq1,
+        sp.o0,
+        sp.o1,
+    )
+
+
+def assert_same(sp, sp_):
+    s, s_ = state(sp), state(sp_)
+    assert s[:2] == s_[:2]
+    assert s[2:] == pytest.approx(s_[2:], rel=1e-10, abs=1e-12)
+
+
+def test_record_many_empty():
+    sp = SPRT_pentanomial.SPRT()
+    assert sp.record_many([]) == 0
+    assert sp.results() == 5 * [0]
+    sp.record_many([2, 3])
+    assert sp.record_many(np.array([], dtype=int)) == 0
+    assert sp.results() == [0, 0, 1, 1, 0]
+
+
+@pytest.mark.parametrize("mode", ["trinomial", "pentanomial"])
+@pytest.mark.parametrize("elo_model", ["logistic", "normalized"])
+def test_record_many_equals_record(mode, elo_model):
+    l = 5 if mode == "pentanomial" else 3
+    rng = np.random.default_rng(1)
+    for _ in range(5):
+        outcomes = rng.integers(0, l, size=3000)
+        kwargs = dict(elo0=0, elo1=5, mode=mode, elo_model=elo_model)
+        sp = SPRT_pentanomial.SPRT(**kwargs)
+        sp_ = SPRT_pentanomial.SPRT(**kwargs)
+        used = 0
+        for block in np.array_split(outcomes, 7):
+            used += sp.record_many(block)
+        for r in outcomes:
+            if sp_.status() != "":
+                break
+            sp_.record(int(r))
+        assert used == sum(sp_.results())
+        assert_same(sp, sp_)
+
+
+def test_record_many_after_finish():
+    sp = SPRT_pentanomial.SPRT(elo0=-10, elo1=10)
+    sp.record_many(1000 * [4])
+    assert sp.status() == "H1"
+    results = sp.results()
+    assert sp.record_many([0, 0]) == 0
+    assert sp.results() == results
+
+
+def test_add_results():
+    sp = SPRT_pentanomial.SPRT()
+    assert sp.add_results([10, 30, 50, 40, 12])
+    assert sp.results() == [10, 30, 50, 40, 12]
+    assert sp.LLR() == pytest.approx(
+        LLRcalc.LLR_logistic(0, 5, [10, 30, 50, 40, 12]), rel=1e-12
+    )
+    sp.add_results([1, 0, 0, 0, 1])
+    assert sp.results() == [11, 30, 50, 40, 13]
+    assert sp.LLR() == pytest.approx(
+        LLRcalc.LLR_logistic(0, 5, [11, 30, 50, 40, 13]), rel=1e-12
+    )
+
+
+def test_add_results_after_finish():
+    sp = SPRT_pentanomial.SPRT(elo0=-10, elo1=10)
+    assert sp.add_results([0, 0, 0, 0, 2000])
+    assert sp.status() == "H1"
+    assert not sp.add_results([5, 0, 0, 0, 0])
+    assert sp.results() == [0, 0, 0, 0, 2000]
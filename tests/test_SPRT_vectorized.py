@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+
+import LLRcalc
+import LLRsimulate
+import SPRT_pentanomial
+import SPRT_vectorized
+import context
+
+
+@pytest.mark.parametrize("s", [0.49, 0.5, 0.51, 0.6])
+def test_MLE_multipliers(s):
+    rng = np.random.default_rng(1)
+    probs = rng.dirichlet(np.ones(5), size=20)
+    x = SPRT_vectorized.MLE_multipliers(probs, s)
+    a = SPRT_vectorized.values(5)
+    for p, x_ in zip(probs, x):
+        pdf = list(zip(a, p))
+        assert x_ == pytest.approx(LLRcalc.MLE_multiplier(pdf, s), rel=1e-13, abs=1e-13)
+
+
+def test_MLE_multipliers_warm_start():
+    rng = np.random.default_rng(2)
+    probs = rng.dirichlet(np.ones(3), size=10)
+    x = SPRT_vectorized.MLE_multipliers(probs, 0.52)
+    y = SPRT_vectorized.MLE_multipliers(probs, 0.52, x + 1e-3)
+    assert np.allclose(x, y, rtol=0, atol=1e-14)
+
+
+@pytest.mark.parametrize("mode", ["trinomial", "pentanomial"])
+@pytest.mark.parametrize("elo_model", ["logistic", "normalized"])
+def test_LLR(mode, elo_model):
+    rng = np.random.default_rng(3)
+    l = 5 if mode == "pentanomial" else 3
+    results = rng.integers(0, 50, size=(20, l))
+    if elo_model == "logistic":
+        LLR = SPRT_vectorized.LLR_logistic(0, 5, results)
+        scalar = [LLRcalc.LLR_logistic(0, 5, list(r)) for r in results]
+    else:
+        LLR = SPRT_vectorized.LLR_normalized(0, 5, results)
+        scalar = [LLRcalc.LLR_normalized(0, 5, list(r)) for r in results]
+    assert np.allclose(LLR, scalar, rtol=1e-12, atol=1e-12)
+
+
+@pytest.mark.parametrize("mode", ["trinomial", "pentanomial"])
+@pytest.mark.parametrize("elo_model", ["logistic", "normalized"])
+def test_SPRT_matches_scalar(mode, elo_model):
+    n = 30
+    l = 5 if mode == "pentanomial" else 3
+    rng = np.random.default_rng(4)
+    p = np.array([1, 4, 6, 4, 1] if l == 5 else [2, 5, 3], dtype=float)
+    outcomes = rng.choice(l, p=p / p.sum(), size=(n, 1500))
+    kwargs = dict(elo0=0, elo1=5, mode=mode, elo_model=elo_model)
+    sv = SPRT_vectorized.SPRT(n, **kwargs)
+    sps = [SPRT_pentanomial.SPRT(**kwargs) for _ in range(n)]
+    for k in range(outcomes.shape[1]):
+        sv.record(outcomes[:, k])
+        for sp, r in zip(sps, outcomes[:, k]):
+            sp.record(int(r))
+    status = {1: "H1", -1: "H0", 0: ""}
+    for i, sp in enumerate(sps):
+        assert status[int(sv.status()[i])] == sp.status()
+        assert sv.results()[i].tolist() == sp.results()
+        assert sv.LLR()[i] == pytest.approx(sp.LLR(), rel=1e-10, abs=1e-10)
+
+
+@pytest.mark.parametrize("mode", ["trinomial", "pentanomial"])
+@pytest.mark.parametrize("elo_model", ["logistic", "normalized"])
+def test_record_many(mode, elo_model):
+    n = 30
+    l = 5 if mode == "pentanomial" else 3
+    rng = np.random.default_rng(6)
+    p = np.array([1, 4, 6, 4, 1] if l == 5 else [2, 5, 3], dtype=float)
+    outcomes = rng.choice(l, p=p / p.sum(), size=(n, 1500))
+    kwargs = dict(elo0=0, elo1=5, mode=mode, elo_model=elo_model)
+    one = SPRT_vectorized.SPRT(n, **kwargs)
+    many = SPRT_vectorized.SPRT(n, **kwargs)
+    for k in range(outcomes.shape[1]):
+        one.record(outcomes[:, k])
+    start = 0
+    for m in [1, 10, 100, 389, 1000]:
+        before = many.results().sum(axis=1)
+        recorded = many.record_many(outcomes[:, start : start + m])
+        assert (many.results().sum(axis=1) - before == recorded).all()
+        start += m
+    assert (one.status() == many.status()).all()
+    assert (one.results() == many.results()).all()
+    assert np.allclose(one.LLR(), many.LLR(), rtol=1e-10, atol=1e-10)
+    assert np.allclose(one.o0, many.o0, rtol=1e-10, atol=1e-10)
+    assert np.allclose(one.o1, many.o1, rtol=1e-10, atol=1e-10)
+
+
+def test_select():
+    sv = SPRT_vectorized.SPRT(4)
+    sv.record(np.array([0, 1, 3, 4]))
+    sv.select(np.array([True, False, False, True]))
+    assert sv.results().tolist() == [[1, 0, 0, 0, 0], [0, 0, 0, 0, 1]]
+    assert len(sv.LLR()) == 2
+
+
+def test_simulate_many():
+    c = context.context(context.LTC_defaults.draw_elo(), context.LTC_defaults.biases())
+    rng = np.random.default_rng(5)
+    runs = LLRsimulate.simulate_many(20, elo0=-10, elo1=10, elo=0, context=c, rng=rng)
+    assert len(runs) == 20
+    for status, length, LLR, results in runs:
+        assert status in ("H0", "H1")
+        assert length == 2 * sum(results)
+        assert LLR == pytest.approx(LLRcalc.LLR_logistic(-10, 10, results), rel=1e-10)
+
+
+def test_run_chunk_vectorized():
+    c = context.context(context.LTC_defaults.draw_elo(), context.LTC_defaults.biases())
+    kwargs = dict(elo0=-10, elo1=10, elo=0, context=c)
+    runs = LLRsimulate.run_chunk(3, 0, 20, vectorized=True, **kwargs)
+    assert runs == LLRsimulate.run_chunk(3, 0, 20, vectorized=True, **kwargs)
+    assert len(runs) == 20
+    for status, length, LLR, results, elo_l, elo, elo_u, weight in runs:
+        assert status in ("H0", "H1")
+        assert elo_l <= elo <= elo_u
+        assert weight == 1
+    tilted = LLRsimulate.run_chunk(3, 0, 20, vectorized=True, tilt_elo=5, **kwargs)
+    weights = np.array([r[7] for r in tilted])
+    assert (weights > 0).all() and (weights != 1).any()
@@ -0,0 +1,75 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import brownian
+import instrument
+
+# The vectorized series uses the largest number of terms for all the
+# entries, the scalar one only the terms it needs. Both are within
+# eps=1e-9 of the sum of the series.
+eps = 1e-9
+
+# (mu, T, y) on a grid which covers both the series and Siegmund's
+# approximation (small T or large |gamma*A|)
+mus = [-0.002, 0.0, 0.0008, 0.01]
+Ts = [10.0, 300.0, 2000.0, 20000.0]
+ys = [-2.5, 0.0, 1.5, 2.9]
+sigma = 0.05
+
+
+def grid(mus=mus, Ts=Ts, ys=ys):
+    return [np.array(v) for v in zip(*itertools.product(mus, Ts, ys))]
+
+
+def test_outcome_cdf():
+    mu, T, y = grid()
+    b = brownian.Brownian(a=-3, b=3, mu=mu, sigma=sigma)
+    instrument.enable()
+    try:
+        ret = b.outcome_cdf(T=T, y=y)
+        counters = instrument.dump()
+    finally:
+        instrument.enable(False)
+        instrument.reset()
+    assert counters["Brownian.outcome_cdf.siegmund"] > 0
+    assert counters["Brownian.outcome_cdf.series"] > 0
+    for mu_, T_, y_, r in zip(mu, T, y, ret):
+        b_ = brownian.Brownian(a=-3, b=3, mu=float(mu_), sigma=sigma)
+        assert r == pytest.approx(b_.outcome_cdf(T=float(T_), y=float(y_)), abs=2 * eps)
+
+
+def test_outcome_cdf_alt():
+    mu, T, y = grid(Ts=Ts[1:])
+    b = brownian.Brownian(a=-3, b=3, mu=mu, sigma=sigma)
+    alt1 = b.outcome_cdf_alt1(T=T, y=y)
+    alt2 = b.outcome_cdf_alt2(T=T, y=y)
+    for mu_, T_, y_, r1, r2 in zip(mu, T, y, alt1, alt2):
+        b_ = brownian.Brownian(a=-3, b=3, mu=float(mu_), sigma=sigma)
+        assert r1 == pytest.approx(
+            b_.outcome_cdf_alt1(T=float(T_), y=float(y_)), abs=2 * eps
+        )
+        assert r2 == pytest.approx(
+            b_.outcome_cdf_alt2(T=float(T_), y=float(y_)), abs=1e-12
+        )
+
+
+def test_series_length():
+    mu, T, y = grid(mus=mus[:3], Ts=Ts[1:])
+    b = brownian.Brownian(a=-3, b=3, mu=mu, sigma=sigma)
+    A = b.b - b.a
+    x = -b.a
+    gamma = mu / b.sigma2
+    c = (np.pi / A) ** 2 * b.sigma2 / 2
+    lambda_1 = c + mu ** 2 / b.sigma2 / 2
+    log_t0 = -lambda_1 * T - x * gamma + (y - b.a) * gamma
+    N = brownian.series_length(c * T, log_t0)
+    for cT, l, n in zip(c * T, log_t0, N):
+        assert n == brownian.series_length(float(cT), float(l))
+    # the truncation error is below eps
+    for i in range(len(T)):
+        b_ = brownian.Brownian(a=-3, b=3, mu=mu[i], sigma=sigma)
+        short = b_._outcome_cdf_alt1(T[i], y[i], N[i])
+        long = b_._outcome_cdf_alt1(T[i], y[i], 4 * N[i] + 20)
+        assert abs(short - long) <= eps
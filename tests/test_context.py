@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+import context
+import instrument
+
+draw_elo = context.LTC_defaults.draw_elo()
+biases = context.LTC_defaults.biases()
+
+
+@pytest.mark.parametrize("biases", [biases, [0.0], [-150.0, 30.0, 250.0]])
+def test_table_lookup(biases):
+    exact = context.context(draw_elo, biases)
+    table = context.context(draw_elo, biases)
+    table.build_table()
+    for elo in np.linspace(-400, 400, 401):
+        elo = float(elo)
+        assert table.elo_to_belo(elo) == pytest.approx(
+            exact.elo_to_belo(elo), abs=1e-10
+        )
+
+
+def test_table_lookup_fallback():
+    # With only 5 nodes the interpolation is poor. We pretend that the
+    # Newton step is always good enough (K=0) so that the bad lookups
+    # have to be caught by the check of the residual.
+    exact = context.context(draw_elo, biases)
+    coarse = context.context(draw_elo, biases)
+    coarse.build_table(nodes=5)
+    coarse.set_table(dict(coarse.table(), K=0.0))
+    elos = [float(elo) for elo in np.linspace(-400, 400, 41)]
+    belos = [exact.elo_to_belo(elo) for elo in elos]
+    instrument.enable()
+    try:
+        for elo, belo in zip(elos, belos):
+            assert coarse.elo_to_belo(elo) == pytest.approx(belo, abs=1e-10)
+        counters = instrument.dump()
+    finally:
+        instrument.enable(False)
+        instrument.reset()
+    assert counters["context._table_lookup.rejected"] > 0
+    assert (
+        counters["context.elo_to_belo.brentq_calls"]
+        == counters["context._table_lookup.rejected"]
+    )
+
+
+def test_pick_many():
+    c = context.context(draw_elo, biases)
+    n = 200000
+    i, j = c.pick_many(10.0, n, rng=np.random.default_rng(9))
+    counts = np.bincount(3 * i + j, minlength=9).reshape(3, 3)
+    p = np.array(c.pair_probs(10.0))
+    # five standard deviations
+    assert np.all(np.abs(counts / n - p) <= 5 * np.sqrt(p * (1 - p) / n))
+
+
+@pytest.mark.parametrize("fmt", ["npy", "raw", "npy_weights"])
+def test_load_book(tmp_path, monkeypatch, fmt):
+    rng = np.random.default_rng(10)
+    book = rng.normal(50, 100, size=300)
+    weights = (
+        rng.integers(1, 5, size=300).astype(float) if fmt == "npy_weights" else None
+    )
+    if fmt == "raw":
+        path = str(tmp_path / "book.bin")
+        book.astype("<f8").tofile(path)
+    else:
+        path = str(tmp_path / "book.npy")
+        np.save(path, book if weights is None else np.column_stack((book, weights)))
+    # the reference uses plain Python loops over the lists
+    monkeypatch.setattr(context, "_small_book", 10 ** 6)
+    ref = context.context(
+        draw_elo, book.tolist(), None if weights is None else weights.tolist()
+    )
+    assert ref._small is not None
+    # the mapped book is processed in several chunks
+    monkeypatch.setattr(context, "_small_book", 64)
+    monkeypatch.setattr(context, "_chunk_size", 64)
+    biases_, weights_ = context.load_book(path)
+    assert isinstance(biases_, np.memmap)
+    assert (weights_ is None) == (weights is None)
+    c = context.context(draw_elo, biases_, weights_)
+    assert c._small is None
+    for elo in [-20.0, 0.0, 7.5]:
+        s, s_ = c.stats(elo), ref.stats(elo)
+        for k in ["probs3", "probs5", "var3", "var5", "mu", "sigma2"]:
+            assert np.allclose(s[k], s_[k], rtol=1e-10, atol=1e-14), k
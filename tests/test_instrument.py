@@ -0,0 +1,23 @@
+import numpy as np
+
+import instrument
+import LLRcalc
+import SPRT_vectorized
+
+
+def test_counters():
+    probs = np.random.default_rng(1).dirichlet(np.ones(5), size=10)
+    instrument.reset()
+    SPRT_vectorized.MLE_multipliers(probs, 0.51)
+    assert instrument.dump() == {}
+    instrument.enable()
+    try:
+        SPRT_vectorized.MLE_multipliers(probs, 0.51)
+        LLRcalc.LLR_logistic(0, 5, [10, 30, 50, 40, 12])
+        d = instrument.dump()
+    finally:
+        instrument.enable(False)
+        instrument.reset()
+    assert d["SPRT_vectorized.MLE.calls"] == 10
+    assert d["SPRT_vectorized.MLE.newton_steps"] >= 10
+    assert d["LLRcalc.MLE.calls"] == 2
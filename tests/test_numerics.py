@@ -0,0 +1,59 @@
+import math
+
+import numpy as np
+import pytest
+import scipy.optimize
+import scipy.stats
+
+import numerics
+
+cases = [
+    (lambda x: x * x - 2, 0, 2),
+    (lambda x: math.cos(x) - x, -1, 1),
+    (lambda x: math.exp(x) - 1e-3, -20, 5),
+    (lambda x: x ** 3 - x - 2, 1, 2),
+    (lambda x: math.atan(x - 1e6), 0, 1e7),
+]
+
+
+@pytest.mark.parametrize("f, a, b", cases)
+def test_brentq(f, a, b):
+    x, r = numerics.brentq(f, a, b, full_output=True)
+    x_, r_ = scipy.optimize.brentq(f, a, b, full_output=True)
+    assert x == x_
+    assert r.converged and r_.converged
+    assert r.iterations == r_.iterations
+    assert r.function_calls == r_.function_calls
+
+
+def test_brentq_endpoint():
+    f = lambda x: x - 1
+    for a, b in [(1, 3), (-2, 1)]:
+        assert numerics.brentq(f, a, b) == scipy.optimize.brentq(f, a, b) == 1
+
+
+def test_brentq_errors():
+    f = lambda x: x * x + 1
+    with pytest.raises(ValueError):
+        scipy.optimize.brentq(f, -1, 1)
+    with pytest.raises(ValueError):
+        numerics.brentq(f, -1, 1)
+    g = lambda x: math.cos(x) - x
+    with pytest.raises(RuntimeError):
+        scipy.optimize.brentq(g, -1, 1, maxiter=2)
+    with pytest.raises(RuntimeError):
+        numerics.brentq(g, -1, 1, maxiter=2)
+    x, r = numerics.brentq(g, -1, 1, maxiter=2, full_output=True, disp=False)
+    assert not r.converged
+
+
+def test_Phi():
+    for x in [-40.0, -8.5, -1.0, 0.0, 0.3, 2.0, 9.0]:
+        assert numerics.Phi(x) == pytest.approx(
+            scipy.stats.norm.cdf(x), rel=1e-12, abs=1e-300
+        )
+        assert isinstance(numerics.Phi(x), float)
+    x = np.linspace(-12, 12, 96).reshape(8, 12)
+    y = numerics.Phi(x)
+    assert y.shape == x.shape
+    assert np.allclose(y, scipy.stats.norm.cdf(x), rtol=1e-12, atol=0)
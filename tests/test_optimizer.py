@@ -0,0 +1,27 @@
+import pytest
+
+import context
+import optimizer
+import sprta5
+
+
+def test_optimize():
+    c = context.context(context.LTC_defaults.draw_elo(), context.LTC_defaults.biases())
+    problem = optimizer.design_problem(c, [-2.0, 0.0, 2.0, 4.0, 6.0], [1, 3, 3, 2, 1])
+    start = problem.values(problem.x0())[0]
+    r = optimizer.optimize(problem)
+    assert r["success"], r["message"]
+    assert r["elo1"] - r["elo0"] >= 0.5 - 1e-9
+    for k in ("alpha", "beta"):
+        assert 1e-4 * (1 - 1e-9) <= r[k] <= 0.5 * (1 + 1e-9)
+    assert r["expected"] <= start
+    # the constraints hold for the returned design, evaluated from scratch
+    s = sprta5.SPRT(
+        alpha=r["alpha"], beta=r["beta"], elo0=r["elo0"], elo1=r["elo1"], context=c
+    )
+    assert s.characteristics(problem.fp_elo)[0] <= problem.max_fp * (1 + 1e-4)
+    assert 1 - s.characteristics(problem.fn_elo)[0] <= problem.max_fn * (1 + 1e-4)
+    expected = sum(
+        w * s.characteristics(elo)[1] for elo, w in zip(problem.elos, problem.weights)
+    )
+    assert expected == pytest.approx(r["expected"], rel=1e-6)
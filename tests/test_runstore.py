@@ -0,0 +1,103 @@
+import os
+
+import numpy as np
+import pytest
+
+import runstore
+
+
+def make_runs(n, width=5, offset=0):
+    ret = []
+    for i in range(offset, offset + n):
+        results = [(i + k) % 7 for k in range(width)]
+        ret.append(
+            (
+                "H1" if i % 2 else "H0",
+                float(2 * sum(results)),
+                (-1) ** i * 2.9,
+                results,
+                i - 1.0,
+                float(i),
+                i + 1.0,
+                1.0 if i % 3 else 0.5,
+            )
+        )
+    return ret
+
+
+def test_append_and_columns(tmp_path):
+    path = str(tmp_path / "s")
+    s = runstore.runstore(path, "a", buffer_size=4)
+    s.append(make_runs(3), 0.0)
+    assert len(s) == 0
+    s.append(make_runs(3, offset=3), 1.0)
+    assert len(s) == 6  # the buffer was full, so it has been written
+    s.close()
+    c = runstore.runstore(path).columns()
+    assert len(c["status"]) == 6
+    assert c["status"].tolist() == [0, 1, 0, 1, 0, 1]
+    assert c["true_elo"].tolist() == [0.0, 0.0, 0.0, 1.0, 1.0, 1.0]
+    assert c["results"].shape == (6, 5)
+    assert c["results"][4].tolist() == make_runs(1, offset=4)[0][3]
+    assert c["elo"].tolist() == [float(i) for i in range(6)]
+
+
+def test_query_aggregate(tmp_path):
+    path = str(tmp_path / "s")
+    s = runstore.runstore(path, "a")
+    runs = make_runs(10)
+    s.append(runs[:4], 0.0)
+    s.append(runs[4:], 2.0)
+    s.close()
+    s = runstore.runstore(path)
+    q = s.query(lambda c: c["status"] == 1, ["length"])
+    assert list(q) == ["length"]
+    assert q["length"].tolist() == [r[1] for r in runs if r[0] == "H1"]
+    a = s.aggregate("length")
+    assert sorted(a) == [0.0, 2.0]
+    assert a[2.0].n == 6
+    assert a[0.0].mean == pytest.approx(np.mean([r[1] for r in runs[:4]]))
+    w = s.aggregate("length", weighted=True)
+    assert w[0.0].mean == pytest.approx(np.mean([r[1] * r[7] for r in runs[:4]]))
+    counts, _ = s.histogram("LLR", bins=2)
+    assert counts.tolist() == [5, 5]
+
+
+def test_truncate_and_reopen(tmp_path):
+    path = str(tmp_path / "s")
+    s = runstore.runstore(path, "a")
+    s.append(make_runs(8), 0.0)
+    s.flush()
+    s.truncate(5)
+    s.append(make_runs(2, offset=100), 1.0)
+    s.close()
+    c = runstore.runstore(path).columns()
+    assert c["elo"].tolist() == [0.0, 1.0, 2.0, 3.0, 4.0, 100.0, 101.0]
+
+
+def test_partial_write(tmp_path):
+    path = str(tmp_path / "s")
+    s = runstore.runstore(path, "a")
+    s.append(make_runs(4), 0.0)
+    s.close()
+    # an interrupted write leaves data beyond the count in meta.json
+    with open(os.path.join(path, "LLR.bin"), "ab") as f:
+        f.write(b"\0" * 12)
+    s = runstore.runstore(path, "a")
+    assert len(s) == 4
+    assert os.path.getsize(os.path.join(path, "LLR.bin")) == 4 * 8
+    s.append(make_runs(1, offset=4), 0.0)
+    s.close()
+    c = runstore.runstore(path).columns()
+    assert c["elo"].tolist() == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert c["LLR"][4] == make_runs(1, offset=4)[0][2]
+
+
+def test_empty_and_missing(tmp_path):
+    path = str(tmp_path / "s")
+    with pytest.raises(IOError):
+        runstore.runstore(path)
+    s = runstore.runstore(path, "a", width=3)
+    s.close()
+    c = runstore.runstore(path).columns()
+    assert c["results"].shape == (0, 3)
@@ -0,0 +1,127 @@
+import csv
+import io
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+import scipy.optimize
+
+import sprt
+
+root = os.path.join(os.path.dirname(__file__), "..")
+defaults = {
+    "alpha": 0.05,
+    "beta": 0.05,
+    "elo0": 0.0,
+    "elo1": 5.0,
+    "elo_model": "logistic",
+    "level": 0.95,
+}
+
+
+def test_analyze():
+    r = sprt.analyze({"id": 1, "results": [10, 30, 50, 40, 12]}, defaults)
+    s = sprt.sprt(elo0=0, elo1=5)
+    s.set_state([10, 30, 50, 40, 12])
+    assert r["id"] == 1
+    assert r["elo"] == pytest.approx(s.analytics()["elo"])
+    r = sprt.analyze({"results": "10 30 50 40 12", "elo1": "2"}, defaults)
+    assert "error" not in r
+
+
+@pytest.mark.parametrize("row", [3, [1, 2], "x", None, [["results", [1, 2, 3]]]])
+def test_analyze_not_an_object(row):
+    assert "error" in sprt.analyze(row, defaults)
+
+
+def test_analyze_errors():
+    assert "error" in sprt.analyze({"results": [1, 2, 3, 4]}, defaults)
+    assert "error" in sprt.analyze({"results": [1, 2, 3], "elo0": "x"}, defaults)
+    assert sprt.analyze({"error": "e"}, defaults) == {"error": "e"}
+    for level in ("1.5", "0", 1, -0.5):
+        r = sprt.analyze({"results": [1, 2, 3], "level": level}, defaults)
+        assert "level" in r["error"]
+
+
+def test_bulk_workers():
+    rows = [{"results": [i, 2 * i, 3 * i + 1, 2 * i, i]} for i in range(30)]
+    serial = list(sprt.bulk(rows, defaults, chunk_size=7))
+    parallel = list(sprt.bulk(rows, defaults, workers=2, chunk_size=7))
+    assert serial == parallel
+
+
+def run_bulk(data, fmt):
+    p = subprocess.run(
+        [sys.executable, "sprt.py", "--bulk", "-", "--format", fmt],
+        input=data,
+        cwd=root,
+        capture_output=True,
+        text=True,
+    )
+    assert p.returncode == 0, p.stderr
+    return p.stdout
+
+
+def test_bulk_jsonl():
+    out = run_bulk('{"results": [1, 2, 3]}\n3\nnot json\n', "jsonl")
+    rows = [json.loads(l) for l in out.splitlines()]
+    assert len(rows) == 3
+    assert "error" not in rows[0]
+    assert "error" in rows[1]
+    assert "error" in rows[2]
+
+
+def test_bulk_csv():
+    out = run_bulk("id,results\na,10 20 30\nb,1 2 3,extra\nc\n", "csv")
+    rows = list(csv.DictReader(io.StringIO(out)))
+    assert [r["id"] for r in rows] == ["a", "b", "c"]
+    assert rows[0]["error"] == ""
+    assert rows[1]["error"] != ""
+    assert rows[2]["error"] != ""
+
+
+def test_bulk_csv_empty():
+    out = run_bulk("", "csv")
+    assert out.splitlines() == ["elo,ci_lower,ci_upper,LOS,LLR,clamped,error"]
+
+
+@pytest.mark.parametrize(
+    "results, elo_model",
+    [
+        ([10, 30, 50, 40, 12], "logistic"),
+        ([10, 30, 50, 40, 12], "normalized"),
+        ([200, 410, 230], "logistic"),
+        ([5, 20, 50, 45, 10], "logistic"),
+    ],
+)
+def test_lower_cbs(results, elo_model):
+    ps = [0.5, 0.025, 0.975, 0.2, 0.9]
+    s = sprt.sprt(elo0=0, elo1=5, elo_model=elo_model)
+    s.set_state(results)
+    cbs = s.lower_cbs(ps)
+    for p, cb in zip(ps, cbs):
+        # an independent solve for every quantile
+        s_ = sprt.sprt(elo0=0, elo1=5, elo_model=elo_model)
+        s_.set_state(results)
+        f = lambda elo: s_.outcome_prob(elo) - (1 - p)
+        assert cb == pytest.approx(scipy.optimize.brentq(f, -1000, 1000), abs=1e-9)
+    # the bounds increase with p
+    cbs = [cb for p, cb in sorted(zip(ps, cbs))]
+    assert cbs == sorted(cbs)
+
+
+@pytest.mark.parametrize("fields", [("elo", "ci"), ("elo",), ("ci",), ("LOS", "LLR")])
+def test_analytics_fields(fields):
+    full = sprt.sprt(elo0=0, elo1=5)
+    full.set_state([10, 30, 50, 40, 12])
+    full = full.analytics(0.1)
+    s = sprt.sprt(elo0=0, elo1=5)
+    s.set_state([10, 30, 50, 40, 12])
+    a = s.analytics(0.1, fields=fields)
+    assert sorted(a) == sorted(fields)
+    for k in fields:
+        assert a[k] == pytest.approx(full[k], abs=1e-9)
+    if fields == ("elo", "ci"):
+        assert a == dict([(k, full[k]) for k in fields])
@@ -0,0 +1,150 @@
+import asyncio
+import json
+
+import sprt_server
+
+
+def session(requests, limit=sprt_server.line_limit):
+    """
+Sends the requests (JSON objects or raw lines) to a fresh service over
+TCP and returns the replies, matched by position unless they are tagged.
+"""
+
+    async def main():
+        service = sprt_server.service()
+        server = await asyncio.start_server(
+            service.handle, host="127.0.0.1", port=0, limit=limit
+        )
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection(
+            "127.0.0.1", port, limit=sprt_server.line_limit
+        )
+        for r in requests:
+            line = r if isinstance(r, bytes) else json.dumps(r).encode()
+            writer.write(line + b"\n")
+        await writer.drain()
+        replies = [json.loads(await reader.readline()) for _ in requests]
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return replies
+
+    return asyncio.run(main())
+
+
+def test_create_update_status():
+    replies = session(
+        [
+            {"op": "create", "id": "t", "elo0": 0, "elo1": 5},
+            {"op": "update", "id": "t", "results": [1, 2, 3, 4, 5]},
+            {"op": "update", "updates": [{"id": "t", "results": [0, 0, 1, 0, 0]}]},
+            {"op": "status", "id": "t"},
+            {"op": "delete", "id": "t"},
+            {"op": "status", "id": "t"},
+        ]
+    )
+    assert replies[0]["results"] == [0, 0, 0, 0, 0]
+    assert replies[1]["tests"][0]["results"] == [1, 2, 3, 4, 5]
+    assert replies[2]["tests"][0]["results"] == [1, 2, 4, 4, 5]
+    assert replies[2]["tests"][0]["applied"]
+    assert replies[3]["results"] == [1, 2, 4, 4, 5]
+    assert replies[4] == {"id": "t"}
+    assert "error" in replies[5]
+
+
+def test_malformed_requests():
+    replies = session(
+        [b"3", b"[1, 2]", b"not json", {"op": "nonsense", "tag": 7}, {"op": "status"}]
+    )
+    for r in replies:
+        assert "error" in r
+    assert replies[3]["tag"] == 7
+
+
+def test_batch_is_atomic():
+    replies = session(
+        [
+            {"op": "create", "id": "a"},
+            {"op": "create", "id": "b"},
+            {
+                "op": "update",
+                "updates": [
+                    {"id": "a", "results": [1, 1, 1, 1, 1]},
+                    {"id": "b", "results": [1, 1, 1]},
+                ],
+            },
+            {
+                "op": "update",
+                "updates": [
+                    {"id": "a", "results": [1, 1, 1, 1, 1]},
+                    {"id": "c", "results": [1, 1, 1, 1, 1]},
+                ],
+            },
+            {"op": "status", "id": "a"},
+        ]
+    )
+    assert "error" in replies[2]
+    assert "error" in replies[3]
+    assert replies[4]["results"] == [0, 0, 0, 0, 0]
+
+
+def test_update_after_finish():
+    replies = session(
+        [
+            {"op": "create", "id": "t", "elo0": -10, "elo1": 10},
+            {"op": "update", "id": "t", "results": [0, 0, 0, 0, 2000]},
+            {"op": "update", "id": "t", "results": [5, 0, 0, 0, 0]},
+        ]
+    )
+    assert replies[1]["tests"][0]["status"] == "H1"
+    assert replies[1]["tests"][0]["applied"]
+    assert not replies[2]["tests"][0]["applied"]
+    assert replies[2]["tests"][0]["results"] == [0, 0, 0, 0, 2000]
+
+
+def test_analytics():
+    replies = session(
+        [
+            {"op": "create", "id": "t"},
+            {"op": "update", "id": "t", "results": [10, 30, 50, 40, 12]},
+            {"op": "analytics", "id": "t", "fields": ["elo", "LOS"], "tag": "x"},
+        ]
+    )
+    assert replies[2]["tag"] == "x"
+    assert replies[2]["id"] == "t"
+    assert set(["elo", "LOS"]).issubset(replies[2])
+
+
+def test_large_batch():
+    n = 2000
+    update = {
+        "op": "update",
+        "updates": [{"id": "t%d" % i, "results": [1, 2, 3, 2, 1]} for i in range(n)],
+    }
+    line = json.dumps(update).encode()
+    assert len(line) > 2 ** 16
+    requests = [{"op": "create", "id": "t%d" % i} for i in range(n)]
+    replies = session(requests + [line])
+    assert "error" not in replies[-1]
+    assert len(replies[-1]["tests"]) == n
+    assert replies[-1]["tests"][-1]["results"] == [1, 2, 3, 2, 1]
+
+
+def test_overlong_line():
+    long_line = json.dumps({"op": "status", "id": 1000 * "x"}).encode()
+    replies = session(
+        [{"op": "create", "id": "t"}, long_line, {"op": "status", "id": "t"}],
+        limit=100,
+    )
+    assert "too long" in replies[1]["error"]
+    assert replies[2]["id"] == "t"
+
+
+def test_bool_results():
+    replies = session(
+        [
+            {"op": "create", "id": "t", "mode": "trinomial"},
+            {"op": "update", "id": "t", "results": [True, False, True]},
+        ]
+    )
+    assert "error" in replies[1]
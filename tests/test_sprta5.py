@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+import context
+import sprta5
+
+
+def make_sprt(**kwargs):
+    c = context.context(context.LTC_defaults.draw_elo(), context.LTC_defaults.biases())
+    return sprta5.SPRT(elo0=0, elo1=5, context=c, **kwargs)
+
+
+@pytest.mark.parametrize("mode", ["trinomial", "pentanomial"])
+def test_characteristics_curve(mode):
+    s = make_sprt(mode=mode)
+    elos = [-3.0, 0.0, 2.5, 5.0, 8.0]
+    pass_prob, expected = s.characteristics_curve(elos)
+    for elo, p, e in zip(elos, pass_prob, expected):
+        p_, e_ = s.characteristics(elo)
+        assert p == pytest.approx(p_, rel=1e-6, abs=1e-9)
+        assert e == pytest.approx(e_, rel=1e-6)
+
+
+def test_characteristics_curve_keeps_context():
+    s = make_sprt()
+    s.characteristics_curve([0.0, 1.0])
+    assert s.context.table() is None
+
+
+def test_characteristics_curve_workers():
+    s = make_sprt()
+    elos = np.linspace(-2, 7, 7)
+    serial = s.characteristics_curve(elos)
+    parallel = s.characteristics_curve(elos, workers=2)
+    assert np.array_equal(serial[0], parallel[0])
+    assert np.array_equal(serial[1], parallel[1])
+    with pytest.raises(ValueError):
+        s.characteristics_curve(elos, workers=0)
+
+
+def test_characteristics_discretized():
+    c = context.context(context.LTC_defaults.draw_elo(), context.LTC_defaults.biases())
+    s = sprta5.SPRT(elo0=-3, elo1=3, context=c)
+    power, expected = s.characteristics_discretized(1.0, points=500)
+    pmf = s.length_distribution(1.0, points=500)
+    assert pmf.sum() == pytest.approx(1, abs=1e-10)
+    assert expected == pytest.approx(2 * np.arange(len(pmf)) @ pmf)
+    power_, expected_ = s.characteristics(1.0)
+    assert power == pytest.approx(power_, abs=0.01)
+    assert expected == pytest.approx(expected_, rel=0.05)
+
+
+def test_characteristics_discretized_long():
+    # about 37000 game pairs on average, with a very long tail
+    c = context.context(context.LTC_defaults.draw_elo(), context.LTC_defaults.biases())
+    s = sprta5.SPRT(elo0=0, elo1=2, context=c)
+    power, expected = s.characteristics_discretized(1.0)
+    power_, expected_ = s.characteristics(1.0)
+    assert power == pytest.approx(power_, abs=0.01)
+    assert expected == pytest.approx(expected_, rel=0.05)
+    pmf = s.length_distribution(1.0, max_pairs=1000)
+    assert len(pmf) == 1001
+    assert pmf.sum() < 0.01
@@ -0,0 +1,68 @@
+import math
+
+import numpy as np
+import pytest
+
+import stats
+
+
+def accumulate(xs, ws=None):
+    s = stats.stats()
+    for i, x in enumerate(xs):
+        s.add(x, 1 if ws is None else ws[i])
+    return s
+
+
+def test_merge_equals_add():
+    rng = np.random.default_rng(1)
+    xs = rng.normal(10, 3, size=200)
+    ws = rng.exponential(size=200)
+    for weights in (None, ws):
+        s = accumulate(xs, weights)
+        parts = [stats.stats() for _ in range(3)]
+        for part, idx in zip(parts, np.array_split(np.arange(200), 3)):
+            part.add_many(xs[idx], None if weights is None else weights[idx])
+        m = stats.stats()
+        for part in parts:
+            m.merge(part)
+        assert m.n == s.n
+        assert m.get_state()[1:] == pytest.approx(s.get_state()[1:], rel=1e-10)
+        assert m.ci_mean() == pytest.approx(s.ci_mean(), rel=1e-10)
+
+
+def test_unweighted():
+    xs = [1.0, 2.0, 4.0, 7.0]
+    s = accumulate(xs)
+    assert s.mean == pytest.approx(np.mean(xs))
+    assert s.var() == pytest.approx(np.var(xs, ddof=1))
+    assert s.n_eff() == 4
+    l, m, u = s.ci_mean()
+    assert u - m == pytest.approx(1.96 * math.sqrt(np.var(xs, ddof=1) / 4))
+
+
+def test_state():
+    s = accumulate([1.0, 5.0, 2.0], [1.0, 0.5, 2.0])
+    t = stats.stats()
+    t.set_state(s.get_state())
+    assert t.get_state() == s.get_state()
+    assert t.ci_mean() == s.ci_mean()
+
+
+def test_merge_empty():
+    s = accumulate([1.0, 2.0])
+    state = s.get_state()
+    s.merge(stats.stats())
+    assert s.get_state() == state
+    t = stats.stats()
+    t.merge(s)
+    assert t.get_state() == state
+
+
+def test_degenerate_variance():
+    assert accumulate([3.0]).var() == float("inf")
+    assert accumulate([3.0], [2.5]).var() == float("inf")
+    s = stats.stats()
+    s.add_many([1.0, 2.0, 3.0], [1.0, 0.0, 0.0])
+    assert s.var() == float("inf")
+    assert stats.stats().var() == float("inf")
+    assert accumulate([3.0]).ci_mean() == (0, 0, 0)
@@ -0,0 +1,63 @@
+import random
+
+import pytest
+
+import stats_pentanomial
+
+
+def implied(table):
+    """
+The distribution sampled by alias_pick(): column i is chosen with
+probability 1/l and then i is kept with probability prob[i].
+"""
+    prob, alias = table
+    l = len(prob)
+    ret = l * [0.0]
+    for i in range(0, l):
+        ret[i] += prob[i] / l
+        ret[alias[i]] += (1 - prob[i]) / l
+    return ret
+
+
+@pytest.mark.parametrize(
+    "probs",
+    [
+        [0.25, 0.25, 0.25, 0.25],
+        [0.1, 0.2, 0.3, 0.4],
+        [0.0, 0.5, 0.0, 0.5],
+        [1.0, 0.0, 0.0],
+        [3, 1, 1, 2, 7, 0, 5, 4, 1],  # not normalized
+        [1e-12, 1 - 2e-12, 1e-12],
+    ],
+)
+def test_alias_table(probs):
+    table = stats_pentanomial.alias_table(probs)
+    prob, alias = table
+    assert all(0 <= p <= 1 for p in prob)
+    total = sum(probs)
+    for q, p in zip(implied(table), probs):
+        assert q == pytest.approx(p / total, abs=1e-15)
+
+
+def test_alias_pick():
+    # with equally spaced uniform numbers every outcome is drawn in
+    # exact proportion to its probability, up to 1/m
+    class rng:
+        def __init__(self, m):
+            self.m = m
+            self.k = 0
+
+        def random(self):
+            self.k += 1
+            return (self.k - 0.5) / self.m
+
+    probs = [0.1, 0.2, 0.3, 0.4]
+    table = stats_pentanomial.alias_table(probs)
+    m = 10000
+    r = rng(m)
+    counts = len(probs) * [0]
+    for _ in range(m):
+        counts[stats_pentanomial.alias_pick(table, rng=r)] += 1
+    for c, p in zip(counts, probs):
+        assert abs(c / m - p) <= len(probs) / m
+    assert stats_pentanomial.alias_pick(table, rng=random.Random(1)) in range(4)
@@ -0,0 +1,127 @@
+import collections, json, os, subprocess, sys
+
+import sweep
+
+root = os.path.join(os.path.dirname(__file__), "..")
+grid = ["--elo0", "0", "-1", "--elo1", "3", "5", "--alpha", "0.05", "0.1"]
+
+
+def run_sweep(path, elos, *extra):
+    args = [sys.executable, os.path.join(root, "sweep.py"), "--output", str(path)]
+    args += grid + ["--elo"] + [str(e) for e in elos] + list(extra)
+    p = subprocess.run(args, capture_output=True, text=True)
+    assert p.returncode == 0, p.stderr
+    return p.stdout
+
+
+def rows(path):
+    with open(path) as f:
+        return [json.loads(l) for l in f]
+
+
+def keys(rows):
+    return collections.Counter([(sweep.design_key(r), r["elo"]) for r in rows])
+
+
+def test_sweep(tmp_path):
+    path = tmp_path / "out.jsonl"
+    run_sweep(path, [0, 1, 2])
+    r = rows(path)
+    assert len(r) == 8 * 3
+    assert max(keys(r).values()) == 1
+    d = sweep.designs(dict([(k, [r[0][k]]) for k in sweep.design_params]))
+    assert sweep.evaluate(d[0], [0.0, 1.0, 2.0]) == r[:3]
+
+
+def test_more_elos(tmp_path):
+    path = tmp_path / "out.jsonl"
+    run_sweep(path, [0, 1, 2])
+    before = rows(path)
+    out = run_sweep(path, [0, 1, 2, 3])
+    assert "done         : 0" in out
+    after = rows(path)
+    # the old rows are kept and only the new elo is computed
+    assert after[: len(before)] == before
+    assert len(after) == 8 * 4
+    assert max(keys(after).values()) == 1
+    assert set([r["elo"] for r in after[len(before) :]]) == set([3.0])
+
+
+def test_resume(tmp_path):
+    path = tmp_path / "out.jsonl"
+    run_sweep(path, [0, 1, 2])
+    whole = rows(path)
+    with open(path, "rb") as f:
+        data = f.read()
+    # cut in the middle of the eleventh row
+    cut = sum([len(l) for l in data.splitlines(True)[:10]]) + 20
+    with open(path, "wb") as f:
+        f.write(data[:cut])
+    done = sweep.completed(str(path))
+    assert os.path.getsize(path) < cut
+    assert sum([len(v) for v in done.values()]) == 10
+    out = run_sweep(path, [0, 1, 2])
+    assert "done         : 3" in out
+    resumed = rows(path)
+    assert keys(resumed) == keys(whole)
+    assert sorted(map(json.dumps, resumed)) == sorted(map(json.dumps, whole))
+
+
+def test_completed_keeps_other_rows(tmp_path):
+    path = tmp_path / "out.jsonl"
+    run_sweep(path, [0, 1, 2])
+    size = os.path.getsize(path)
+    sweep.completed(str(path))
+    sweep.completed(str(path))
+    assert os.path.getsize(path) == size
+
+
+def test_workers():
+    designs = sweep.designs(
+        {
+            "draw_elo": [327.0],
+            "biases": [[-90.0, 200.0]],
+            "elo0": [0.0, -1.0],
+            "elo1": [3.0, 5.0],
+            "alpha": [0.05],
+            "beta": [0.05, 0.1],
+            "mode": ["pentanomial", "trinomial"],
+            "elo_model": ["logistic"],
+        }
+    )
+    done = {sweep.design_key(designs[0]): set([0.0])}
+    serial = list(sweep.sweep(designs, [0.0, 2.0], chunk_size=3, done=done))
+    parallel = list(
+        sweep.sweep(designs, [0.0, 2.0], workers=2, chunk_size=3, done=done)
+    )
+    assert serial == parallel
+    assert len(serial) == len(designs)
+    assert [r["elo"] for r in serial[0]] == [2.0]
+
+
+def test_design_key():
+    d = {
+        "draw_elo": 327,
+        "biases": [-90, 200],
+        "elo0": 0,
+        "elo1": 5,
+        "alpha": 0.05,
+        "beta": 0.05,
+        "mode": "pentanomial",
+        "elo_model": "logistic",
+    }
+    d_ = dict(d, draw_elo=327.0, biases=(-90.0, 200.0), elo0=0.0, elo1=5.0)
+    assert sweep.design_key(d) == sweep.design_key(d_)
+    assert sweep.design_key(d) != sweep.design_key(dict(d, elo0=1))
+
+
+def test_grid_file(tmp_path):
+    # integers from a grid file match the floats from the command line
+    path = tmp_path / "out.jsonl"
+    run_sweep(path, [0, 1])
+    grid_path = tmp_path / "grid.json"
+    with open(grid_path, "w") as f:
+        json.dump({"elo0": [0, -1], "elo1": [3, 5], "biases": [[-90, 200]]}, f)
+    out = run_sweep(path, [0, 1], "--grid", str(grid_path))
+    assert "done         : 8" in out
+    assert len(rows(path)) == 8 * 2